@@ -21,11 +21,14 @@ login_manager.login_message_category = 'info'
 
 # 初始化缓存
 def configure_cache(app):
-    cache = Cache(app, config={
-        'CACHE_TYPE': app.config.get('CACHE_TYPE', 'simple'),  # 使用simple缓存类型，生产环境可改为redis或memcached
-        'CACHE_DEFAULT_TIMEOUT': app.config.get('CACHE_DEFAULT_TIMEOUT', 300),  # 默认缓存5分钟
-        'CACHE_THRESHOLD': 500,  # 缓存阈值
-    })
+    # 后端及其参数全部来自配置中的 CACHE_* 项，生产环境使用多进程共享的后端
+    cache_config = {key: value for key, value in app.config.items() if key.startswith('CACHE_')}
+    cache_config.setdefault('CACHE_TYPE', 'SimpleCache')
+    cache_config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)  # 默认缓存5分钟
+    cache_config.setdefault('CACHE_THRESHOLD', 500)  # 缓存阈值
+    if cache_config['CACHE_TYPE'] in ('filesystem', 'FileSystemCache') and cache_config.get('CACHE_DIR'):
+        os.makedirs(cache_config['CACHE_DIR'], exist_ok=True)
+    cache = Cache(app, config=cache_config)
     return cache
 
 def create_app(config_name='default'):
@@ -77,6 +80,10 @@ def create_app(config_name='default'):
     cache = configure_cache(app)
     app.cache = cache
     
+    # 按端点策略缓存响应（策略见 RESPONSE_CACHE_POLICIES）
+    from app.caching import response_cache
+    response_cache.init_app(app)
+    
     # 配置日志记录
     import logging
     from logging.handlers import RotatingFileHandler
@@ -120,6 +127,8 @@ def create_app(config_name='default'):
         from app.culture import models as culture_models
         from app.community import models as community_models
         from app.vr import models as vr_models
+        from app.dashboard import models as dashboard_models
+        from app.storage import models as storage_models
     from app.home import bp as home_bp
     app.register_blueprint(home_bp)
     
@@ -142,6 +151,47 @@ def create_app(config_name='default'):
     from app.ai import bp as ai_bp
     app.register_blueprint(ai_bp, url_prefix='/api/ai')
     
+    # 初始化舞蹈评分任务队列（工作线程在首次提交任务时启动）
+    from app.community.scoring import scoring_queue
+    scoring_queue.init_app(app)
+    
+    # 初始化舞蹈比赛排行榜（提交后清除榜单缓存，注册 flask leaderboard 命令）
+    from app.community.leaderboard import dance_leaderboard
+    dance_leaderboard.init_app(app)
+    
+    # 初始化文化数据同步引擎
+    from app.culture.sync import culture_sync_engine
+    culture_sync_engine.init_app(app)
+    
+    # 初始化图案近似最近邻索引（首次识别时加载或在后台构建）
+    from app.culture.pattern_ann import pattern_ann_index
+    pattern_ann_index.init_app(app)
+    
+    # 初始化互动事件记录器（后台线程在首次记录事件时启动）
+    from app.community.analytics import analytics_recorder
+    analytics_recorder.init_app(app)
+    
+    # 初始化计数器缓冲（点赞数、浏览数、分享数延迟合并写入）
+    from app.community.counters import counter_buffer
+    counter_buffer.init_app(app)
+    
+    # 初始化内容寻址上传存储（注册 flask blobs 命令）
+    from app.storage import blob_store
+    blob_store.init_app(app)
+    
+    # 初始化分片上传和上传后处理队列
+    from app.community.uploads import upload_manager, upload_processor
+    upload_manager.init_app(app)
+    upload_processor.init_app(app)
+    
+    # 初始化舞蹈视频媒体处理（缩略图、封面、预览）
+    from app.community.media import media_pipeline
+    media_pipeline.init_app(app)
+    
+    # 初始化看板统计汇总（注册提交钩子）
+    from app.dashboard.rollup import stats_rollup
+    stats_rollup.init_app(app)
+    
     return app
 
 # 创建默认的应用实例，用于Gunicorn等WSGI服务器的部署
@@ -0,0 +1,390 @@
+import os
+import time
+import uuid
+import pickle
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional, List, Iterable, Set
+from flask import request, g, jsonify, make_response
+from flask_caching.backends.base import BaseCache
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('ResponseCache')
+
+class SQLiteCache(BaseCache):
+    """
+    本机多进程共享的缓存后端，作为Redis的本地替代：数据保存在一个SQLite文件中（WAL模式），
+    同一主机上的多个Waitress进程读写同一份缓存，inc/add 在事务中执行，保证原子性
+
+    配置：CACHE_TYPE = 'app.caching.SQLiteCache'，CACHE_SQLITE_PATH 为数据库文件路径
+    """
+
+    # 每写入多少次检查一次容量
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path: str, threshold: int = 500, default_timeout: int = 300):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        path = config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'cache.sqlite')
+        kwargs.update(threshold=config.get('CACHE_THRESHOLD', 500))
+        return cls(path, *args, **kwargs)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _expires(self, timeout: Optional[int]) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout else 0
+
+    def _prune(self, conn: sqlite3.Connection):
+        """先删除过期项，仍超过阈值时删除最早过期的项"""
+        now = time.time()
+        conn.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (now,))
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self.threshold:
+            conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires = 0, expires LIMIT ?)',
+                         (count - self.threshold,))
+
+    def get(self, key: str) -> Any:
+        row = self._connect().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def has(self, key: str) -> bool:
+        return self._connect().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)', (key, time.time())
+        ).fetchone() is not None
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                     (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout)))
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            self._prune(conn)
+        return True
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM cache WHERE key = ? AND expires != 0 AND expires <= ?', (key, time.time()))
+            added = conn.execute('INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                 (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout))).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return added == 1
+
+    def inc(self, key: str, delta: int = 1) -> Optional[int]:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value, expires FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+                               (key, time.time())).fetchone()
+            value = (pickle.loads(row[0]) if row else 0) + delta
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                         (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), row[1] if row else 0))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def dec(self, key: str, delta: int = 1) -> Optional[int]:
+        return self.inc(key, -delta)
+
+    def delete(self, key: str) -> bool:
+        return self._connect().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def clear(self) -> bool:
+        self._connect().execute('DELETE FROM cache')
+        return True
+
+# 行级标签过多时只保留表级标签
+MAX_ROW_TAGS = 100
+
+def model_tag(model) -> str:
+    """模型类、表或实例对应的表级缓存标签（表名）"""
+    table = getattr(model, '__table__', model)
+    return table.name
+
+def row_tag(model, pk: Any) -> str:
+    """单行的缓存标签，如 post:12"""
+    return f'{model_tag(model)}:{pk}'
+
+class CacheInvalidator:
+    """
+    基于提交事件的缓存失效：在 after_flush 中收集变更的表和主键对应的标签，
+    在 after_commit 后为这些标签生成新的世代号。世代号保存在共享缓存中，
+    缓存键包含所依赖标签的世代号，标签一旦变化，所有进程中依赖它的缓存项都不会再被命中，
+    旧缓存项随TTL过期或被淘汰，因此可以使用较长的TTL
+    """
+
+    def __init__(self):
+        self.logger = logger
+        self.app = None
+        self._installed = False
+
+    def init_app(self, app):
+        """绑定应用并注册SQLAlchemy会话事件（对所有会话生效，包括后台线程）"""
+        self.app = app
+        if self._installed:
+            return
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'do_orm_execute', self._do_orm_execute)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        self._installed = True
+
+    @staticmethod
+    def _pending(session: Session) -> Set[str]:
+        return session.info.setdefault('cache_tags', set())
+
+    def mark_changed(self, session: Session, *models, pks: Optional[Iterable[Any]] = None):
+        """
+        手动登记变更，用于不触发flush事件的批量写入（bulk_insert_mappings 等）
+
+        Args:
+            session: 数据库会话
+            models: 变更的模型类
+            pks: 变更的主键，只有一个模型时有效
+        """
+        tags = self._pending(session)
+        for model in models:
+            tags.add(model_tag(model))
+        if pks is not None and len(models) == 1:
+            tags.update(row_tag(models[0], pk) for pk in pks)
+
+    def _after_flush(self, session: Session, flush_context):
+        tags = self._pending(session)
+        dirty = [instance for instance in session.dirty if session.is_modified(instance)]
+        for instance in list(session.new) + dirty + list(session.deleted):
+            mapper = sa_inspect(instance).mapper
+            tags.add(model_tag(mapper.local_table))
+            # 新增对象此时已有主键值，但尚未登记 identity
+            pk = mapper.primary_key_from_instance(instance)
+            if len(pk) == 1 and pk[0] is not None:
+                tags.add(row_tag(mapper.local_table, pk[0]))
+
+    def _do_orm_execute(self, orm_execute_state):
+        """session.execute 执行的 INSERT/UPDATE/DELETE 语句只能得到表级标签"""
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if table is not None:
+                self._pending(orm_execute_state.session).add(model_tag(table))
+
+    def _after_rollback(self, session: Session):
+        session.info.pop('cache_tags', None)
+
+    def _after_commit(self, session: Session):
+        tags = session.info.pop('cache_tags', None)
+        if tags:
+            self.invalidate(tags)
+
+    def _cache(self):
+        return getattr(self.app, 'cache', None) if self.app is not None else None
+
+    def invalidate(self, tags: Iterable[str]):
+        """为标签生成新的世代号，依赖这些标签的缓存项随即失效"""
+        cache = self._cache()
+        if cache is None:
+            return
+        tags = set(tags)
+        row_tags = {tag for tag in tags if ':' in tag}
+        if len(row_tags) > MAX_ROW_TAGS:
+            # 大批量变更时表级标签已足够让列表失效，行级标签只影响详情页，按表失效代替
+            tags -= row_tags
+            tags.update(tag.split(':', 1)[0] + ':*' for tag in row_tags)
+        try:
+            cache.set_many({f'cache_gen:{tag}': uuid.uuid4().hex[:12] for tag in tags}, timeout=0)
+        except Exception as e:
+            self.logger.warning(f"更新缓存世代号失败: {str(e)}")
+
+    def generations(self, tags: List[str]) -> List[str]:
+        """
+        读取标签当前的世代号，行级标签同时依赖同表的批量失效标记（表名:*）
+
+        世代号不存在（从未变更或被淘汰）时写入新的随机值，保证不会与之前的世代号重复
+        """
+        cache = self._cache()
+        if cache is None or not tags:
+            return []
+        keys = []
+        for tag in tags:
+            keys.append(f'cache_gen:{tag}')
+            if ':' in tag:
+                keys.append(f'cache_gen:{tag.split(":", 1)[0]}:*')
+        values = cache.get_many(*keys)
+        for index, (key, value) in enumerate(zip(keys, values)):
+            if value is None:
+                cache.add(key, uuid.uuid4().hex[:12], timeout=0)
+                values[index] = cache.get(key)
+        return [str(value) for value in values]
+
+class CachePolicy:
+    """单个端点的缓存策略"""
+
+    def __init__(self, ttl: int = 300, vary_args: Any = True, vary_user: bool = False,
+                 max_size: Optional[int] = 1024 * 1024, tags: Optional[List[str]] = None):
+        """
+        Args:
+            ttl: 缓存有效期（秒）
+            vary_args: True 时按全部查询参数区分缓存，列表时只按其中的参数区分，False 时忽略查询参数
+            vary_user: 是否按登录用户区分缓存（页面包含用户信息时开启）
+            max_size: 响应体超过该字节数时不缓存，None 为不限制
+            tags: 响应依赖的缓存标签（表名，或含路由参数的行标签如 post:{id}），相关数据提交后缓存失效
+        """
+        self.ttl = ttl
+        self.vary_args = vary_args
+        self.vary_user = vary_user
+        self.max_size = max_size
+        self.tags = tags or []
+
+    def resolve_tags(self) -> List[str]:
+        """用路由参数填充行标签"""
+        return [tag.format(**(request.view_args or {})) for tag in self.tags]
+
+    def key(self, endpoint: str, generations: Optional[List[str]] = None) -> str:
+        """由端点、查询参数、用户和依赖标签的世代号计算缓存键"""
+        if self.vary_args is True:
+            args = sorted(request.args.items(multi=True))
+        elif self.vary_args:
+            args = [(name, value) for name in sorted(self.vary_args) for value in request.args.getlist(name)]
+        else:
+            args = []
+        parts = [endpoint, repr(args), ','.join(generations or [])]
+        if self.vary_user:
+            from flask_login import current_user
+            parts.append(str(current_user.get_id()) if current_user.is_authenticated else '')
+        return 'response:' + hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    按端点声明缓存策略的响应缓存：配置 RESPONSE_CACHE_POLICIES（端点 -> 策略参数）即可生效，无需修改视图；
+    只缓存 GET/HEAD 的200非流式响应，缓存数据存放在 app.cache 配置的后端中，可在多进程间共享
+    """
+
+    def __init__(self):
+        self.logger = logger
+        self.app = None
+        self.policies: Dict[str, CachePolicy] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def init_app(self, app):
+        """读取策略配置，注册请求钩子和统计接口"""
+        self.app = app
+        cache_invalidator.init_app(app)
+        self.policies = {endpoint: CachePolicy(**options)
+                         for endpoint, options in app.config.get('RESPONSE_CACHE_POLICIES', {}).items()}
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/api/cache/stats', 'cache_stats', self._stats_view, methods=['GET'])
+
+    def _count(self, endpoint: str, name: str):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {'hits': 0, 'misses': 0, 'stores': 0, 'skipped': 0})
+            stats[name] += 1
+
+    def _before_request(self):
+        policy = self.policies.get(request.endpoint)
+        if policy is None or request.method not in ('GET', 'HEAD'):
+            return None
+        try:
+            key = policy.key(request.endpoint, cache_invalidator.generations(policy.resolve_tags()))
+            cached = self.app.cache.get(key)
+        except Exception as e:
+            # 缓存后端故障时直接访问数据库
+            self.logger.warning(f"读取响应缓存失败: {str(e)}")
+            return None
+        if cached is None:
+            g.response_cache_key = key
+            self._count(request.endpoint, 'misses')
+            return None
+
+        self._count(request.endpoint, 'hits')
+        body, mimetype, stored_at = cached
+        response = make_response(body)
+        response.mimetype = mimetype
+        response.headers['X-Cache'] = 'HIT'
+        response.headers['Age'] = str(max(int(time.time() - stored_at), 0))
+        return response
+
+    def _after_request(self, response):
+        key = g.pop('response_cache_key', None)
+        if key is None:
+            return response
+        endpoint = request.endpoint
+        response.headers['X-Cache'] = 'MISS'
+        policy = self.policies[endpoint]
+        if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+            self._count(endpoint, 'skipped')
+            return response
+        body = response.get_data()
+        if policy.max_size is not None and len(body) > policy.max_size:
+            self._count(endpoint, 'skipped')
+            return response
+        try:
+            self.app.cache.set(key, (body, response.mimetype, time.time()), timeout=policy.ttl)
+            self._count(endpoint, 'stores')
+        except Exception as e:
+            self.logger.warning(f"写入响应缓存失败: {str(e)}")
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """本进程的缓存命中统计"""
+        with self._lock:
+            endpoints = {endpoint: dict(counts) for endpoint, counts in self._stats.items()}
+        hits = sum(counts['hits'] for counts in endpoints.values())
+        misses = sum(counts['misses'] for counts in endpoints.values())
+        for counts in endpoints.values():
+            lookups = counts['hits'] + counts['misses']
+            counts['hit_rate'] = round(counts['hits'] / lookups, 4) if lookups else 0.0
+        return {
+            'backend': type(self.app.cache.cache).__name__,
+            'pid': os.getpid(),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            'endpoints': endpoints,
+            'policies': {endpoint: vars(policy) for endpoint, policy in self.policies.items()}
+        }
+
+    def _stats_view(self):
+        return jsonify({
+            'success': True,
+            'data': self.stats()
+        })
+
+# 进程内共享的缓存失效器和响应缓存
+cache_invalidator = CacheInvalidator()
+response_cache = ResponseCache()
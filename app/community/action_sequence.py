@@ -0,0 +1,117 @@
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+# 动作序列帧率（每帧0.08秒）
+FPS = 12.5
+FRAME_INTERVAL = 1 / FPS
+# 每个动作持续的帧数
+FRAMES_PER_ACTION = 3
+# 单个序列的最长时长（秒），超出的请求按上限生成
+MAX_DURATION = 600
+
+# 动作类型权重，顺序即动作编码
+ACTION_WEIGHTS = {
+    'step': 0.3,
+    'wave': 0.2,
+    'dance': 0.2,
+    'spin': 0.1,
+    'pose': 0.08,
+    'jump': 0.06,
+    'kick': 0.03,
+    'twist': 0.02
+}
+ACTION_CODES = list(ACTION_WEIGHTS)
+_CUMULATIVE_WEIGHTS = np.cumsum(list(ACTION_WEIGHTS.values()))
+
+# 难度映射
+DIFFICULTY_MAP = {
+    '初级': 'easy',
+    '中级': 'medium',
+    '高级': 'hard',
+    'easy': 'easy',
+    'medium': 'medium',
+    'hard': 'hard'
+}
+
+DIFFICULTY_FACTOR = {
+    'easy': 0.7,
+    'medium': 1.0,
+    'hard': 1.3
+}
+
+def normalize_difficulty(difficulty: Optional[str]) -> str:
+    """将中英文难度统一为 easy/medium/hard，默认medium"""
+    return DIFFICULTY_MAP.get(difficulty, 'medium')
+
+def generate_action_arrays(duration: float, seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    批量生成动作序列，返回列式数组
+
+    动作按累计权重用 searchsorted 一次性抽样，位置和旋转整列计算，
+    同一种子总是生成相同的序列
+
+    Args:
+        duration: 时长（秒）
+        seed: 随机种子
+
+    Returns:
+        包含 frame、action（动作编码）、x、y、rotation_y、timestamp 的数组字典
+    """
+    rng = np.random.default_rng(seed)
+    frame_count = max(int(duration * FPS), 0)
+    action_count = -(-frame_count // FRAMES_PER_ACTION)
+
+    # 按累计权重抽样动作，每个动作持续固定帧数
+    draws = rng.uniform(0, _CUMULATIVE_WEIGHTS[-1], action_count)
+    codes = np.searchsorted(_CUMULATIVE_WEIGHTS, draws, side='left')
+    codes = np.minimum(codes, len(ACTION_CODES) - 1)
+    action = np.repeat(codes, FRAMES_PER_ACTION)[:frame_count].astype(np.int8)
+
+    frame = np.arange(frame_count)
+    return {
+        'frame': frame,
+        'action': action,
+        'x': np.round(np.sin(frame * 0.1) * 20, 2),
+        'y': np.round(np.cos(frame * 0.1) * 10, 2),
+        'rotation_y': np.round(rng.uniform(-15, 15, frame_count), 2),
+        'timestamp': frame * FRAME_INTERVAL
+    }
+
+def to_columnar(arrays: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    转换为紧凑的列式格式：每个字段一个数组，动作以编码表示
+
+    z、rotation.x、rotation.z 恒为0，不单独输出
+    """
+    return {
+        'format': 'columnar',
+        'fps': FPS,
+        'frame_count': int(arrays['frame'].size),
+        'action_codes': ACTION_CODES,
+        'action': arrays['action'].tolist(),
+        'x': arrays['x'].tolist(),
+        'y': arrays['y'].tolist(),
+        'rotation_y': arrays['rotation_y'].tolist()
+    }
+
+def to_frames(arrays: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """转换为逐帧字典格式，兼容原有的 action_sequence 结构"""
+    actions = [ACTION_CODES[code] for code in arrays['action'].tolist()]
+    return [{
+        "frame": frame,
+        "action": action,
+        "position": {
+            "x": x,
+            "y": y,
+            "z": 0
+        },
+        "rotation": {
+            "x": 0,
+            "y": rotation_y,
+            "z": 0
+        },
+        "timestamp": timestamp
+    } for frame, action, x, y, rotation_y, timestamp in zip(
+        arrays['frame'].tolist(), actions, arrays['x'].tolist(), arrays['y'].tolist(),
+        arrays['rotation_y'].tolist(), arrays['timestamp'].tolist()
+    )]
@@ -0,0 +1,299 @@
+import atexit
+import logging
+import threading
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.community.models import AnalyticsEvent, AnalyticsRollup
+from app.dashboard.rollup import bucket_start, bucket_step, increment_rows
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('Analytics')
+
+# 事件类型和对象类型
+EVENT_TYPES = ('share', 'like', 'unlike', 'view')
+ENTITY_TYPES = ('submission', 'post', 'story')
+
+# 分享平台，其他客户端传入的值统一记为 other
+PLATFORMS = ('wechat', 'weibo', 'qq', 'copy')
+OTHER_PLATFORM = 'other'
+
+# 汇总粒度
+GRANULARITIES = ('minute', 'hour', 'day')
+
+# 全站汇总行的对象类型，按平台统计时使用
+ALL_ENTITIES = 'all'
+
+# 单次查询时间序列的最大桶数
+MAX_SERIES_BUCKETS = 24 * 90
+
+ROLLUP_KEYS = ['granularity', 'entity_type', 'entity_id', 'event_type', 'platform', 'bucket_start']
+
+class AnalyticsRecorder:
+    """
+    互动事件记录：请求线程只把事件追加到内存缓冲区，后台线程定期批量写入 analytics_event，
+    并在同一事务中累加分钟、小时、天三级汇总；每个进程各自缓冲，汇总由数据库累加合并
+    """
+
+    def __init__(self, flush_interval: float = 5.0, batch_size: int = 1000, max_buffer: int = 100000):
+        """
+        初始化事件记录器，后台线程在首次记录事件时启动
+
+        Args:
+            flush_interval: 批量写入间隔（秒）
+            batch_size: 缓冲区达到该数量时立即写入
+            max_buffer: 缓冲区上限，数据库长时间不可用时丢弃最早的事件
+        """
+        self.logger = logger
+        self.app = None
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.event_retention_days = 90
+        self.minute_retention_days = 7
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pruned_at = None
+        self.dropped = 0
+
+    def init_app(self, app):
+        """读取配置并绑定应用，进程退出时写入缓冲区中剩余的事件"""
+        self.app = app
+        self.flush_interval = app.config.get('ANALYTICS_FLUSH_INTERVAL', self.flush_interval)
+        self.batch_size = app.config.get('ANALYTICS_BATCH_SIZE', self.batch_size)
+        self.max_buffer = app.config.get('ANALYTICS_MAX_BUFFER', self.max_buffer)
+        self.event_retention_days = app.config.get('ANALYTICS_EVENT_RETENTION_DAYS', self.event_retention_days)
+        self.minute_retention_days = app.config.get('ANALYTICS_MINUTE_RETENTION_DAYS', self.minute_retention_days)
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='analytics-flush', daemon=True)
+                self._thread.start()
+
+    def record(self, event_type: str, entity_type: str, entity_id: int, platform: Optional[str] = None,
+               user_id: Optional[int] = None, ip_address: Optional[str] = None):
+        """
+        记录一个事件，只写入内存缓冲区
+
+        Args:
+            event_type: share、like、unlike、view
+            entity_type: submission、post、story
+            entity_id: 对象ID
+            platform: 分享平台，不在 PLATFORMS 中的值记为 other
+            user_id: 用户ID
+            ip_address: 客户端IP
+        """
+        if platform is not None and platform not in PLATFORMS:
+            platform = OTHER_PLATFORM
+        occurred_at = datetime.now()
+        event = {
+            'event_type': event_type,
+            'entity_type': entity_type,
+            'entity_id': entity_id,
+            'platform': platform,
+            'user_id': user_id,
+            'ip_address': ip_address,
+            'occurred_at': occurred_at,
+            'day': occurred_at.date()
+        }
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append(event)
+            size = len(self._buffer)
+        self._ensure_started()
+        if size >= self.batch_size:
+            self._wake.set()
+
+    def pending(self) -> int:
+        """缓冲区中尚未写入的事件数量"""
+        with self._lock:
+            return len(self._buffer)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    try:
+                        self.flush()
+                        self._prune_if_due()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.logger.error(f"事件写入线程异常: {str(e)}")
+
+    @staticmethod
+    def _rollup_rows(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """先在内存中按时间桶聚合，每个汇总键只累加一次"""
+        counts = Counter()
+        for event in events:
+            platform = event['platform'] or ''
+            for granularity in GRANULARITIES:
+                start = bucket_start(event['occurred_at'], granularity)
+                counts[(granularity, event['entity_type'], event['entity_id'], event['event_type'], platform, start)] += 1
+                counts[(granularity, ALL_ENTITIES, 0, event['event_type'], platform, start)] += 1
+        return [dict(zip(ROLLUP_KEYS, key), count=count) for key, count in counts.items()]
+
+    def _write(self, events: List[Dict[str, Any]]):
+        """在一个事务中写入事件流水并累加汇总"""
+        with db.engine.begin() as conn:
+            conn.execute(AnalyticsEvent.__table__.insert(), events)
+            increment_rows(conn, AnalyticsRollup.__table__, self._rollup_rows(events), ROLLUP_KEYS, 'count')
+
+    def _requeue(self, events: List[Dict[str, Any]]):
+        """把写入失败的事件放回缓冲区头部，超出上限的部分丢弃"""
+        with self._lock:
+            room = max(self.max_buffer - len(self._buffer), 0)
+            self.dropped += max(len(events) - room, 0)
+            self._buffer.extendleft(reversed(events[-room:] if room else []))
+
+    def flush(self) -> int:
+        """
+        把缓冲区中的事件批量写入数据库
+
+        数据库不可用时整批放回缓冲区等待下次写入；其他错误（如个别事件的数据无效）时逐条写入，
+        丢弃无法写入的事件，避免一个无效事件使整批反复重试
+
+        Returns:
+            写入的事件数量
+        """
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._buffer)
+                self._buffer.clear()
+            if not events:
+                return 0
+            try:
+                self._write(events)
+                return len(events)
+            except OperationalError as e:
+                self.logger.error(f"写入互动事件失败，{len(events)} 条事件将重试: {str(e)}")
+                self._requeue(events)
+                return 0
+            except Exception as e:
+                self.logger.error(f"批量写入互动事件失败，改为逐条写入: {str(e)}")
+            written = 0
+            for position, event in enumerate(events):
+                try:
+                    self._write([event])
+                    written += 1
+                except OperationalError as e:
+                    self.logger.error(f"写入互动事件失败，{len(events) - position} 条事件将重试: {str(e)}")
+                    self._requeue(events[position:])
+                    break
+                except Exception as e:
+                    with self._lock:
+                        self.dropped += 1
+                    self.logger.error(f"丢弃无法写入的互动事件 {event['event_type']} "
+                                      f"{event['entity_type']}:{event['entity_id']}: {str(e)}")
+            return written
+
+    def _prune_if_due(self):
+        """每小时清理一次过期的事件分区和分钟汇总"""
+        now = datetime.now()
+        if self._pruned_at is not None and now - self._pruned_at < timedelta(hours=1):
+            return
+        self._pruned_at = now
+        with db.engine.begin() as conn:
+            conn.execute(AnalyticsEvent.__table__.delete().where(
+                AnalyticsEvent.__table__.c.day < (now - timedelta(days=self.event_retention_days)).date()))
+            conn.execute(AnalyticsRollup.__table__.delete().where(
+                AnalyticsRollup.__table__.c.granularity == 'minute',
+                AnalyticsRollup.__table__.c.bucket_start < now - timedelta(days=self.minute_retention_days)))
+
+    def shutdown(self):
+        """停止后台线程并写入剩余事件"""
+        self._stopped.set()
+        self._wake.set()
+        if self.app is None or not self.pending():
+            return
+        with self.app.app_context():
+            try:
+                self.flush()
+            finally:
+                db.session.remove()
+
+    # 查询
+
+    def series(self, entity_type: str, entity_id: int, event_type: str, granularity: str = 'hour',
+               periods: int = 24, platform: Optional[str] = None,
+               end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        查询对象某种事件的时间序列，缺失的时间桶补0
+
+        Args:
+            entity_type: submission、post、story，或 all 表示全站
+            entity_id: 对象ID，全站时为0
+            event_type: 事件类型
+            granularity: minute、hour、day
+            periods: 时间桶数量
+            platform: 只统计该平台，默认全部平台合计
+
+        Raises:
+            ValueError: 参数无效
+        """
+        if entity_type not in ENTITY_TYPES + (ALL_ENTITIES,):
+            raise ValueError(f"未知的对象类型: {entity_type}")
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"未知的事件类型: {event_type}")
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"未知的时间粒度: {granularity}")
+        periods = min(max(periods, 1), MAX_SERIES_BUCKETS)
+        step = bucket_step(granularity)
+        last = bucket_start(end or datetime.now(), granularity)
+        first = last - step * (periods - 1)
+
+        query = db.session.query(AnalyticsRollup.bucket_start, func.sum(AnalyticsRollup.count)).filter(
+            AnalyticsRollup.granularity == granularity,
+            AnalyticsRollup.entity_type == entity_type,
+            AnalyticsRollup.entity_id == entity_id,
+            AnalyticsRollup.event_type == event_type,
+            AnalyticsRollup.bucket_start.between(first, last))
+        if platform is not None:
+            query = query.filter(AnalyticsRollup.platform == platform)
+        values = dict(query.group_by(AnalyticsRollup.bucket_start))
+        return [{'bucket': (first + step * i).isoformat(), 'value': int(values.get(first + step * i, 0))}
+                for i in range(periods)]
+
+    def totals(self, entity_type: str, entity_id: int, days: int = 30) -> Dict[str, Any]:
+        """
+        按事件类型和平台汇总最近若干天的次数（按天汇总求和）
+
+        Returns:
+            {"events": {事件类型: 次数}, "platforms": {平台: 分享次数}}
+        """
+        since = bucket_start(datetime.now() - timedelta(days=days - 1), 'day')
+        rows = db.session.query(AnalyticsRollup.event_type, AnalyticsRollup.platform,
+                                func.sum(AnalyticsRollup.count)).filter(
+            AnalyticsRollup.granularity == 'day',
+            AnalyticsRollup.entity_type == entity_type,
+            AnalyticsRollup.entity_id == entity_id,
+            AnalyticsRollup.bucket_start >= since
+        ).group_by(AnalyticsRollup.event_type, AnalyticsRollup.platform)
+        events, platforms = Counter(), Counter()
+        for event_type, platform, count in rows:
+            events[event_type] += int(count)
+            if event_type == 'share' and platform:
+                platforms[platform] += int(count)
+        return {'events': dict(events), 'platforms': dict(platforms), 'days': days}
+
+# 进程内共享的事件记录器
+analytics_recorder = AnalyticsRecorder()
@@ -0,0 +1,150 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Any, Iterable, Tuple
+from sqlalchemy import update, bindparam, func
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('Counters')
+
+class CounterBuffer:
+    """
+    计数器延迟写入：点赞数、浏览数、分享数的增量先在内存中按（模型、字段、主键）累加，
+    后台线程定期对每行执行一次 UPDATE x = x + :delta，避免热点行的读-改-写和锁等待；
+    读取时合并尚未写入的增量，进程退出时写入剩余增量
+    """
+
+    def __init__(self, flush_interval: float = 2.0):
+        """
+        初始化计数器缓冲，后台线程在首次累加时启动
+
+        Args:
+            flush_interval: 写入间隔（秒）
+        """
+        self.logger = logger
+        self.app = None
+        self.flush_interval = flush_interval
+        self._deltas: Dict[Tuple[Any, str, int], int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """读取配置并绑定应用，进程退出时写入剩余增量"""
+        self.app = app
+        self.flush_interval = app.config.get('COUNTER_FLUSH_INTERVAL', self.flush_interval)
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='counter-flush', daemon=True)
+                self._thread.start()
+
+    def incr(self, model, pk: int, field: str, delta: int = 1):
+        """
+        累加计数
+
+        Args:
+            model: 模型类，如 Post
+            pk: 主键
+            field: 计数字段，如 views
+            delta: 增量，可为负数
+        """
+        with self._lock:
+            self._deltas[(model, field, pk)] += delta
+        self._ensure_started()
+
+    def pending(self, model, pk: int, field: str) -> int:
+        """尚未写入数据库的增量"""
+        with self._lock:
+            return self._deltas.get((model, field, pk), 0)
+
+    def value(self, instance, field: str) -> int:
+        """数据库中的值加上尚未写入的增量"""
+        return max((getattr(instance, field) or 0) + self.pending(type(instance), instance.id, field), 0)
+
+    def merge(self, instances: Iterable[Any], *fields: str):
+        """
+        把尚未写入的增量合并到已加载的对象上，用于页面展示
+
+        以“已提交值”的方式设置，不会把对象标记为已修改，也不会在之后的提交中写回
+        """
+        with self._lock:
+            for instance in instances:
+                for field in fields:
+                    delta = self._deltas.get((type(instance), field, instance.id))
+                    if delta:
+                        set_committed_value(instance, field, max((getattr(instance, field) or 0) + delta, 0))
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                with self.app.app_context():
+                    try:
+                        self.flush()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.logger.error(f"计数器写入线程异常: {str(e)}")
+
+    def flush(self) -> int:
+        """
+        在一个事务中写入全部增量，每个（模型、字段）一条批量执行的 UPDATE，失败时增量放回缓冲区
+
+        Returns:
+            更新的行数
+        """
+        with self._flush_lock:
+            with self._lock:
+                deltas = {key: delta for key, delta in self._deltas.items() if delta}
+                self._deltas.clear()
+            if not deltas:
+                return 0
+
+            groups: Dict[Tuple[Any, str], List[Dict[str, int]]] = defaultdict(list)
+            for (model, field, pk), delta in deltas.items():
+                groups[(model, field)].append({'row_id': pk, 'delta': delta})
+            try:
+                with db.engine.begin() as conn:
+                    for (model, field), rows in groups.items():
+                        table = model.__table__
+                        conn.execute(
+                            update(table)
+                            .where(table.c.id == bindparam('row_id'))
+                            .values({field: func.coalesce(table.c[field], 0) + bindparam('delta')}),
+                            rows)
+                return len(deltas)
+            except Exception as e:
+                self.logger.error(f"写入计数器失败，{len(deltas)} 个增量将重试: {str(e)}")
+                with self._lock:
+                    for key, delta in deltas.items():
+                        self._deltas[key] += delta
+                return 0
+
+    def shutdown(self):
+        """停止后台线程并写入剩余增量"""
+        self._stopped.set()
+        if self.app is None:
+            return
+        with self._lock:
+            if not self._deltas:
+                return
+        with self.app.app_context():
+            try:
+                self.flush()
+            finally:
+                db.session.remove()
+
+# 进程内共享的计数器缓冲
+counter_buffer = CounterBuffer()
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, TextAreaField, SelectField, BooleanField, FileField, SubmitField
+from wtforms import StringField, PasswordField, TextAreaField, SelectField, BooleanField, FileField, HiddenField, SubmitField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional
 from datetime import datetime
 
@@ -62,20 +62,22 @@ class TaskForm(FlaskForm):
 class SubmissionForm(FlaskForm):
     content = TextAreaField('提交内容', validators=[Optional()])
     file = FileField('上传文件', validators=[Optional()])
+    upload_id = HiddenField('分片上传ID', validators=[Optional()])
     submit = SubmitField('提交任务')
 
 # 舞蹈提交表单
 class DanceSubmissionForm(FlaskForm):
     video = FileField('上传舞蹈视频', validators=[Optional()])
     video_url = StringField('视频URL', validators=[Optional()])
+    upload_id = HiddenField('分片上传ID', validators=[Optional()])
     submit = SubmitField('提交参赛作品')
     
     def validate(self):
         if not super(DanceSubmissionForm, self).validate():
             return False
         
-        # 至少需要提供视频文件或视频URL
-        if not self.video.data and not self.video_url.data:
+        # 至少需要提供视频文件、分片上传的视频或视频URL
+        if not self.video.data and not self.upload_id.data and not self.video_url.data:
             self.video.errors.append('请上传视频文件或输入视频URL')
             return False
         return True
@@ -0,0 +1,366 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Any, Optional
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, event, insert, update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from app import db
+from app.community.models import Dance, DanceSubmission, LeaderboardEntry
+from app.caching import cache_invalidator
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('DanceLeaderboard')
+
+SCOPES = ('dance', 'competition')
+
+class DanceLeaderboard:
+    """舞蹈比赛排行榜：评分时增量维护每个用户的最好成绩，榜单分页和名次查询只走索引"""
+
+    def __init__(self, cache_ttl: int = 5, cache_size: int = 1000):
+        """
+        初始化排行榜
+
+        Args:
+            cache_ttl: 榜单页进程内缓存时间（秒），热门比赛的榜单页会被频繁访问
+            cache_size: 缓存的榜单页数量上限
+        """
+        self.logger = logger
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cache_get(self, key):
+        with self._lock:
+            item = self._cache.get(key)
+            if item and item[0] > time.monotonic():
+                return item[1]
+            self._cache.pop(key, None)
+            return None
+
+    def _cache_set(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._cache and len(self._cache) >= self.cache_size:
+                # 写入时清理过期项，仍然已满时淘汰最早写入的项
+                for expired in [item_key for item_key, item in self._cache.items() if item[0] <= now]:
+                    del self._cache[expired]
+                while len(self._cache) >= self.cache_size:
+                    del self._cache[next(iter(self._cache))]
+            self._cache.pop(key, None)
+            self._cache[key] = (now + self.cache_ttl, value)
+
+    def init_app(self, app):
+        """注册提交钩子和 flask leaderboard 命令"""
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        app.cli.add_command(leaderboard_cli)
+
+    def invalidate(self, scope: Optional[str] = None, scope_id: Optional[int] = None):
+        """清除榜单缓存，不指定范围时全部清除"""
+        with self._lock:
+            if scope is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if key[1] == scope and key[2] == scope_id]:
+                del self._cache[key]
+
+    def _after_commit(self, session: Session):
+        """事务提交后再清除缓存，避免提交前其他请求把旧榜单重新缓存"""
+        for scope, scope_id in session.info.pop('leaderboard_scopes', ()):
+            self.invalidate(scope, scope_id)
+
+    @staticmethod
+    def _after_rollback(session: Session):
+        session.info.pop('leaderboard_scopes', None)
+
+    @staticmethod
+    def _best_submission(scope: str, scope_id: int, user_id: int):
+        """用户在榜单范围内得分最高的已评分作品（同分取较早提交的），返回 (作品ID, 分数)"""
+        query = db.session.query(DanceSubmission.id, DanceSubmission.score).filter(
+            DanceSubmission.user_id == user_id,
+            DanceSubmission.status == 'scored',
+            DanceSubmission.score.isnot(None)
+        )
+        if scope == 'dance':
+            query = query.filter(DanceSubmission.dance_id == scope_id)
+        else:
+            query = query.join(Dance, Dance.id == DanceSubmission.dance_id).filter(Dance.competition_id == scope_id)
+        return query.order_by(DanceSubmission.score.desc(), DanceSubmission.id.asc()).first()
+
+    @staticmethod
+    def _upsert_entry(row: Dict[str, Any], rescored_id: int):
+        """
+        写入榜单记录：不存在时插入，存在时仅在分数更高或原记录就是被重新评分的作品时覆盖；
+        并发评分同一用户的两个作品时，后提交的较低分不会覆盖先提交的较高分
+
+        SQLite和PostgreSQL使用一条 INSERT ... ON CONFLICT DO UPDATE，其他数据库先条件更新，
+        无记录时插入，唯一约束冲突（并发插入）时重试条件更新
+        """
+        table = LeaderboardEntry.__table__
+        keys = and_(table.c.scope == row['scope'], table.c.scope_id == row['scope_id'],
+                    table.c.user_id == row['user_id'])
+        values = {'submission_id': row['submission_id'], 'score': row['score'], 'updated_at': func.now()}
+        conn = db.session.connection()
+        if conn.dialect.name in ('sqlite', 'postgresql'):
+            if conn.dialect.name == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            statement = upsert(table).values(**row)
+            conn.execute(statement.on_conflict_do_update(
+                index_elements=['scope', 'scope_id', 'user_id'],
+                set_=values,
+                where=or_(table.c.score < statement.excluded.score,
+                          table.c.submission_id.in_([statement.excluded.submission_id, rescored_id]))))
+            return
+
+        replaceable = or_(table.c.score < row['score'], table.c.submission_id.in_([row['submission_id'], rescored_id]))
+        for _ in range(2):
+            if conn.execute(update(table).where(keys, replaceable).values(**values)).rowcount:
+                return
+            if conn.execute(table.select().where(keys)).first() is not None:
+                return
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(table).values(**row))
+                return
+            except IntegrityError:
+                continue
+
+    def record_submission(self, submission: DanceSubmission):
+        """
+        记录作品评分，按该用户在舞蹈榜和比赛榜中的实际最高分更新记录
+        只写入会话，由调用方与评分一起提交，提交后清除榜单缓存
+
+        Args:
+            submission: 已评分的参赛作品
+        """
+        if submission.score is None or not submission.user_id or not submission.dance_id:
+            return
+
+        # 先写入本次评分，使最高分查询包含该作品
+        db.session.flush()
+        dance = submission.dance or Dance.query.get(submission.dance_id)
+        scopes = [('dance', submission.dance_id)]
+        if dance and dance.competition_id:
+            scopes.append(('competition', dance.competition_id))
+
+        for scope, scope_id in scopes:
+            best = self._best_submission(scope, scope_id, submission.user_id)
+            if best is None:
+                continue
+            self._upsert_entry({
+                'scope': scope,
+                'scope_id': scope_id,
+                'user_id': submission.user_id,
+                'submission_id': best.id,
+                'score': best.score
+            }, submission.id)
+        cache_invalidator.mark_changed(db.session, LeaderboardEntry)
+        db.session.info.setdefault('leaderboard_scopes', set()).update(scopes)
+
+    def top(self, scope: str, scope_id: int, page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+        """
+        分页获取榜单
+
+        Args:
+            scope: 榜单范围，dance 或 competition
+            scope_id: 舞蹈ID或比赛ID
+            page: 页码，从1开始
+            per_page: 每页数量
+
+        Returns:
+            包含 entries（名次、用户、分数、作品）、total、page、per_page 的字典
+        """
+        page = max(page, 1)
+        per_page = max(per_page, 1)
+        key = ('top', scope, scope_id, page, per_page)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        query = LeaderboardEntry.query.filter_by(scope=scope, scope_id=scope_id)
+        total = query.count()
+        entries = query.options(joinedload(LeaderboardEntry.user))\
+            .order_by(LeaderboardEntry.score.desc(), LeaderboardEntry.updated_at.asc(), LeaderboardEntry.id.asc())\
+            .limit(per_page).offset((page - 1) * per_page).all()
+
+        start = (page - 1) * per_page
+        result = {
+            'entries': [{
+                'rank': start + index + 1,
+                'user_id': entry.user_id,
+                'username': entry.user.username if entry.user else None,
+                'score': entry.score,
+                'submission_id': entry.submission_id
+            } for index, entry in enumerate(entries)],
+            'total': total,
+            'page': page,
+            'per_page': per_page
+        }
+        self._cache_set(key, result)
+        return result
+
+    def rank_of(self, scope: str, scope_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        查询用户在榜单中的名次（同分并列）
+
+        Returns:
+            包含 rank、score、total 的字典，用户未上榜时返回None
+        """
+        entry = LeaderboardEntry.query.filter_by(scope=scope, scope_id=scope_id, user_id=user_id).first()
+        if not entry:
+            return None
+        base = LeaderboardEntry.query.filter_by(scope=scope, scope_id=scope_id)
+        higher = base.filter(LeaderboardEntry.score > entry.score).count()
+        return {
+            'rank': higher + 1,
+            'score': entry.score,
+            'submission_id': entry.submission_id,
+            'total': base.count()
+        }
+
+    def top_submissions_for_dances(self, dance_ids: List[int], limit: int = 10) -> Dict[int, List[DanceSubmission]]:
+        """
+        获取多支舞蹈各自的前若干名作品，两次查询完成（窗口函数取前K名 + 批量加载作品）
+
+        Args:
+            dance_ids: 舞蹈ID列表
+            limit: 每支舞蹈返回的名次数
+
+        Returns:
+            舞蹈ID -> 按名次排列的作品列表
+        """
+        rankings = {dance_id: [] for dance_id in dance_ids}
+        if not dance_ids:
+            return rankings
+
+        row_number = func.row_number().over(
+            partition_by=LeaderboardEntry.scope_id,
+            order_by=(LeaderboardEntry.score.desc(), LeaderboardEntry.updated_at.asc(), LeaderboardEntry.id.asc())
+        ).label('position')
+        ranked = db.session.query(LeaderboardEntry.scope_id, LeaderboardEntry.submission_id, row_number)\
+            .filter(LeaderboardEntry.scope == 'dance', LeaderboardEntry.scope_id.in_(dance_ids))\
+            .subquery()
+        rows = db.session.query(ranked.c.scope_id, ranked.c.submission_id)\
+            .filter(ranked.c.position <= limit)\
+            .order_by(ranked.c.scope_id, ranked.c.position).all()
+
+        submission_ids = [row.submission_id for row in rows]
+        submissions = {}
+        if submission_ids:
+            submissions = {submission.id: submission for submission in DanceSubmission.query.options(
+                joinedload(DanceSubmission.user)).filter(DanceSubmission.id.in_(submission_ids))}
+        for row in rows:
+            submission = submissions.get(row.submission_id)
+            if submission:
+                rankings[row.scope_id].append(submission)
+        return rankings
+
+    def rebuild_competition(self, competition_id: Optional[int]) -> Dict[str, Any]:
+        """
+        根据已评分作品重建某场比赛的舞蹈榜和比赛榜，用于历史数据回填
+
+        Args:
+            competition_id: 比赛ID，为None时重建不属于任何比赛的舞蹈榜
+
+        Returns:
+            操作结果
+        """
+        try:
+            dance_ids = [dance_id for (dance_id,) in db.session.query(Dance.id).filter_by(competition_id=competition_id)]
+            scope_filter = db.and_(LeaderboardEntry.scope == 'dance', LeaderboardEntry.scope_id.in_(dance_ids))
+            if competition_id is not None:
+                scope_filter = db.or_(
+                    db.and_(LeaderboardEntry.scope == 'competition', LeaderboardEntry.scope_id == competition_id),
+                    scope_filter
+                )
+            LeaderboardEntry.query.filter(scope_filter).delete(synchronize_session=False)
+
+            # 每个用户在每个榜单取最高分作品，同分取较早提交的
+            best = {}
+            submissions = db.session.query(DanceSubmission.id, DanceSubmission.user_id,
+                                           DanceSubmission.dance_id, DanceSubmission.score).filter(
+                DanceSubmission.dance_id.in_(dance_ids),
+                DanceSubmission.status == 'scored',
+                DanceSubmission.score.isnot(None),
+                DanceSubmission.user_id.isnot(None)
+            ).order_by(DanceSubmission.id)
+            for submission_id, user_id, dance_id, score in submissions:
+                keys = [('dance', dance_id, user_id)]
+                if competition_id is not None:
+                    keys.append(('competition', competition_id, user_id))
+                for key in keys:
+                    if key not in best or score > best[key][1]:
+                        best[key] = (submission_id, score)
+
+            db.session.bulk_insert_mappings(LeaderboardEntry, [{
+                'scope': scope,
+                'scope_id': scope_id,
+                'user_id': user_id,
+                'submission_id': submission_id,
+                'score': score
+            } for (scope, scope_id, user_id), (submission_id, score) in best.items()])
+            cache_invalidator.mark_changed(db.session, LeaderboardEntry)
+            db.session.commit()
+            self.invalidate()
+
+            self.logger.info(f"比赛 {competition_id} 排行榜重建完成，共 {len(best)} 条记录")
+            return {
+                "success": True,
+                "message": "排行榜重建完成",
+                "entries": len(best)
+            }
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"排行榜重建失败: {str(e)}")
+            return {
+                "success": False,
+                "error": f"排行榜重建失败: {str(e)}"
+            }
+
+    def rebuild_all(self) -> Dict[str, Any]:
+        """
+        重建所有比赛和独立舞蹈的排行榜，部署排行榜物化表后回填历史评分
+
+        Returns:
+            操作结果，包含重建的比赛数、记录数和失败的比赛
+        """
+        competition_ids = [competition_id for (competition_id,) in db.session.query(Dance.competition_id)
+                           .distinct().order_by(Dance.competition_id)]
+        entries = 0
+        failed = []
+        for competition_id in competition_ids:
+            result = self.rebuild_competition(competition_id)
+            if result['success']:
+                entries += result['entries']
+            else:
+                failed.append(competition_id)
+        return {
+            "success": not failed,
+            "competitions": len([competition_id for competition_id in competition_ids if competition_id is not None]),
+            "entries": entries,
+            "failed": failed
+        }
+
+leaderboard_cli = AppGroup('leaderboard', help='舞蹈比赛排行榜')
+
+@leaderboard_cli.command('rebuild')
+@click.option('--competition', 'competition_id', type=int, default=None, help='只重建指定比赛，默认全部')
+def rebuild_command(competition_id):
+    """根据已评分作品重建排行榜（部署排行榜表后执行一次以回填历史成绩）"""
+    if competition_id is None:
+        click.echo(dance_leaderboard.rebuild_all())
+    else:
+        click.echo(dance_leaderboard.rebuild_competition(competition_id))
+
+# 进程内共享的排行榜实例
+dance_leaderboard = DanceLeaderboard()
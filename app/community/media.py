@@ -0,0 +1,315 @@
+import os
+import html
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Callable, Optional
+from flask import has_app_context
+from sqlalchemy import update, or_, and_
+from app import db
+from app.community.models import Dance, DanceSubmission
+from app.community.uploads import is_video_file
+from app.storage.blobstore import blob_store, static_key
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('MediaPipeline')
+
+# 媒体处理状态：ready 为 ffmpeg 生成的缩略图和预览，fallback 为无法解码视频时生成的占位图
+PENDING = 'pending'
+PROCESSING = 'processing'
+READY = 'ready'
+FALLBACK = 'fallback'
+FAILED = 'failed'
+
+# 处理对象：类型 -> 模型
+MEDIA_MODELS = {'dance': Dance, 'submission': DanceSubmission}
+
+RENDITION_FIELDS = {'thumbnail': 'thumbnail_url', 'poster': 'poster_url', 'preview': 'preview_url'}
+
+# 占位图配色，按民族或标题选取
+PLACEHOLDER_COLORS = (('#E74C3C', '#F39C12'), ('#3498DB', '#2980B9'), ('#27AE60', '#16A085'),
+                      ('#8E44AD', '#9B59B6'), ('#D35400', '#E67E22'), ('#2C3E50', '#34495E'))
+
+def placeholder_svg(title: str, label: str, width: int, height: int) -> bytes:
+    """生成带标题的渐变占位图（SVG），不依赖图像库"""
+    start, end = PLACEHOLDER_COLORS[int(hashlib.md5(label.encode('utf-8')).hexdigest(), 16) % len(PLACEHOLDER_COLORS)]
+    font_size = max(height // 9, 12)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        f'<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">'
+        f'<stop offset="0" stop-color="{start}"/><stop offset="1" stop-color="{end}"/></linearGradient></defs>'
+        f'<rect width="100%" height="100%" fill="url(#g)"/>'
+        f'<text x="50%" y="50%" fill="#fff" font-size="{font_size}" font-family="sans-serif" '
+        f'text-anchor="middle" dominant-baseline="middle">{html.escape(title[:20])}</text>'
+        f'<text x="50%" y="{int(height * 0.7)}" fill="#fff" fill-opacity="0.8" font-size="{font_size * 2 // 3}" '
+        f'font-family="sans-serif" text-anchor="middle">{html.escape(label[:20])}</text></svg>'
+    ).encode('utf-8')
+
+class MediaPipeline:
+    """
+    舞蹈视频媒体处理：生成缩略图、封面帧和低码率预览，结果写入内容寻址存储并记录到 Dance/DanceSubmission；
+    转码由 ffmpeg 子进程完成，线程池只负责调度，多个视频在各自的进程中并行处理；
+    未安装 ffmpeg 或来源不是本地视频时生成SVG占位图
+    """
+
+    def __init__(self):
+        """初始化媒体处理队列，线程池在首次提交时创建"""
+        self.logger = logger
+        self.app = None
+        self.workers = 2
+        self.ffmpeg = None
+        self.ffprobe = None
+        self.thumbnail_width = 320
+        self.poster_width = 1280
+        self.preview_height = 480
+        self.preview_bitrate = '600k'
+        self.timeout = 600
+        self.stall_timeout = 1800
+        self.fallback_thumbnail = None
+        self._executor = None
+        self._queued = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """读取配置并查找 ffmpeg"""
+        self.app = app
+        self.workers = app.config.get('MEDIA_WORKERS', self.workers)
+        self.ffmpeg = app.config.get('MEDIA_FFMPEG_PATH') or shutil.which('ffmpeg')
+        self.ffprobe = app.config.get('MEDIA_FFPROBE_PATH') or shutil.which('ffprobe')
+        self.thumbnail_width = app.config.get('MEDIA_THUMBNAIL_WIDTH', self.thumbnail_width)
+        self.poster_width = app.config.get('MEDIA_POSTER_WIDTH', self.poster_width)
+        self.preview_height = app.config.get('MEDIA_PREVIEW_HEIGHT', self.preview_height)
+        self.preview_bitrate = app.config.get('MEDIA_PREVIEW_BITRATE', self.preview_bitrate)
+        self.timeout = app.config.get('MEDIA_TIMEOUT', self.timeout)
+        # 处理中每步之间更新时间，中断判定时间至少要比单个命令的超时长
+        self.stall_timeout = max(app.config.get('MEDIA_STALL_TIMEOUT', self.stall_timeout), self.timeout + 60)
+        self.fallback_thumbnail = app.config.get('MEDIA_FALLBACK_THUMBNAIL')
+        if not self.ffmpeg:
+            self.logger.info("未找到 ffmpeg，媒体处理只生成占位图")
+
+    def _ensure_started(self):
+        if self._executor is not None:
+            return
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='media')
+        self.recover()
+
+    def submit(self, kind: str, item_id: int):
+        """
+        提交媒体处理任务，同一对象排队中时不重复提交
+
+        Args:
+            kind: dance 或 submission
+            item_id: 舞蹈ID或作品ID
+        """
+        self._ensure_started()
+        with self._lock:
+            if (kind, item_id) in self._queued:
+                return
+            self._queued.add((kind, item_id))
+        self._executor.submit(self._run, kind, item_id)
+
+    def thumbnail(self, item) -> Optional[str]:
+        """缩略图URL，处理完成前返回默认缩略图"""
+        return item.thumbnail_url or self.fallback_thumbnail
+
+    def submit_pending(self, kind: str, items):
+        """提交列表中尚未处理的对象，返回列表页时调用"""
+        for item in items:
+            if item.media_status in (None, PENDING):
+                self.submit(kind, item.id)
+
+    def recover(self):
+        """重新提交未处理或处理中断的对象"""
+        if not self.app:
+            return
+        try:
+            if has_app_context():
+                stalled = self._stalled_items()
+            else:
+                with self.app.app_context():
+                    stalled = self._stalled_items()
+        except Exception as e:
+            self.logger.error(f"恢复媒体处理任务失败: {str(e)}")
+            return
+        for kind, item_id in stalled:
+            with self._lock:
+                if (kind, item_id) in self._queued:
+                    continue
+                self._queued.add((kind, item_id))
+            self._executor.submit(self._run, kind, item_id)
+        if stalled:
+            self.logger.info(f"重新提交 {len(stalled)} 个媒体处理任务")
+
+    def _stalled_condition(self, model):
+        return or_(model.media_status.is_(None), model.media_status == PENDING,
+                   and_(model.media_status == PROCESSING,
+                        model.media_updated_at < datetime.now() - timedelta(seconds=self.stall_timeout)))
+
+    def _stalled_items(self):
+        return [(kind, item_id) for kind, model in MEDIA_MODELS.items()
+                for (item_id,) in db.session.query(model.id).filter(self._stalled_condition(model))]
+
+    def _claim(self, model, item_id: int) -> bool:
+        """多个进程共享数据库时，只有一个进程处理同一个对象"""
+        result = db.session.execute(
+            update(model.__table__)
+            .where(model.id == item_id)
+            .where(self._stalled_condition(model))
+            .values(media_status=PROCESSING, media_updated_at=datetime.now())
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _heartbeat(self, model, item_id: int):
+        """
+        处理的各步骤之间更新时间，避免长时间转码被其他进程判定为中断而重复处理
+
+        Raises:
+            RuntimeError: 对象已不在处理中（如被删除或状态被重置）
+        """
+        result = db.session.execute(
+            update(model.__table__)
+            .where(model.id == item_id, model.media_status == PROCESSING)
+            .values(media_updated_at=datetime.now())
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            raise RuntimeError('对象已不在处理中')
+
+    def _run(self, kind: str, item_id: int):
+        with self._lock:
+            self._queued.discard((kind, item_id))
+        try:
+            with self.app.app_context():
+                try:
+                    self.process(kind, item_id)
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            self.logger.error(f"媒体处理线程异常: {str(e)}")
+
+    def source_path(self, video_url: Optional[str]) -> Optional[str]:
+        """视频地址对应的本地文件：/static/ 开头的路径或视频目录中的文件名，外部URL返回None"""
+        if not video_url or '://' in video_url:
+            return None
+        if video_url.startswith('/static/') or video_url.startswith('static/'):
+            path = blob_store.resolve(static_key(video_url))
+        else:
+            path = os.path.join(self.app.config['DANCE_VIDEOS_FOLDER'], video_url)
+        return path if os.path.isfile(path) else None
+
+    def _ffmpeg(self, *args: str):
+        subprocess.run([self.ffmpeg, '-y', '-v', 'error', *args], check=True, capture_output=True,
+                       timeout=self.timeout)
+
+    def _duration(self, source: str) -> float:
+        if not self.ffprobe:
+            return 0.0
+        try:
+            output = subprocess.run(
+                [self.ffprobe, '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=nw=1:nk=1', source],
+                check=True, capture_output=True, timeout=60, text=True).stdout
+            return float(output.strip() or 0)
+        except (subprocess.SubprocessError, ValueError):
+            return 0.0
+
+    def render(self, source: str, workdir: str, heartbeat: Optional[Callable[[], None]] = None) -> Dict[str, str]:
+        """
+        用 ffmpeg 生成封面帧、缩略图和低码率预览
+
+        Args:
+            source: 视频文件路径
+            workdir: 临时目录
+            heartbeat: 每个命令开始前调用，用于更新处理时间
+
+        Returns:
+            渲染类型 -> 临时文件路径
+        """
+        heartbeat = heartbeat or (lambda: None)
+        seek = min(self._duration(source) * 0.1, 5.0)
+        poster = os.path.join(workdir, 'poster.jpg')
+        thumbnail = os.path.join(workdir, 'thumbnail.jpg')
+        preview = os.path.join(workdir, 'preview.mp4')
+        heartbeat()
+        self._ffmpeg('-ss', f'{seek:.2f}', '-i', source, '-frames:v', '1',
+                     '-vf', f"scale='min({self.poster_width},iw)':-2", '-q:v', '3', poster)
+        heartbeat()
+        self._ffmpeg('-i', poster, '-vf', f'scale={self.thumbnail_width}:-2', '-q:v', '5', thumbnail)
+        heartbeat()
+        self._ffmpeg('-i', source, '-vf', f"scale=-2:'min({self.preview_height},ih)'",
+                     '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', self.preview_bitrate,
+                     '-maxrate', self.preview_bitrate, '-bufsize', '1200k',
+                     '-c:a', 'aac', '-b:a', '64k', '-ac', '1', '-movflags', '+faststart', preview)
+        return {'poster': poster, 'thumbnail': thumbnail, 'preview': preview}
+
+    def _placeholders(self, item, workdir: str) -> Dict[str, str]:
+        """生成缩略图和封面的占位图"""
+        if isinstance(item, Dance):
+            title, label = item.title, item.ethnicity or ''
+        else:
+            title, label = item.dance.title if item.dance else '参赛作品', f'作品 #{item.id}'
+        renditions = {}
+        for name, (width, height) in (('thumbnail', (self.thumbnail_width, self.thumbnail_width * 9 // 16)),
+                                      ('poster', (self.poster_width, self.poster_width * 9 // 16))):
+            path = os.path.join(workdir, f'{name}.svg')
+            with open(path, 'wb') as f:
+                f.write(placeholder_svg(title, label, width, height))
+            renditions[name] = path
+        return renditions
+
+    def process(self, kind: str, item_id: int):
+        """处理一个对象：生成各渲染版本，写入存储并替换原有记录"""
+        model = MEDIA_MODELS[kind]
+        if not self._claim(model, item_id):
+            return
+        item = model.query.get(item_id)
+        if item is None:
+            return
+        workdir = tempfile.mkdtemp(prefix='media-')
+        try:
+            source = self.source_path(item.video_url)
+            if self.ffmpeg and source and is_video_file(source):
+                renditions, status = self.render(source, workdir, lambda: self._heartbeat(model, item_id)), READY
+            else:
+                renditions, status = self._placeholders(item, workdir), FALLBACK
+            # 写入结果前确认仍由本进程处理
+            self._heartbeat(model, item_id)
+
+            for name, field in RENDITION_FIELDS.items():
+                old_url = getattr(item, field)
+                new_url = None
+                if name in renditions:
+                    ext = os.path.splitext(renditions[name])[1]
+                    with open(renditions[name], 'rb') as f:
+                        _, key = blob_store.save(f, 'static:media', f'{kind}_{item_id}_{name}{ext}')
+                    new_url = f"{self.app.static_url_path}/{key.partition(':')[2]}"
+                # save 已为新版本增加引用，内容相同（路径相同）时也要释放原记录持有的一次引用
+                if old_url:
+                    blob_store.release(static_key(old_url))
+                setattr(item, field, new_url)
+            item.media_status = status
+            item.media_updated_at = datetime.now()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"{kind} {item_id} 媒体处理失败: {str(e)}")
+            db.session.execute(update(model.__table__).where(model.id == item_id, model.media_status == PROCESSING)
+                               .values(media_status=FAILED, media_updated_at=datetime.now()))
+            db.session.commit()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+# 进程内共享的媒体处理队列
+media_pipeline = MediaPipeline()
@@ -1,3 +1,4 @@
+from sqlalchemy import select, func
 from app import db
 
 # 标签模型
@@ -42,6 +43,12 @@ class Comment(db.Model):
     def __repr__(self):
         return '<Comment {}>'.format(self.id)
 
+# 帖子评论数：关联子查询，默认延迟加载，列表查询通过 undefer 随帖子一起查出，无需加载评论行
+Post.comments_count = db.column_property(
+    select(func.count(Comment.id)).where(Comment.post_id == Post.id).correlate_except(Comment).scalar_subquery(),
+    deferred=True
+)
+
 class Story(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False)
@@ -167,6 +174,12 @@ class Dance(db.Model):
     difficulty = db.Column(db.String(20), default='medium')  # easy, medium, hard
     competition_id = db.Column(db.Integer, db.ForeignKey('dance_competition.id'))
     created_at = db.Column(db.DateTime, default=db.func.now())
+    # 媒体处理结果：缩略图、封面帧、低码率预览，处理完成前页面显示默认缩略图
+    thumbnail_url = db.Column(db.String(300), nullable=True)
+    poster_url = db.Column(db.String(300), nullable=True)
+    preview_url = db.Column(db.String(300), nullable=True)
+    media_status = db.Column(db.String(20), default='pending', index=True)  # pending, processing, ready, fallback, failed
+    media_updated_at = db.Column(db.DateTime, nullable=True)
     competition = db.relationship('DanceCompetition', backref='dances', lazy=True)
     
     def __repr__(self):
@@ -188,6 +201,14 @@ class DanceSubmission(db.Model):
     score_details = db.Column(db.JSON, nullable=True)  # AI评分详细信息（包含反馈和建议）
     share_count = db.Column(db.Integer, default=0)  # 分享次数
     created_at = db.Column(db.DateTime, default=db.func.now(), index=True)
+    # 媒体处理结果：缩略图、封面帧、低码率预览，处理完成前页面显示默认缩略图
+    thumbnail_url = db.Column(db.String(300), nullable=True)
+    poster_url = db.Column(db.String(300), nullable=True)
+    preview_url = db.Column(db.String(300), nullable=True)
+    media_status = db.Column(db.String(20), default='pending', index=True)  # pending, processing, ready, fallback, failed
+    media_updated_at = db.Column(db.DateTime, nullable=True)
+    # 评分任务最近一次入队或执行的时间，多进程据此判断任务是否中断
+    scoring_updated_at = db.Column(db.DateTime, nullable=True)
     
     # 复合索引，优化舞蹈排行榜查询
     __table_args__ = (
@@ -214,6 +235,10 @@ class DanceSubmission(db.Model):
             'suggestions': score_result['suggestions']
         }
         self.status = 'scored'
+        
+        # 同步更新排行榜（与评分在同一事务中提交）
+        from app.community.leaderboard import dance_leaderboard
+        dance_leaderboard.record_submission(self)
 
 class Share(db.Model):
     """分享统计模型"""
@@ -229,4 +254,88 @@ class Share(db.Model):
     user = db.relationship('User', backref='shares', lazy=True)
     
     def __repr__(self):
-        return '<Share submission_id={} platform={} time={}>'.format(self.submission_id, self.platform, self.share_time)
\ No newline at end of file
+        return '<Share submission_id={} platform={} time={}>'.format(self.submission_id, self.platform, self.share_time)
+
+class LeaderboardEntry(db.Model):
+    """排行榜物化表：每个用户在每支舞蹈、每场比赛中的最好成绩"""
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # dance, competition
+    scope_id = db.Column(db.Integer, nullable=False)  # 舞蹈ID或比赛ID
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    submission_id = db.Column(db.Integer, db.ForeignKey('dance_submission.id'), nullable=False)  # 最好成绩对应的作品
+    score = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    
+    # 唯一约束保证每个用户在每个榜单只有一条记录，复合索引用于榜单分页和名次统计
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'scope_id', 'user_id', name='uq_leaderboard_scope_user'),
+        db.Index('idx_leaderboard_scope_score', 'scope', 'scope_id', 'score'),
+    )
+    
+    # 关系
+    user = db.relationship('User', lazy=True)
+    submission = db.relationship('DanceSubmission', lazy=True)
+    
+    def __repr__(self):
+        return '<LeaderboardEntry {}:{} user_id={} score={}>'.format(self.scope, self.scope_id, self.user_id, self.score)
+
+class AnalyticsEvent(db.Model):
+    """互动事件流水（只追加）：分享、点赞、浏览，按天分区，过期分区整体删除"""
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(20), nullable=False)  # share, like, unlike, view
+    entity_type = db.Column(db.String(20), nullable=False)  # submission, post, story
+    entity_id = db.Column(db.Integer, nullable=False)
+    platform = db.Column(db.String(20), nullable=True)  # 分享平台：wechat, weibo, qq, copy
+    user_id = db.Column(db.Integer, nullable=True)  # 不设外键，写入时无需检查用户表
+    ip_address = db.Column(db.String(50), nullable=True)
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)  # 分区键
+    
+    def __repr__(self):
+        return '<AnalyticsEvent {} {}:{}>'.format(self.event_type, self.entity_type, self.entity_id)
+
+class AnalyticsRollup(db.Model):
+    """互动事件汇总：每个对象（及全站 all:0）每种事件、每个平台在每个分钟/小时/天时间桶内的次数"""
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # minute, hour, day
+    entity_type = db.Column(db.String(20), nullable=False)  # submission, post, story, all
+    entity_id = db.Column(db.Integer, nullable=False)  # entity_type 为 all 时为0
+    event_type = db.Column(db.String(20), nullable=False)
+    platform = db.Column(db.String(20), nullable=False, default='')  # 无平台时为空字符串，便于唯一约束
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    # 唯一约束用于增量累加，同时作为按对象查询时间序列的索引
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'entity_type', 'entity_id', 'event_type', 'platform', 'bucket_start',
+                            name='uq_analytics_rollup'),
+        db.Index('idx_analytics_rollup_bucket', 'granularity', 'bucket_start'),
+    )
+    
+    def __repr__(self):
+        return '<AnalyticsRollup {} {}:{} {}={}>'.format(self.granularity, self.entity_type, self.entity_id,
+                                                         self.event_type, self.count)
+
+class UploadSession(db.Model):
+    """分片上传会话（tus 协议）：记录已接收的字节数，断线后从该偏移量续传"""
+    id = db.Column(db.String(32), primary_key=True)  # 上传ID
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    purpose = db.Column(db.String(20), nullable=False)  # task, dance
+    target_id = db.Column(db.Integer, nullable=False)  # 任务ID或舞蹈ID
+    filename = db.Column(db.String(200), nullable=False)  # 安全处理后的原始文件名
+    stored_name = db.Column(db.String(200), nullable=False)  # 完成后保存的文件名
+    upload_length = db.Column(db.BigInteger, nullable=False)  # 文件总字节数
+    upload_offset = db.Column(db.BigInteger, nullable=False, default=0)  # 已接收并落盘的字节数
+    max_size = db.Column(db.BigInteger, nullable=False)  # 创建时的大小上限
+    checksum = db.Column(db.String(64), nullable=True)  # 完成后的 SHA-256
+    status = db.Column(db.String(20), nullable=False, default='uploading', index=True)  # uploading, complete, processing, processed, failed, consumed
+    file_url = db.Column(db.String(300), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # 写入租约，同一上传同一时间只接受一个请求
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # 未完成的上传过期后清理
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    
+    def __repr__(self):
+        return '<UploadSession {} {}:{} {}/{}>'.format(self.id, self.purpose, self.target_id,
+                                                      self.upload_offset, self.upload_length)
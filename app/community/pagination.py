@@ -0,0 +1,93 @@
+import json
+import base64
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+from flask import current_app
+from sqlalchemy import and_, or_, func, bindparam
+
+# SQLite 以文本保存时间：数据库 now() 写入的不带小数秒，应用写入的带6位微秒，
+# 直接按文本比较时同一时刻的两种格式不相等，因此两侧统一格式化为毫秒精度后再比较和排序
+SQLITE_TIME_FORMAT = '%Y-%m-%d %H:%M:%f'
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """将 (created_at, id) 编码为不透明游标"""
+    payload = json.dumps([created_at.isoformat() if created_at else None, item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Optional[datetime], int]]:
+    """
+    解析游标
+
+    Returns:
+        (created_at, id)，游标为空或无效时返回None，即从第一页开始
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(item_id)
+    except (ValueError, TypeError):
+        return None
+
+def get_page_size(requested: Optional[int] = None) -> int:
+    """获取每页数量，默认取配置 COMMUNITY_PAGE_SIZE，不超过 COMMUNITY_MAX_PAGE_SIZE"""
+    default_size = current_app.config.get('COMMUNITY_PAGE_SIZE', 20)
+    max_size = current_app.config.get('COMMUNITY_MAX_PAGE_SIZE', 100)
+    if not requested or requested < 1:
+        return default_size
+    return min(requested, max_size)
+
+def _time_key(query, value):
+    """排序和比较使用的时间表达式，SQLite 中统一文本格式"""
+    if query.session.get_bind().dialect.name == 'sqlite':
+        return func.strftime(SQLITE_TIME_FORMAT, value)
+    return value
+
+def keyset_paginate(query, model, cursor: Optional[str] = None, per_page: Optional[int] = None,
+                    descending: bool = True) -> Dict[str, Any]:
+    """
+    基于 (created_at, id) 的游标分页，避免 OFFSET 扫描
+
+    Args:
+        query: 已应用筛选条件的查询
+        model: 模型类，需有 created_at 和 id 字段
+        cursor: 上一页返回的 next_cursor
+        per_page: 每页数量
+        descending: 是否按时间倒序
+
+    Returns:
+        包含 items、next_cursor、has_next 的字典
+    """
+    per_page = get_page_size(per_page)
+    position = decode_cursor(cursor)
+    time_key = _time_key(query, model.created_at)
+    if position:
+        created_at, item_id = position
+        id_after = model.id < item_id if descending else model.id > item_id
+        if created_at is None:
+            # 游标已进入 created_at 为空的尾部，只按ID继续
+            query = query.filter(model.created_at.is_(None), id_after)
+        else:
+            cursor_key = _time_key(query, bindparam(None, created_at, type_=model.created_at.type))
+            time_after = time_key < cursor_key if descending else time_key > cursor_key
+            query = query.filter(or_(time_after,
+                                     and_(time_key == cursor_key, id_after),
+                                     model.created_at.is_(None)))
+
+    # created_at 为空的记录统一排在最后（不依赖各数据库 NULL 的默认排序），由上面的条件衔接
+    if descending:
+        query = query.order_by(model.created_at.is_(None), time_key.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.created_at.is_(None), time_key.asc(), model.id.asc())
+
+    # 多取一条用于判断是否还有下一页
+    items = query.limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if has_next else None
+    return {
+        'items': items,
+        'next_cursor': next_cursor,
+        'has_next': has_next
+    }
@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, selectinload, undefer
+from app import db
+from app.community.models import Post, Story, Task, TaskSubmission, Dance, DanceSubmission
+
+# 查询加载预设：每个页面渲染所需的关联对象一次性加载，避免模板中逐行触发懒加载查询
+# 多对一关系使用 joinedload（同一条SQL），一对多关系使用 selectinload（每个关系额外一条 IN 查询）
+
+# 帖子列表/详情：作者、评论数、标签
+POST_OPTIONS = (
+    joinedload(Post.author),
+    undefer(Post.comments_count),
+    selectinload(Post.tags),
+)
+
+# 故事列表/详情：作者
+STORY_OPTIONS = (
+    joinedload(Story.author),
+)
+
+# 任务列表：创建者、参与记录（任务列表页显示参与和完成人数）
+def task_options():
+    """Task.user_tasks 是 UserTask 上声明的反向关系，映射配置完成后才存在，因此在查询时构建"""
+    return (
+        joinedload(Task.creator),
+        selectinload(Task.user_tasks),
+    )
+
+# 任务提交列表：提交用户
+TASK_SUBMISSION_OPTIONS = (
+    joinedload(TaskSubmission.user),
+)
+
+# 舞蹈作品：用户、舞蹈及所属比赛
+DANCE_SUBMISSION_OPTIONS = (
+    joinedload(DanceSubmission.user),
+    joinedload(DanceSubmission.dance).joinedload(Dance.competition),
+)
+
+def posts_query():
+    """带关联预加载的帖子查询"""
+    return Post.query.options(*POST_OPTIONS)
+
+def stories_query():
+    """带关联预加载的故事查询"""
+    return Story.query.options(*STORY_OPTIONS)
+
+def tasks_query():
+    """带关联预加载的任务查询"""
+    return Task.query.options(*task_options())
+
+def task_submissions_query():
+    """带关联预加载的任务提交查询"""
+    return TaskSubmission.query.options(*TASK_SUBMISSION_OPTIONS)
+
+def dance_submissions_query():
+    """带关联预加载的舞蹈作品查询"""
+    return DanceSubmission.query.options(*DANCE_SUBMISSION_OPTIONS)
+
+class QueryCounter:
+    """统计代码块内执行的SQL语句数量"""
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.engine = self.engine or db.engine
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+        return False
+
+@contextmanager
+def assert_max_queries(max_queries: int, engine=None):
+    """
+    断言代码块内的SQL查询数量不超过上限，用于检查接口是否存在N+1查询
+
+    用法::
+
+        with app.app_context(), assert_max_queries(4):
+            app.test_client().get('/community/dance-competition/1/ranking')
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > max_queries:
+        statements = '\n'.join(counter.statements)
+        raise AssertionError(f'执行了 {counter.count} 条查询，超过上限 {max_queries}:\n{statements}')
@@ -1,26 +1,53 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
 from app import db
-from app.community.models import Post, Comment, Story, Task, UserTask, TaskSubmission, Like, Tag, DanceCompetition, Dance, DanceSubmission, Share
+from app.community.models import Post, Comment, Story, Task, UserTask, TaskSubmission, Like, Tag, DanceCompetition, Dance, DanceSubmission
+from app.community.search import community_search_index
+from app.community.pagination import keyset_paginate
+from app.community.queries import posts_query, stories_query, tasks_query, task_submissions_query, dance_submissions_query
+from app.community.leaderboard import dance_leaderboard, SCOPES as LEADERBOARD_SCOPES
+from app.community.scoring import scoring_queue, FINISHED_STATES as SCORING_FINISHED_STATES
+from app.community.action_sequence import generate_action_arrays, normalize_difficulty, to_columnar, to_frames, MAX_DURATION as ACTION_MAX_DURATION
+from app.community.sequence_cache import action_sequence_cache, derive_seed, make_etag
+from app.community.counters import counter_buffer
+from app.community.uploads import upload_manager, parse_metadata, UploadError, TUS_VERSION, TUS_EXTENSIONS
+from app.storage.blobstore import blob_store, static_key
+from app.community.media import media_pipeline
+from app.community.analytics import analytics_recorder, ENTITY_TYPES as ANALYTICS_ENTITY_TYPES, ALL_ENTITIES as ANALYTICS_ALL_ENTITIES
 import datetime
+import math
 import os
 import random
-import math
+import threading
 
 bp = Blueprint('community', __name__)
 
+# 搜索结果每页数量
+SEARCH_PER_PAGE = 20
+# 排行榜页每支舞蹈展示的名次数
+RANKING_TOP_K = 10
+# 评分状态SSE连接的最长时间（秒）
+SCORE_EVENTS_TIMEOUT = 60
+# 同时保持的评分状态SSE连接数上限：每个连接占用一个请求线程，超出时客户端改为轮询 status_url
+SCORE_EVENTS_MAX_STREAMS = 2
+_score_event_streams = threading.BoundedSemaphore(SCORE_EVENTS_MAX_STREAMS)
+
 @bp.route('/community/')
 def index():
     # 添加分类筛选
     category = request.args.get('category')
+    query = posts_query()
     if category:
-        posts = Post.query.filter_by(category=category).all()
-    else:
-        posts = Post.query.all()
+        query = query.filter_by(category=category)
+    # 帖子按游标分页
+    post_page = keyset_paginate(query, Post, request.args.get('cursor'), request.args.get('per_page', type=int))
+    posts = post_page['items']
+    counter_buffer.merge(posts, 'likes', 'views')
     
-    # 获取所有任务
-    tasks = Task.query.all()
+    # 获取最新一页任务，完整列表见任务页
+    tasks = keyset_paginate(tasks_query(), Task)['items']
     
     # 如果用户已登录，获取用户任务进度
     user_tasks = {}
@@ -32,31 +59,33 @@ def index():
     categories = db.session.query(Post.category).distinct().all()
     categories = [c[0] for c in categories if c[0]]
     
-    return render_template('community/community.html', posts=posts, tasks=tasks, user_tasks=user_tasks, categories=categories)
+    return render_template('community/community.html', posts=posts, tasks=tasks, user_tasks=user_tasks, categories=categories,
+                           next_cursor=post_page['next_cursor'])
 
 # 任务相关路由
 @bp.route('/community/tasks')
 def tasks():
     """所有任务列表"""
-    # 获取所有任务
-    tasks = Task.query.order_by(Task.created_at.desc()).all()
+    # 按游标分页获取任务
+    task_page = keyset_paginate(tasks_query(), Task, request.args.get('cursor'), request.args.get('per_page', type=int))
+    tasks = task_page['items']
     # 如果用户已登录，获取用户任务进度
     user_tasks = {}
     if current_user.is_authenticated:
         user_task_list = UserTask.query.filter_by(user_id=current_user.id).all()
         user_tasks = {ut.task_id: ut for ut in user_task_list}
-    return render_template('community/tasks.html', tasks=tasks, user_tasks=user_tasks)
+    return render_template('community/tasks.html', tasks=tasks, user_tasks=user_tasks, next_cursor=task_page['next_cursor'])
 
 @bp.route('/community/task/<int:id>')
 def task(id):
     """任务详情页"""
-    task = Task.query.get_or_404(id)
+    task = tasks_query().get_or_404(id)
     # 获取用户的任务进度
     user_task = None
     if current_user.is_authenticated:
         user_task = UserTask.query.filter_by(user_id=current_user.id, task_id=id).first()
     # 获取任务提交记录
-    submissions = TaskSubmission.query.filter_by(task_id=id).order_by(TaskSubmission.created_at.desc()).all()
+    submissions = task_submissions_query().filter_by(task_id=id).order_by(TaskSubmission.created_at.desc()).all()
     return render_template('community/task.html', task=task, user_task=user_task, submissions=submissions)
 
 @bp.route('/community/task/create', methods=['GET', 'POST'])
@@ -108,6 +137,7 @@ def task_create():
         
         db.session.add(task)
         db.session.commit()
+        community_search_index.index_document('task', task)
         
         flash('任务创建成功！', 'success')
         return redirect(url_for('community.tasks'))
@@ -136,13 +166,22 @@ def task_submit(id):
     form = SubmissionForm()
     if form.validate_on_submit():
         # 验证任务是否需要文件且文件是否已提供
-        if task.file_required and not form.file.data:
+        if task.file_required and not form.file.data and not form.upload_id.data:
             flash('该任务需要上传文件！', 'danger')
             return redirect(url_for('community.task_submit', id=id))
         
         # 处理文件上传
         file_url = None
-        if task.file_required and form.file.data:
+        if task.file_required and form.upload_id.data:
+            # 分片上传的文件已在接收时校验类型和大小
+            try:
+                upload = upload_manager.resolve(form.upload_id.data, current_user.id, 'task', id)
+                upload_manager.consume(upload)
+                file_url = upload.file_url
+            except UploadError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('community.task_submit', id=id))
+        elif task.file_required and form.file.data:
             # 确保文件名安全
             original_filename = form.file.data.filename
             if not original_filename:
@@ -162,20 +201,18 @@ def task_submit(id):
                     flash(f'文件类型不允许！允许的类型：{task.file_types}', 'danger')
                     return redirect(url_for('community.task_submit', id=id))
             
-            # 确保文件大小安全
-            file_size = len(form.file.data.read())
-            form.file.data.seek(0)  # 重置文件指针
+            # 确保文件大小安全（上传内容已暂存，定位到末尾取大小，不读入内存）
+            form.file.data.stream.seek(0, os.SEEK_END)
+            file_size = form.file.data.stream.tell()
+            form.file.data.stream.seek(0)  # 重置文件指针
             max_size = task.file_size_limit * 1024 * 1024  # 转换为字节
             if file_size > max_size:
                 flash(f'文件大小超过限制！最大允许 {task.file_size_limit}MB', 'danger')
                 return redirect(url_for('community.task_submit', id=id))
             
-            # 保存文件
-            upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'tasks')
-            os.makedirs(upload_dir, exist_ok=True)
-            file_path = os.path.join(upload_dir, filename)
-            form.file.data.save(file_path)
-            file_url = url_for('static', filename=f'uploads/tasks/{filename}')
+            # 保存文件到内容寻址存储，同名文件不会互相覆盖
+            _, key = blob_store.save(form.file.data.stream, 'static:uploads/tasks', filename)
+            file_url = url_for('static', filename=key.partition(':')[2])
         
         # 创建或更新提交
         submission = TaskSubmission.query.filter_by(user_task_id=user_task.id).first()
@@ -183,6 +220,9 @@ def task_submit(id):
             # 更新现有提交
             submission.content = form.content.data
             if file_url:
+                # 新文件已带一次引用，旧文件（内容相同时为同一文件）释放原提交持有的引用，无其他引用时由垃圾回收删除
+                if submission.file_url:
+                    blob_store.release(static_key(submission.file_url))
                 submission.file_url = file_url
         else:
             # 创建新提交
@@ -235,19 +275,26 @@ def task_complete(id):
 
 @bp.route('/community/post/<int:id>')
 def post(id):
-    post = Post.query.get_or_404(id)
-    # 增加浏览数
-    post.views += 1
-    db.session.commit()
-    
-    comments = Comment.query.filter_by(post_id=id).order_by(Comment.created_at.asc()).all()
+    post = Post.query.options(joinedload(Post.author)).get_or_404(id)
+    # 浏览数写入计数器缓冲，由后台合并为 views = views + n
+    counter_buffer.incr(Post, id, 'views')
+    counter_buffer.merge([post], 'likes', 'views')
+    analytics_recorder.record('view', 'post', id, user_id=current_user.id if current_user.is_authenticated else None)
+    
+    # 评论按时间正序分页
+    comment_query = Comment.query.filter_by(post_id=id)
+    comment_total = comment_query.count()
+    comment_page = keyset_paginate(comment_query, Comment, request.args.get('cursor'),
+                                   request.args.get('per_page', type=int), descending=False)
+    comments = comment_page['items']
     
     # 检查当前用户是否已点赞
     liked = False
     if current_user.is_authenticated:
         liked = Like.query.filter_by(user_id=current_user.id, post_id=id).first() is not None
     
-    return render_template('community/post.html', post=post, comments=comments, liked=liked)
+    return render_template('community/post.html', post=post, comments=comments, liked=liked,
+                           comment_total=comment_total, next_cursor=comment_page['next_cursor'])
 
 @bp.route('/community/comment/<int:post_id>', methods=['POST'])
 @login_required
@@ -259,6 +306,79 @@ def add_comment(post_id):
         db.session.commit()
         return redirect(url_for('community.post', id=post_id))
 
+# 列表JSON接口（游标分页）
+def _post_to_dict(post):
+    return {
+        'id': post.id,
+        'title': post.title,
+        'content': post.content,
+        'category': post.category,
+        'user_id': post.user_id,
+        'likes': post.likes,
+        'views': post.views,
+        'created_at': post.created_at.isoformat() if post.created_at else None
+    }
+
+def _task_to_dict(task):
+    return {
+        'id': task.id,
+        'title': task.title,
+        'description': task.description,
+        'icon': task.icon,
+        'color': task.color,
+        'task_type': task.task_type,
+        'deadline': task.deadline.isoformat() if task.deadline else None,
+        'reward': task.reward,
+        'created_at': task.created_at.isoformat() if task.created_at else None
+    }
+
+def _comment_to_dict(comment):
+    return {
+        'id': comment.id,
+        'content': comment.content,
+        'user_id': comment.user_id,
+        'created_at': comment.created_at.isoformat() if comment.created_at else None
+    }
+
+def _page_response(page, serializer):
+    return jsonify({
+        'status': 'success',
+        'items': [serializer(item) for item in page['items']],
+        'next_cursor': page['next_cursor'],
+        'has_next': page['has_next']
+    })
+
+@bp.route('/api/community/posts')
+def api_posts():
+    """帖子列表API"""
+    query = Post.query
+    category = request.args.get('category')
+    if category:
+        query = query.filter_by(category=category)
+    page = keyset_paginate(query, Post, request.args.get('cursor'), request.args.get('per_page', type=int))
+    counter_buffer.merge(page['items'], 'likes', 'views')
+    return _page_response(page, _post_to_dict)
+
+@bp.route('/api/community/tasks')
+def api_tasks():
+    """任务列表API"""
+    page = keyset_paginate(Task.query, Task, request.args.get('cursor'), request.args.get('per_page', type=int))
+    return _page_response(page, _task_to_dict)
+
+@bp.route('/api/community/post/<int:id>/comments')
+def api_post_comments(id):
+    """帖子评论列表API"""
+    page = keyset_paginate(Comment.query.filter_by(post_id=id), Comment, request.args.get('cursor'),
+                           request.args.get('per_page', type=int), descending=False)
+    return _page_response(page, _comment_to_dict)
+
+@bp.route('/api/community/story/<int:id>/comments')
+def api_story_comments(id):
+    """故事评论列表API"""
+    page = keyset_paginate(Comment.query.filter_by(story_id=id), Comment, request.args.get('cursor'),
+                           request.args.get('per_page', type=int), descending=False)
+    return _page_response(page, _comment_to_dict)
+
 # 故事评论功能
 @bp.route('/community/story/comment/<int:story_id>', methods=['POST'])
 @login_required
@@ -277,9 +397,11 @@ def add_story_comment(story_id):
 @login_required
 def like_item(type, id):
     if type == 'post':
+        model = Post
         item = Post.query.get_or_404(id)
         like = Like.query.filter_by(user_id=current_user.id, post_id=id).first()
     elif type == 'story':
+        model = Story
         item = Story.query.get_or_404(id)
         like = Like.query.filter_by(user_id=current_user.id, story_id=id).first()
     else:
@@ -288,9 +410,11 @@ def like_item(type, id):
     if like:
         # 取消点赞
         db.session.delete(like)
-        item.likes = max(0, item.likes - 1)
         db.session.commit()
-        return jsonify({'likes': item.likes, 'liked': False})
+        # 点赞记录由唯一约束保证不重复，点赞数只累加增量
+        counter_buffer.incr(model, id, 'likes', -1)
+        analytics_recorder.record('unlike', type, id, user_id=current_user.id)
+        return jsonify({'likes': counter_buffer.value(item, 'likes'), 'liked': False})
     else:
         # 添加点赞
         if type == 'post':
@@ -298,14 +422,23 @@ def like_item(type, id):
         else:
             new_like = Like(user_id=current_user.id, story_id=id)
         db.session.add(new_like)
-        item.likes += 1
         db.session.commit()
-        return jsonify({'likes': item.likes, 'liked': True})
+        counter_buffer.incr(model, id, 'likes')
+        analytics_recorder.record('like', type, id, user_id=current_user.id)
+        return jsonify({'likes': counter_buffer.value(item, 'likes'), 'liked': True})
 
 # 分享功能（模拟分享到社交媒体）
 @bp.route('/community/share/<string:type>/<int:id>', methods=['POST'])
 def share_item(type, id):
-    # 实际应用中可以实现真正的分享功能
+    # 实际应用中可以实现真正的分享功能，这里只记录分享事件
+    if type not in ('post', 'story'):
+        return jsonify({'error': 'Invalid item type'}), 400
+    model = Post if type == 'post' else Story
+    if db.session.query(model.id).filter_by(id=id).first() is None:
+        return jsonify({'error': 'Item not found'}), 404
+    data = request.get_json(silent=True) or request.form
+    analytics_recorder.record('share', type, id, platform=data.get('platform', 'copy'),
+                              user_id=current_user.id if current_user.is_authenticated else None, ip_address=request.remote_addr)
     return jsonify({'success': True, 'message': '分享成功！'})
 
 # 故事相关路由
@@ -314,26 +447,32 @@ def stories():
     # 添加排序和筛选
     sort_by = request.args.get('sort', 'latest')
     if sort_by == 'popular':
-        stories = Story.query.order_by(Story.likes.desc()).limit(10).all()
+        stories = stories_query().order_by(Story.likes.desc()).limit(10).all()
     else:
-        stories = Story.query.order_by(Story.created_at.desc()).limit(10).all()
+        stories = stories_query().order_by(Story.created_at.desc()).limit(10).all()
+    counter_buffer.merge(stories, 'likes', 'views')
     return render_template('community/stories.html', stories=stories)
 
 @bp.route('/community/story/<int:id>')
 def story(id):
-    story = Story.query.get_or_404(id)
-    # 增加浏览数
-    story.views += 1
-    db.session.commit()
+    story = stories_query().get_or_404(id)
+    # 浏览数写入计数器缓冲，由后台合并为 views = views + n
+    counter_buffer.incr(Story, id, 'views')
+    counter_buffer.merge([story], 'likes', 'views')
+    analytics_recorder.record('view', 'story', id, user_id=current_user.id if current_user.is_authenticated else None)
     
-    comments = Comment.query.filter_by(story_id=id).order_by(Comment.created_at.asc()).all()
+    # 评论按时间正序分页
+    comment_page = keyset_paginate(Comment.query.filter_by(story_id=id), Comment, request.args.get('cursor'),
+                                   request.args.get('per_page', type=int), descending=False)
+    comments = comment_page['items']
     
     # 检查当前用户是否已点赞
     liked = False
     if current_user.is_authenticated:
         liked = Like.query.filter_by(user_id=current_user.id, story_id=id).first() is not None
     
-    return render_template('community/story.html', story=story, comments=comments, liked=liked)
+    return render_template('community/story.html', story=story, comments=comments, liked=liked,
+                           next_cursor=comment_page['next_cursor'])
 
 @bp.route('/community/story/create', methods=['GET', 'POST'])
 @login_required
@@ -352,6 +491,7 @@ def create_story():
         
         db.session.add(new_story)
         db.session.commit()
+        community_search_index.index_document('story', new_story)
         flash('故事分享成功！', 'success')
         return redirect(url_for('community.story', id=new_story.id))
     
@@ -388,6 +528,7 @@ def update(id):
                 post.tags.append(tag)
         
         db.session.commit()
+        community_search_index.index_document('post', post)
         flash('帖子更新成功！', 'success')
         return redirect(url_for('community.post', id=post.id))
     
@@ -407,6 +548,7 @@ def delete(id):
     
     db.session.delete(post)
     db.session.commit()
+    community_search_index.remove_document('post', id)
     flash('帖子删除成功！', 'success')
     return redirect(url_for('community.index'))
 
@@ -439,6 +581,7 @@ def create():
         
         db.session.add(post)
         db.session.commit()
+        community_search_index.index_document('post', post)
         flash('帖子发布成功！', 'success')
         return redirect(url_for('community.post', id=post.id))
     
@@ -480,9 +623,6 @@ def dance_start():
 @login_required
 def submit_dance(id):
     """上传参赛作品"""
-    from app import app
-    import os
-    import uuid
     from app.community.forms import DanceSubmissionForm
     dance = Dance.query.get_or_404(id)
     
@@ -492,20 +632,25 @@ def submit_dance(id):
         video_url = form.video_url.data
         from config import allowed_file
         
+        # 分片上传的视频已保存到视频目录
+        if form.upload_id.data:
+            try:
+                upload = upload_manager.resolve(form.upload_id.data, current_user.id, 'dance', id)
+                upload_manager.consume(upload)
+                video_url = upload.stored_name
+            except UploadError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('community.submit_dance', id=id))
         # 检查是否上传了文件
-        if form.video.data and form.video.data.filename != '':
+        elif form.video.data and form.video.data.filename != '':
             video_file = form.video.data
             
             # 检查文件类型
             if video_file and allowed_file(video_file.filename):
-                # 生成唯一文件名
+                # 保存到内容寻址存储，文件名带内容摘要前缀，相同视频只保存一份
                 file_ext = video_file.filename.rsplit('.', 1)[1].lower()
-                filename = f"submission_{current_user.id}_{id}_{str(uuid.uuid4())[:8]}.{file_ext}"
-                # 保存文件到上传目录
-                file_path = os.path.join(app.config['DANCE_VIDEOS_FOLDER'], filename)
-                video_file.save(file_path)
-                # 生成文件URL
-                video_url = filename
+                _, key = blob_store.save(video_file.stream, 'videos:', f"submission_{current_user.id}_{id}.{file_ext}")
+                video_url = key.partition(':')[2]
         
         # 创建参赛作品
         submission = DanceSubmission(
@@ -517,8 +662,9 @@ def submit_dance(id):
         db.session.add(submission)
         db.session.commit()
         
-        # 模拟AI评分（实际应用中应该调用AI评分API）
-        # 这里添加一个延时，模拟AI评分过程
+        # 提交后台AI评分任务和缩略图、预览生成任务
+        scoring_queue.submit_submission(submission.id)
+        media_pipeline.submit('submission', submission.id)
         flash('参赛作品提交成功！正在进行AI评分，请稍后查看结果。', 'success')
         return redirect(url_for('community.dance_submission', id=submission.id))
     
@@ -528,32 +674,19 @@ def submit_dance(id):
 @login_required
 def dance_submission(id):
     """参赛作品详情页"""
-    submission = DanceSubmission.query.get_or_404(id)
+    submission = dance_submissions_query().get_or_404(id)
     
     # 检查用户权限
     if submission.user_id != current_user.id:
         flash('您没有权限查看此参赛作品', 'danger')
         return redirect(url_for('community.dance_competitions'))
     
-    # 如果作品处于待评分状态，模拟AI评分
+    # 作品仍待评分（如提交时入队失败）时补充入队，评分在后台执行
     if submission.status == 'pending':
-        # 模拟AI评分过程，使用update_score方法更新所有评分字段
-        score_result = {
-            "overall": round(random.uniform(80, 100), 1),
-            "dimensions": {
-                "accuracy": round(random.uniform(80, 95), 1),
-                "rhythm": round(random.uniform(80, 95), 1),
-                "expression": round(random.uniform(80, 95), 1),
-                "completeness": round(random.uniform(80, 95), 1)
-            },
-            "feedback": ["动作整体流畅，但手臂动作可以更舒展", "节奏感良好，建议在跳跃动作时加强爆发力"],
-            "suggestions": ["注意膝盖伸直，保持身体挺拔", "加强手臂力量训练，提升动作幅度"]
-        }
-        
-        submission.update_score(score_result)
-        db.session.commit()
+        scoring_queue.submit_submission(submission.id)
     
-    return render_template('community/dance_submission.html', submission=submission)
+    return render_template('community/dance_submission.html', submission=submission,
+                           score_job_id=f'submission-{submission.id}')
 
 @bp.route('/community/dance-result-general')
 @login_required
@@ -606,24 +739,48 @@ def dance_ranking(id):
     # 获取所有舞蹈模板
     dances = Dance.query.filter_by(competition_id=id).all()
     
-    # 获取每个舞蹈的所有评分作品，并按分数降序排列
-    rankings = {}
-    for dance in dances:
-        # 获取所有已评分的作品，按分数降序排列
-        submissions = DanceSubmission.query.filter(
-            DanceSubmission.dance_id == dance.id, 
-            DanceSubmission.status == 'scored',
-            DanceSubmission.score.isnot(None)  # 确保只包含有分数的作品
-        ).order_by(DanceSubmission.score.desc()).all()
-        rankings[dance.id] = submissions
-    
-    return render_template('community/dance_ranking.html', competition=competition, dances=dances, rankings=rankings)
+    # 从物化排行榜获取每支舞蹈的前几名作品
+    rankings = dance_leaderboard.top_submissions_for_dances([dance.id for dance in dances], limit=RANKING_TOP_K)
+    
+    # 当前用户在比赛中的名次
+    my_rank = None
+    if current_user.is_authenticated:
+        my_rank = dance_leaderboard.rank_of('competition', id, current_user.id)
+    
+    return render_template('community/dance_ranking.html', competition=competition, dances=dances, rankings=rankings, my_rank=my_rank)
+
+@bp.route('/api/dance/leaderboard/<string:scope>/<int:scope_id>')
+def leaderboard(scope, scope_id):
+    """排行榜分页API，scope 为 dance 或 competition"""
+    if scope not in LEADERBOARD_SCOPES:
+        return jsonify({'status': 'error', 'message': '无效的排行榜类型'}), 400
+    page = request.args.get('page', 1, type=int)
+    per_page = max(min(request.args.get('per_page', 20, type=int), 100), 1)
+    result = dance_leaderboard.top(scope, scope_id, page, per_page)
+    return jsonify(dict(result, status='success'))
+
+@bp.route('/api/dance/leaderboard/<string:scope>/<int:scope_id>/rank')
+def leaderboard_rank(scope, scope_id):
+    """查询用户名次API，默认查询当前登录用户"""
+    if scope not in LEADERBOARD_SCOPES:
+        return jsonify({'status': 'error', 'message': '无效的排行榜类型'}), 400
+    user_id = request.args.get('user_id', type=int)
+    if user_id is None and current_user.is_authenticated:
+        user_id = current_user.id
+    if user_id is None:
+        return jsonify({'status': 'error', 'message': '缺少user_id参数'}), 400
+    rank = dance_leaderboard.rank_of(scope, scope_id, user_id)
+    if rank is None:
+        return jsonify({'status': 'success', 'ranked': False})
+    return jsonify(dict(rank, status='success', ranked=True))
 
 @bp.route('/community/dance-selection')
 def dance_selection():
     """舞蹈选择页面"""
     # 获取所有舞蹈
     dances = Dance.query.all()
+    # 尚未生成缩略图的舞蹈提交后台处理，处理完成前显示默认缩略图
+    media_pipeline.submit_pending('dance', dances)
     
     # 提取所有可用的分类
     categories = set()
@@ -648,7 +805,7 @@ def dance_selection():
         'category': dance.ethnicity,
         'difficulty': difficulty_map.get(dance.difficulty, 'medium'),
         'duration': 120,  # 默认值，模型中没有duration字段
-        'thumbnail_url': '/static/images/1e025e36bd5827162b1868f84017bc19.png',
+        'thumbnail_url': media_pipeline.thumbnail(dance),
         'video_url': '/static/videos/dance/placeholder.html'  # 使用占位符HTML文件作为视频源
     })
     
@@ -674,7 +831,8 @@ def dance_practice(id):
         'category': dance.ethnicity,
         'difficulty': difficulty_map.get(dance.difficulty, 'medium'),
         'duration': 120,  # 默认值，模型中没有duration字段
-        'thumbnail_url': '/static/images/1e025e36bd5827162b1868f84017bc19.png',
+        'thumbnail_url': media_pipeline.thumbnail(dance),
+        'poster_url': dance.poster_url,
         'video_url': '/static/videos/dance/placeholder.html'  # 使用占位符HTML文件作为视频源
     }
     
@@ -744,259 +902,143 @@ def dance_result(id):
 
 @bp.route('/api/dance/score', methods=['POST'])
 def score_dance():
-    """AI评分API（模拟）"""
-    data = request.get_json()
-    video_url = data.get('video_url')
-    dance_id = data.get('dance_id')
-    submission_id = data.get('submission_id')  # 新增：参赛作品ID
+    """AI评分API（模拟），评分在后台队列中执行，立即返回任务ID；任务状态只保存在当前进程中"""
+    data = request.get_json() or {}
+    
+    # 练习序列按种子缓存，种子须为非负整数
+    seed = data.get('seed')
+    if seed is not None:
+        try:
+            seed = int(seed)
+            if seed < 0:
+                raise ValueError('seed不能为负数')
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({"status": "error", "message": "seed参数无效"}), 400
+    
+    # 提交评分任务，提供submission_id时评分完成后同步更新参赛作品
+    job_id = scoring_queue.submit_practice({
+        'video_url': data.get('video_url'),
+        'dance_id': data.get('dance_id'),
+        'submission_id': data.get('submission_id'),
+        'confidence': data.get('confidence', 0.8),
+        'seed': seed
+    })
     
-    # 模拟AI动作捕捉和评分
+    return jsonify({
+        "job_id": job_id,
+        "status_url": url_for('community.score_status', job_id=job_id),
+        "events_url": url_for('community.score_events', job_id=job_id),
+        "status": "queued",
+        "message": "评分任务已提交"
+    }), 202
+
+@bp.route('/api/dance/score/<string:job_id>', methods=['GET'])
+def score_status(job_id):
+    """查询评分任务状态"""
+    job = scoring_queue.get_job(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "评分任务不存在"}), 404
+    return jsonify({"status": "success", "job": job})
+
+@bp.route('/api/dance/score/<string:job_id>/events', methods=['GET'])
+def score_events(job_id):
+    """以SSE推送评分任务状态，任务完成或超时后结束；连接数达到上限时返回429和当前状态，由客户端轮询"""
+    import json
     import time
     
-    # 模拟动作捕捉过程
-    time.sleep(0.5)  # 模拟动作捕捉延迟
-    
-    # 从AI模型获取实际数据（这里模拟）
-    confidence = data.get('confidence', 0.8)
-    
-    # 计算评分，使用config.py中的权重配置
-    from config import Config
-    
-    # 生成详细的动作评分
-    accuracy = round(80 + confidence * 10, 1)  # 动作准确性
-    rhythm = round(85, 1)  # 节奏把握
-    expression = round(82, 1)  # 表现力
-    completeness = round(88, 1)  # 完整性
-    technique = round(75 + confidence * 5, 1)  # 技巧难度
-    
-    # 计算总分
-    total_score = round((accuracy + rhythm + expression + completeness + technique) / 5, 1)
-    
-    # 多维度评分，支持中文字段名
-    score_details = {
-        '动作准确性': accuracy,
-        '节奏把握': rhythm,
-        '表现力': expression,
-        '完整性': completeness,
-        '技巧难度': technique
-    }
-    
-    # 生成AI反馈和建议
-    feedback = [
-        "动作整体流畅，但手臂动作可以更舒展",
-        "节奏感良好，建议在跳跃动作时加强爆发力",
-        "表情生动，继续保持",
-        "动作完成度高，细节处理到位"
-    ]
-    
-    suggestions = [
-        "注意膝盖伸直，保持身体挺拔",
-        "加强手臂力量训练，提升动作幅度",
-        "尝试增加面部表情，增强表现力",
-        "注意动作的连贯性，减少停顿"
-    ]
-    
-    # 生成动作序列数据（用于小人跟跳）
-    # 生成更流畅的动作序列，包含动作过渡和节奏变化
-    action_sequence = []
-    
-    # 定义舞蹈动作序列模板，根据舞蹈类型调整动作分布
-    dance_templates = {
-        "default": [
-            {"action": "step", "duration": 8, "weight": 0.3},
-            {"action": "wave", "duration": 4, "weight": 0.2},
-            {"action": "dance", "duration": 6, "weight": 0.2},
-            {"action": "spin", "duration": 3, "weight": 0.1},
-            {"action": "pose", "duration": 2, "weight": 0.1},
-            {"action": "jump", "duration": 3, "weight": 0.05},
-            {"action": "kick", "duration": 2, "weight": 0.03},
-            {"action": "twist", "duration": 3, "weight": 0.02},
-            {"action": "hips", "duration": 4, "weight": 0.05},  # 新增扭臀动作
-            {"action": "raise", "duration": 3, "weight": 0.05}  # 新增抬手动作
-        ]
-    }
-    
-    # 根据舞蹈难度调整动作复杂度
-    template = dance_templates["default"]
-    
-    # 生成200个动作帧，提供更流畅的动画
-    current_frame = 0
-    while current_frame < 200:
-        # 根据权重选择动作
-        total_weight = sum(action["weight"] for action in template)
-        random_value = random.uniform(0, total_weight)
-        selected_action = None
-        cumulative_weight = 0
-        
-        for action in template:
-            cumulative_weight += action["weight"]
-            if random_value <= cumulative_weight:
-                selected_action = action
-                break
-        
-        if selected_action:
-            # 生成当前动作的多个帧，确保动作流畅
-            for i in range(selected_action["duration"]):
-                if current_frame >= 200:
-                    break
-                    
-                # 生成更自然的位置变化，避免突变
-                base_x = current_frame * 0.2  # 轻微左右移动
-                x = round(base_x % 100 - 50 + random.uniform(-10, 10), 2)
-                y = round(random.uniform(-20, 10), 2)  # 垂直位置变化较小
-                z = round(random.uniform(0, 5), 2)
-                
-                # 根据动作类型调整旋转
-                if selected_action["action"] == "spin":
-                    # 旋转动作时，旋转角度随时间变化
-                    rotation_y = round((current_frame * 10) % 360, 2)
-                elif selected_action["action"] == "twist":
-                    # 扭曲动作时，旋转角度在较小范围内变化
-                    rotation_y = round(random.uniform(-30, 30), 2)
-                elif selected_action["action"] == "hips":
-                    # 扭臀动作时，旋转角度随时间变化
-                    rotation_y = round(math.sin(current_frame * 0.5) * 30, 2)
-                else:
-                    # 其他动作时，旋转角度变化较小
-                    rotation_y = round(random.uniform(-15, 15), 2)
-                
-                action_sequence.append({
-                    "frame": current_frame,
-                    "action": selected_action["action"],
-                    "position": {
-                        "x": x,
-                        "y": y,
-                        "z": z
-                    },
-                    "rotation": {
-                        "x": round(random.uniform(-5, 5), 2),  # 上下旋转较小
-                        "y": rotation_y,
-                        "z": round(random.uniform(-5, 5), 2)   # 左右旋转较小
-                    },
-                    "timestamp": current_frame * 0.08  # 调整帧率，使动画更流畅
-                })
-                current_frame += 1
-    
-    # 生成AI评分结果
-    score_result = {
-        "overall": total_score,
-        "dimensions": score_details,
-        "feedback": feedback,
-        "suggestions": suggestions
-    }
-    
-    # 如果提供了submission_id，更新数据库
-    if submission_id:
-        submission = DanceSubmission.query.get(submission_id)
-        if submission:
-            submission.update_score(score_result)
-            db.session.commit()
-    
-    return jsonify({
-        "score": total_score,
-        "score_result": score_result,
-        "action_sequence": action_sequence,
-        "status": "success",
-        "message": "动作捕捉和评分完成"
-    })
+    job = scoring_queue.get_job(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "评分任务不存在"}), 404
+    if not _score_event_streams.acquire(blocking=False):
+        response = jsonify({
+            "status": "error",
+            "message": "推送连接已满，请轮询任务状态",
+            "status_url": url_for('community.score_status', job_id=job_id),
+            "job": job
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = '2'
+        return response
+    
+    def generate():
+        last_status = None
+        deadline = time.time() + SCORE_EVENTS_TIMEOUT
+        while time.time() < deadline:
+            job = scoring_queue.get_job(job_id)
+            if not job:
+                yield 'event: error\ndata: {"message": "评分任务不存在"}\n\n'
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"data: {json.dumps(job, ensure_ascii=False)}\n\n"
+            if job['status'] in SCORING_FINISHED_STATES:
+                return
+            time.sleep(0.5)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # 响应关闭时（包括客户端提前断开、生成器未开始执行）释放连接名额
+    response.call_on_close(_score_event_streams.release)
+    return response
 
 
-@bp.route('/api/dance/generate_actions', methods=['POST'])
+@bp.route('/api/dance/generate_actions', methods=['GET', 'POST'])
 def generate_actions():
-    """AI动作序列生成API"""
-    data = request.get_json()
+    """AI动作序列生成API，相同参数返回相同序列，支持ETag协商缓存"""
+    import json
+    
+    data = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
     dance_type = data.get('dance_type', 'default')
-    difficulty = data.get('difficulty', 'medium')
     duration = data.get('duration', 120)  # 单位：秒
-    
-    # 生成个性化动作序列
-    action_sequence = []
-    
-    # 根据难度调整动作复杂度
-    difficulty_map = {
-        '初级': 'easy',
-        '中级': 'medium',
-        '高级': 'hard',
-        'easy': 'easy',
-        'medium': 'medium',
-        'hard': 'hard'
-    }
-    difficulty = difficulty_map.get(difficulty, 'medium')  # 默认使用medium难度
-
-    difficulty_factor = {
-        'easy': 0.7,
-        'medium': 1.0,
-        'hard': 1.3
-    }[difficulty]
-    
-    # 生成动作序列
-    frame_count = int(duration * 12.5)  # 12.5fps
-    current_frame = 0
-    
-    # 动作类型权重
-    action_weights = {
-        'step': 0.3,
-        'wave': 0.2,
-        'dance': 0.2,
-        'spin': 0.1,
-        'pose': 0.08,
-        'jump': 0.06,
-        'kick': 0.03,
-        'twist': 0.02
-    }
-    
-    # 生成动作序列
-    while current_frame < frame_count:
-        # 随机选择动作
-        total_weight = sum(action_weights.values())
-        random_value = random.uniform(0, total_weight)
-        selected_action = None
-        cumulative_weight = 0
-        
-        for action, weight in action_weights.items():
-            cumulative_weight += weight
-            if random_value <= cumulative_weight:
-                selected_action = action
-                break
-        
-        if selected_action:
-            # 生成当前动作的帧
-            for i in range(3):  # 每个动作持续3帧
-                if current_frame >= frame_count:
-                    break
-                    
-                # 生成位置和旋转
-                x = round(math.sin(current_frame * 0.1) * 20, 2)
-                y = round(math.cos(current_frame * 0.1) * 10, 2)
-                z = 0
-                
-                rotation_y = round(random.uniform(-15, 15), 2)
-                
-                action_sequence.append({
-                    "frame": current_frame,
-                    "action": selected_action,
-                    "position": {
-                        "x": x,
-                        "y": y,
-                        "z": z
-                    },
-                    "rotation": {
-                        "x": 0,
-                        "y": rotation_y,
-                        "z": 0
-                    },
-                    "timestamp": current_frame * 0.08
-                })
-                current_frame += 1
-    
-    return jsonify({
-        "action_sequence": action_sequence,
-        "dance_type": dance_type,
-        "difficulty": difficulty,
-        "duration": duration,
-        "status": "success",
-        "message": "动作序列生成完成"
-    })
+    output_format = data.get('format', 'frames')  # frames：逐帧字典，columnar：列式数组
+    if output_format != 'columnar':
+        output_format = 'frames'
+    
+    # 根据难度调整动作复杂度，默认使用medium难度
+    difficulty = normalize_difficulty(data.get('difficulty', 'medium'))
+    
+    try:
+        duration = float(duration)
+        if not math.isfinite(duration):
+            raise ValueError('duration必须是有限数值')
+        duration = min(max(duration, 0.0), ACTION_MAX_DURATION)
+        # 未指定种子时由舞蹈类型、难度和时长推导，同一组合总是得到同一序列
+        seed = int(data['seed']) if data.get('seed') is not None else derive_seed(dance_type, difficulty, duration)
+        if seed < 0:
+            raise ValueError('seed不能为负数')
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({"status": "error", "message": "duration或seed参数无效"}), 400
+    
+    # 序列由参数唯一确定，ETag匹配时无需生成直接返回304
+    key = ('actions', dance_type, difficulty, duration, seed, output_format)
+    etag = make_etag(*key)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    def build():
+        # 批量生成动作序列，缓存序列化后的响应体
+        arrays = generate_action_arrays(duration, seed)
+        body = {
+            "dance_type": dance_type,
+            "difficulty": difficulty,
+            "duration": duration,
+            "seed": seed,
+            "status": "success",
+            "message": "动作序列生成完成"
+        }
+        if output_format == 'columnar':
+            body["actions"] = to_columnar(arrays)
+        else:
+            body["action_sequence"] = to_frames(arrays)
+        return json.dumps(body, ensure_ascii=False)
+    
+    response = Response(action_sequence_cache.get_or_create(key, build), mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = action_sequence_cache.ttl
+    return response
 
 
 @bp.route('/api/dance/recommend', methods=['GET'])
@@ -1118,61 +1160,196 @@ def get_feedback():
 @bp.route('/api/dance/share', methods=['POST'])
 def record_share():
     """记录分享统计"""
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     submission_id = data.get('submission_id')
     platform = data.get('platform', 'copy')
     
-    # 更新分享次数
+    # 分享次数写入计数器缓冲，由后台合并为 share_count = share_count + n
     submission = DanceSubmission.query.get_or_404(submission_id)
-    submission.share_count += 1
-    
-    # 创建分享记录
-    share = Share(
-        submission_id=submission_id,
-        platform=platform,
-        ip_address=request.remote_addr
-    )
+    counter_buffer.incr(DanceSubmission, submission_id, 'share_count')
     
-    # 如果用户已登录，记录用户ID
-    if current_user.is_authenticated:
-        share.user_id = current_user.id
-    
-    db.session.add(share)
-    db.session.commit()
+    # 分享明细写入事件缓冲区，由后台批量写入并汇总
+    analytics_recorder.record('share', 'submission', submission_id, platform=platform,
+                              user_id=current_user.id if current_user.is_authenticated else None, ip_address=request.remote_addr)
     
     return jsonify({
         "status": "success",
         "message": "分享记录成功",
-        "share_count": submission.share_count
+        "share_count": counter_buffer.value(submission, 'share_count')
     })
 
+@bp.route('/api/analytics/<string:entity_type>/<int:entity_id>')
+def analytics(entity_type, entity_id):
+    """
+    互动统计API：对象某种事件的时间序列及最近30天按事件、平台的汇总
+    参数：event（share/like/unlike/view）、granularity（minute/hour/day）、periods、platform
+    """
+    if entity_type not in ANALYTICS_ENTITY_TYPES:
+        return jsonify({'status': 'error', 'message': '无效的对象类型'}), 400
+    return _analytics_response(entity_type, entity_id)
+
+@bp.route('/api/analytics/site')
+def site_analytics():
+    """全站互动统计API，参数同上，platforms 为各平台的分享次数"""
+    return _analytics_response(ANALYTICS_ALL_ENTITIES, 0)
+
+def _analytics_response(entity_type, entity_id):
+    event_type = request.args.get('event', 'share')
+    granularity = request.args.get('granularity', 'hour')
+    periods = request.args.get('periods', 60 if granularity == 'minute' else 24, type=int)
+    try:
+        series = analytics_recorder.series(entity_type, entity_id, event_type, granularity, periods,
+                                           request.args.get('platform'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({
+        'status': 'success',
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'event': event_type,
+        'granularity': granularity,
+        'series': series,
+        'totals': analytics_recorder.totals(entity_type, entity_id)
+    })
+
+# 分片上传（tus 协议）：POST 创建，HEAD 查询偏移量，PATCH 追加数据，DELETE 取消
+def _tus_response(body=None, status=200, headers=None):
+    response = jsonify(body) if body is not None else current_app.response_class(status=status)
+    response.status_code = status
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    response.headers['Cache-Control'] = 'no-store'
+    for key, value in (headers or {}).items():
+        response.headers[key] = str(value)
+    return response
+
+def _upload_to_dict(upload):
+    return {
+        'id': upload.id,
+        'purpose': upload.purpose,
+        'target_id': upload.target_id,
+        'filename': upload.filename,
+        'offset': upload.upload_offset,
+        'length': upload.upload_length,
+        'status': upload.status,
+        'checksum': upload.checksum,
+        'file_url': upload.file_url,
+        'error': upload.error
+    }
+
+@bp.route('/api/uploads', methods=['OPTIONS', 'POST'])
+@login_required
+def create_upload():
+    """
+    创建分片上传
+    请求头：Upload-Length（总字节数）、Upload-Metadata（filename、purpose=task/dance、target_id，值为base64）
+    """
+    if request.method == 'OPTIONS':
+        return _tus_response(status=204, headers={
+            'Tus-Version': TUS_VERSION,
+            'Tus-Extension': TUS_EXTENSIONS,
+            'Tus-Checksum-Algorithm': 'sha256,sha1,md5',
+            'Tus-Max-Size': upload_manager.dance_max_size
+        })
+    try:
+        metadata = parse_metadata(request.headers.get('Upload-Metadata'))
+        length = request.headers.get('Upload-Length', type=int)
+        target_id = int(metadata.get('target_id', ''))
+        if length is None:
+            raise UploadError('缺少 Upload-Length')
+        upload = upload_manager.create(current_user.id, metadata.get('purpose'), target_id,
+                                       metadata.get('filename'), length)
+    except UploadError as e:
+        return _tus_response({'status': 'error', 'message': str(e)}, e.status)
+    except ValueError:
+        return _tus_response({'status': 'error', 'message': 'target_id 无效'}, 400)
+    return _tus_response({'status': 'success', 'upload': _upload_to_dict(upload)}, 201, {
+        'Location': url_for('community.upload_resource', upload_id=upload.id),
+        'Upload-Offset': 0
+    })
+
+@bp.route('/api/uploads/<string:upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+@login_required
+def upload_resource(upload_id):
+    """查询（HEAD返回偏移量，GET返回状态）、追加数据或取消分片上传"""
+    upload = upload_manager.get(upload_id, current_user.id)
+    if upload is None:
+        return _tus_response({'status': 'error', 'message': '上传不存在'}, 404)
+    
+    if request.method == 'HEAD':
+        return _tus_response(status=200, headers={
+            'Upload-Offset': upload.upload_offset,
+            'Upload-Length': upload.upload_length
+        })
+    if request.method == 'GET':
+        return _tus_response({'status': 'success', 'upload': _upload_to_dict(upload)})
+    if request.method == 'DELETE':
+        upload_manager.terminate(upload)
+        return _tus_response(status=204)
+    
+    if request.mimetype != 'application/offset+octet-stream':
+        return _tus_response({'status': 'error', 'message': 'Content-Type 应为 application/offset+octet-stream'}, 415)
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return _tus_response({'status': 'error', 'message': '缺少 Upload-Offset'}, 400)
+    try:
+        new_offset = upload_manager.write(upload, offset, request.stream, request.headers.get('Upload-Checksum'))
+    except UploadError as e:
+        return _tus_response({'status': 'error', 'message': str(e)}, e.status,
+                             {'Upload-Offset': upload_manager.get(upload_id, current_user.id).upload_offset})
+    return _tus_response(status=204, headers={'Upload-Offset': new_offset})
+
 @bp.route('/community/search')
 def search():
     """全局搜索功能"""
     query = request.args.get('q', '').strip()
     if not query:
         return redirect(url_for('community.index'))
+    page = request.args.get('page', 1, type=int)
     
-    # 搜索任务
-    tasks = Task.query.filter(
-        (Task.title.contains(query)) |
-        (Task.description.contains(query))
-    ).all()
-    
-    # 搜索故事
-    stories = Story.query.filter(
-        (Story.title.contains(query)) |
-        (Story.content.contains(query))
-    ).all()
-    
-    # 搜索帖子
-    posts = Post.query.filter(
-        (Post.title.contains(query)) |
-        (Post.content.contains(query))
-    ).all()
+    # 通过倒排索引检索并按相关度分页
+    result = community_search_index.search(query, page=page, per_page=SEARCH_PER_PAGE)
+    loaded = community_search_index.load_hits(result['hits'])
     
     return render_template('community/search.html',
                           query=query,
-                          tasks=tasks,
-                          stories=stories,
-                          posts=posts)
\ No newline at end of file
+                          tasks=loaded['task'],
+                          stories=loaded['story'],
+                          posts=loaded['post'],
+                          total=result['total'],
+                          page=result['page'],
+                          pages=result['pages'])
+
+@bp.route('/api/community/search')
+def api_search():
+    """全局搜索API，返回按相关度排序的分页结果"""
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = max(min(request.args.get('per_page', SEARCH_PER_PAGE, type=int), 100), 1)
+    doc_types = request.args.getlist('type') or None
+    
+    result = community_search_index.search(query, page=page, per_page=per_page, doc_types=doc_types)
+    loaded = community_search_index.load_hits(result['hits'])
+    objects = {(doc_type, obj.id): obj for doc_type, objs in loaded.items() for obj in objs}
+    
+    items = []
+    for hit in result['hits']:
+        obj = objects.get((hit['type'], hit['id']))
+        if not obj:
+            continue
+        items.append({
+            'type': hit['type'],
+            'id': hit['id'],
+            'score': hit['score'],
+            'title': obj.title,
+            'created_at': obj.created_at.isoformat() if obj.created_at else None
+        })
+    
+    return jsonify({
+        'status': 'success',
+        'query': query,
+        'items': items,
+        'total': result['total'],
+        'page': result['page'],
+        'per_page': result['per_page'],
+        'pages': result['pages']
+    })
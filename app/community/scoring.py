@@ -0,0 +1,469 @@
+import time
+import math
+import uuid
+import queue
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+from flask import has_app_context
+from sqlalchemy import update, or_, and_
+from app import db
+from app.community.models import DanceSubmission
+from app.community.sequence_cache import action_sequence_cache, derive_seed
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('DanceScoring')
+
+# 任务状态，作品任务的状态同时写入 DanceSubmission.status
+QUEUED = 'queued'
+SCORING = 'scoring'
+SCORED = 'scored'
+FAILED = 'failed'
+FINISHED_STATES = (SCORED, FAILED)
+
+# 舞蹈动作序列模板，根据舞蹈类型调整动作分布
+DANCE_TEMPLATES = {
+    "default": [
+        {"action": "step", "duration": 8, "weight": 0.3},
+        {"action": "wave", "duration": 4, "weight": 0.2},
+        {"action": "dance", "duration": 6, "weight": 0.2},
+        {"action": "spin", "duration": 3, "weight": 0.1},
+        {"action": "pose", "duration": 2, "weight": 0.1},
+        {"action": "jump", "duration": 3, "weight": 0.05},
+        {"action": "kick", "duration": 2, "weight": 0.03},
+        {"action": "twist", "duration": 3, "weight": 0.02},
+        {"action": "hips", "duration": 4, "weight": 0.05},  # 扭臀动作
+        {"action": "raise", "duration": 3, "weight": 0.05}  # 抬手动作
+    ]
+}
+
+def generate_practice_sequence(frame_total: int = 200, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """生成评分结果附带的动作序列（用于小人跟跳），包含动作过渡和节奏变化，同一种子生成相同序列"""
+    rng = random.Random(seed)
+    action_sequence = []
+    template = DANCE_TEMPLATES["default"]
+
+    current_frame = 0
+    while current_frame < frame_total:
+        # 根据权重选择动作
+        total_weight = sum(action["weight"] for action in template)
+        random_value = rng.uniform(0, total_weight)
+        selected_action = None
+        cumulative_weight = 0
+
+        for action in template:
+            cumulative_weight += action["weight"]
+            if random_value <= cumulative_weight:
+                selected_action = action
+                break
+
+        if selected_action:
+            # 生成当前动作的多个帧，确保动作流畅
+            for i in range(selected_action["duration"]):
+                if current_frame >= frame_total:
+                    break
+
+                # 生成更自然的位置变化，避免突变
+                base_x = current_frame * 0.2  # 轻微左右移动
+                x = round(base_x % 100 - 50 + rng.uniform(-10, 10), 2)
+                y = round(rng.uniform(-20, 10), 2)  # 垂直位置变化较小
+                z = round(rng.uniform(0, 5), 2)
+
+                # 根据动作类型调整旋转
+                if selected_action["action"] == "spin":
+                    rotation_y = round((current_frame * 10) % 360, 2)
+                elif selected_action["action"] == "twist":
+                    rotation_y = round(rng.uniform(-30, 30), 2)
+                elif selected_action["action"] == "hips":
+                    rotation_y = round(math.sin(current_frame * 0.5) * 30, 2)
+                else:
+                    rotation_y = round(rng.uniform(-15, 15), 2)
+
+                action_sequence.append({
+                    "frame": current_frame,
+                    "action": selected_action["action"],
+                    "position": {
+                        "x": x,
+                        "y": y,
+                        "z": z
+                    },
+                    "rotation": {
+                        "x": round(rng.uniform(-5, 5), 2),  # 上下旋转较小
+                        "y": rotation_y,
+                        "z": round(rng.uniform(-5, 5), 2)   # 左右旋转较小
+                    },
+                    "timestamp": current_frame * 0.08  # 调整帧率，使动画更流畅
+                })
+                current_frame += 1
+    return action_sequence
+
+def score_practice(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    练习评分（模拟AI动作捕捉和评分）
+
+    Args:
+        payload: 请求数据，包含 video_url、dance_id、confidence，可选 seed
+
+    Returns:
+        包含 score、score_result、action_sequence 的结果
+    """
+    # 模拟动作捕捉过程
+    time.sleep(0.5)
+
+    # 同一支舞蹈默认使用固定种子，跟跳序列从缓存读取
+    dance_id = payload.get('dance_id')
+    seed = payload.get('seed')
+    if seed is None:
+        seed = derive_seed('practice', dance_id)
+    action_sequence = action_sequence_cache.get_or_create(
+        ('practice', dance_id, seed), lambda: generate_practice_sequence(seed=seed))
+
+    # 从AI模型获取实际数据（这里模拟）
+    confidence = payload.get('confidence', 0.8)
+
+    # 生成详细的动作评分
+    accuracy = round(80 + confidence * 10, 1)  # 动作准确性
+    rhythm = round(85, 1)  # 节奏把握
+    expression = round(82, 1)  # 表现力
+    completeness = round(88, 1)  # 完整性
+    technique = round(75 + confidence * 5, 1)  # 技巧难度
+
+    # 计算总分
+    total_score = round((accuracy + rhythm + expression + completeness + technique) / 5, 1)
+
+    # 多维度评分，支持中文字段名
+    score_details = {
+        '动作准确性': accuracy,
+        '节奏把握': rhythm,
+        '表现力': expression,
+        '完整性': completeness,
+        '技巧难度': technique
+    }
+
+    # 生成AI反馈和建议
+    feedback = [
+        "动作整体流畅，但手臂动作可以更舒展",
+        "节奏感良好，建议在跳跃动作时加强爆发力",
+        "表情生动，继续保持",
+        "动作完成度高，细节处理到位"
+    ]
+
+    suggestions = [
+        "注意膝盖伸直，保持身体挺拔",
+        "加强手臂力量训练，提升动作幅度",
+        "尝试增加面部表情，增强表现力",
+        "注意动作的连贯性，减少停顿"
+    ]
+
+    return {
+        "score": total_score,
+        "score_result": {
+            "overall": total_score,
+            "dimensions": score_details,
+            "feedback": feedback,
+            "suggestions": suggestions
+        },
+        "action_sequence": action_sequence
+    }
+
+def score_submission(submission: DanceSubmission) -> Dict[str, Any]:
+    """参赛作品评分（模拟AI评分过程）"""
+    score_result = {
+        "overall": round(random.uniform(80, 100), 1),
+        "dimensions": {
+            "accuracy": round(random.uniform(80, 95), 1),
+            "rhythm": round(random.uniform(80, 95), 1),
+            "expression": round(random.uniform(80, 95), 1),
+            "completeness": round(random.uniform(80, 95), 1)
+        },
+        "feedback": ["动作整体流畅，但手臂动作可以更舒展", "节奏感良好，建议在跳跃动作时加强爆发力"],
+        "suggestions": ["注意膝盖伸直，保持身体挺拔", "加强手臂力量训练，提升动作幅度"]
+    }
+    return {"score": score_result["overall"], "score_result": score_result}
+
+class ScoringQueue:
+    """舞蹈评分任务队列：请求线程只负责入队，评分在后台工作线程中执行，失败自动重试"""
+
+    def __init__(self):
+        """初始化评分队列，工作线程在首次入队时启动"""
+        self.logger = logger
+        self.app = None
+        self.workers = 2
+        self.max_retries = 3
+        self.retry_delay = 1.0
+        self.result_ttl = 600
+        self.stall_timeout = 300
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._started = False
+
+    def init_app(self, app):
+        """读取配置并绑定应用"""
+        self.app = app
+        self.workers = app.config.get('SCORING_WORKERS', self.workers)
+        self.max_retries = app.config.get('SCORING_MAX_RETRIES', self.max_retries)
+        self.retry_delay = app.config.get('SCORING_RETRY_DELAY', self.retry_delay)
+        self.result_ttl = app.config.get('SCORING_RESULT_TTL', self.result_ttl)
+        self.stall_timeout = app.config.get('SCORING_STALL_TIMEOUT', self.stall_timeout)
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'dance-scoring-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+        self.recover()
+
+    def _new_job(self, job_id: str, kind: str, payload: Dict[str, Any],
+                 submission_id: Optional[int] = None) -> Dict[str, Any]:
+        now = datetime.now().isoformat()
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'status': QUEUED,
+            'attempts': 0,
+            'submission_id': submission_id,
+            'payload': payload,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+        return job
+
+    def _prune(self):
+        """清理已过期的已完成任务"""
+        deadline = time.time() - self.result_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job['status'] in FINISHED_STATES and job.get('finished_at', time.time()) < deadline]:
+            del self._jobs[job_id]
+
+    def submit_practice(self, payload: Dict[str, Any]) -> str:
+        """
+        提交练习评分任务
+
+        Returns:
+            任务ID
+        """
+        self._ensure_started()
+        job = self._new_job(uuid.uuid4().hex, 'practice', payload, payload.get('submission_id'))
+        if job['submission_id']:
+            self._mark_submission(job['submission_id'], QUEUED)
+        self._queue.put(job['id'])
+        return job['id']
+
+    def submit_submission(self, submission_id: int) -> str:
+        """
+        提交参赛作品评分任务，同一作品重复提交时复用未完成的任务
+
+        Returns:
+            任务ID
+        """
+        self._ensure_started()
+        job_id = f'submission-{submission_id}'
+        with self._lock:
+            existing = self._jobs.get(job_id)
+        if existing and existing['status'] not in FINISHED_STATES:
+            return job_id
+        self._new_job(job_id, 'submission', {}, submission_id)
+        self._mark_submission(submission_id, QUEUED)
+        self._queue.put(job_id)
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询任务状态，作品任务不在内存中时（如服务重启或由其他进程评分）从数据库读取。
+        练习任务只保存在受理请求的进程内存中，多进程部署时须将状态查询路由到同一进程
+
+        Returns:
+            任务状态，不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return {key: value for key, value in job.items() if key != 'payload'}
+        if job_id.startswith('submission-'):
+            try:
+                submission = DanceSubmission.query.get(int(job_id.split('-', 1)[1]))
+            except ValueError:
+                return None
+            if submission:
+                return {
+                    'id': job_id,
+                    'kind': 'submission',
+                    'status': submission.status,
+                    'submission_id': submission.id,
+                    'result': {'score': submission.score} if submission.status == SCORED else None
+                }
+        return None
+
+    def recover(self):
+        """服务启动时重新入队中断的作品评分任务，多个进程同时恢复时每个任务只由一个进程接管"""
+        if not self.app:
+            return
+        try:
+            # 请求中调用时直接使用当前上下文，避免嵌套上下文退出时清理请求的数据库会话
+            if has_app_context():
+                stalled = self._claim_stalled()
+            else:
+                with self.app.app_context():
+                    stalled = self._claim_stalled()
+        except Exception as e:
+            self.logger.error(f"恢复评分任务失败: {str(e)}")
+            return
+        for submission_id in stalled:
+            job_id = f'submission-{submission_id}'
+            with self._lock:
+                if job_id in self._jobs:
+                    continue
+            self._new_job(job_id, 'submission', {}, submission_id)
+            self._queue.put(job_id)
+        if stalled:
+            self.logger.info(f"重新入队 {len(stalled)} 个未完成的评分任务")
+
+    def _stalled_condition(self):
+        """排队或评分中超过时限未更新的作品，视为所在进程已退出"""
+        return and_(DanceSubmission.status.in_((QUEUED, SCORING)),
+                    or_(DanceSubmission.scoring_updated_at.is_(None),
+                        DanceSubmission.scoring_updated_at < datetime.now() - timedelta(seconds=self.stall_timeout)))
+
+    def _claim_stalled(self) -> List[int]:
+        """逐个认领中断的作品，刷新时间后其他进程不会重复入队"""
+        claimed = []
+        stalled = db.session.query(DanceSubmission.id).filter(self._stalled_condition()).all()
+        for (submission_id,) in stalled:
+            result = db.session.execute(
+                update(DanceSubmission.__table__)
+                .where(DanceSubmission.id == submission_id)
+                .where(self._stalled_condition())
+                .values(status=QUEUED, scoring_updated_at=datetime.now())
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                claimed.append(submission_id)
+        return claimed
+
+    def _claim(self, submission_id: int, from_states=(QUEUED,)) -> bool:
+        """多个进程共享数据库时，只有一个进程评分同一个作品"""
+        result = db.session.execute(
+            update(DanceSubmission.__table__)
+            .where(DanceSubmission.id == submission_id)
+            .where(or_(DanceSubmission.status.in_(from_states), self._stalled_condition()))
+            .values(status=SCORING, scoring_updated_at=datetime.now())
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _release(self, submission_id: int):
+        """评分失败时交还认领，等待本进程重试"""
+        db.session.execute(
+            update(DanceSubmission.__table__)
+            .where(DanceSubmission.id == submission_id, DanceSubmission.status == SCORING)
+            .values(status=QUEUED, scoring_updated_at=datetime.now())
+        )
+        db.session.commit()
+
+    def _mark_submission(self, submission_id: int, status: str):
+        """更新作品评分状态，已评分或正在其他进程中评分的作品保持不变"""
+        db.session.execute(
+            update(DanceSubmission.__table__)
+            .where(DanceSubmission.id == submission_id)
+            .where(or_(DanceSubmission.status.is_(None), DanceSubmission.status != SCORED))
+            .where(or_(DanceSubmission.status.is_(None), DanceSubmission.status != SCORING,
+                       self._stalled_condition()))
+            .values(status=status, scoring_updated_at=datetime.now())
+        )
+        db.session.commit()
+
+    def _update_job(self, job: Dict[str, Any], **fields):
+        with self._lock:
+            job.update(fields, updated_at=datetime.now().isoformat())
+            if job['status'] in FINISHED_STATES:
+                job['finished_at'] = time.time()
+
+    def _run(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """执行任务，作品已由其他进程认领时返回None"""
+        submission = None
+        if job['submission_id']:
+            submission = DanceSubmission.query.get(job['submission_id'])
+            if submission is None:
+                raise ValueError(f"未找到ID为 {job['submission_id']} 的参赛作品")
+            # 练习评分可以覆盖已评分作品的成绩
+            from_states = (QUEUED, SCORED) if job['kind'] == 'practice' else (QUEUED,)
+            if self._claim(submission.id, from_states):
+                job['claimed'] = True
+                db.session.refresh(submission)
+            elif job['kind'] == 'practice':
+                # 练习结果仍然返回给客户端，只是不再写入作品
+                submission = None
+            else:
+                return None
+
+        if job['kind'] == 'practice':
+            result = score_practice(job['payload'])
+        else:
+            result = score_submission(submission)
+
+        if submission is not None:
+            submission.update_score(result['score_result'])
+            db.session.commit()
+        return result
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                if job is None or job['status'] in FINISHED_STATES:
+                    continue
+                self._update_job(job, status=SCORING, attempts=job['attempts'] + 1)
+                with self.app.app_context():
+                    try:
+                        result = self._run(job)
+                        if result is None:
+                            # 由其他进程评分，状态从数据库读取
+                            with self._lock:
+                                self._jobs.pop(job_id, None)
+                        else:
+                            job.pop('claimed', None)
+                            self._update_job(job, status=SCORED, result=result, error=None)
+                    except Exception as e:
+                        db.session.rollback()
+                        if job.pop('claimed', False):
+                            self._release(job['submission_id'])
+                        self.logger.error(f"评分任务 {job_id} 第 {job['attempts']} 次执行失败: {str(e)}")
+                        if job['attempts'] <= self.max_retries:
+                            # 指数退避后重新入队
+                            self._update_job(job, status=QUEUED, error=str(e))
+                            delay = self.retry_delay * (2 ** (job['attempts'] - 1))
+                            threading.Timer(delay, self._queue.put, args=(job_id,)).start()
+                        else:
+                            self._update_job(job, status=FAILED, error=str(e))
+                            if job['submission_id']:
+                                self._mark_submission(job['submission_id'], FAILED)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.logger.error(f"评分工作线程异常: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+# 进程内共享的评分队列
+scoring_queue = ScoringQueue()
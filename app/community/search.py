@@ -0,0 +1,241 @@
+import re
+import math
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy.orm import joinedload
+from app import db
+from app.community.models import Post, Story, Task
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('CommunitySearch')
+
+# 中日韩统一表意文字、扩展A区及兼容表意文字
+CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+WORD = re.compile(r'[0-9a-z]+')
+
+def tokenize(text: Optional[str], for_query: bool = False) -> List[str]:
+    """
+    分词：中文按字符n-gram切分，拉丁字母和数字按单词切分
+
+    索引时中文同时输出单字和二元组，查询时长度不小于2的中文片段只使用二元组，
+    这样单字查询和短语查询都能命中，且短语查询要求各二元组均出现，近似于子串匹配
+
+    Args:
+        text: 待分词文本
+        for_query: 是否为查询分词
+
+    Returns:
+        词项列表
+    """
+    if not text:
+        return []
+    text = text.lower()
+    tokens = WORD.findall(CJK_RUN.sub(' ', text))
+    for run in CJK_RUN.findall(text):
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if for_query and bigrams:
+            tokens.extend(bigrams)
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    return tokens
+
+class CommunitySearchIndex:
+    """社区内容倒排索引，覆盖任务、故事和帖子，按BM25排序并分页返回"""
+
+    # 可搜索的内容类型：类型 -> (模型, 标题字段, 正文字段)
+    DOC_TYPES = {
+        'task': (Task, 'title', 'description'),
+        'story': (Story, 'title', 'content'),
+        'post': (Post, 'title', 'content'),
+    }
+
+    # 加载命中对象时预加载搜索结果页用到的关联
+    LOAD_OPTIONS = {
+        'task': (joinedload(Task.creator),),
+        'story': (),
+        'post': (joinedload(Post.author),),
+    }
+
+    # 标题词频权重
+    TITLE_WEIGHT = 2
+    # BM25参数
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, ttl: Optional[int] = 600):
+        """
+        初始化搜索索引
+
+        Args:
+            ttl: 索引有效期（秒），超时后下次搜索时整体重建，用于同步其他进程写入的数据
+        """
+        self.logger = logger
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._reset()
+
+    def _reset(self):
+        """清空索引数据"""
+        self.postings = {}  # 词项 -> {文档键: 词频}
+        self.doc_terms = {}  # 文档键 -> 词频Counter
+        self.doc_lengths = {}  # 文档键 -> 文档长度
+        self.total_length = 0
+
+    def is_stale(self) -> bool:
+        """判断索引是否需要重建"""
+        if self._built_at is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self._built_at > self.ttl
+
+    def ensure_built(self):
+        """确保索引可用，未构建或已过期时重建"""
+        if self.is_stale():
+            with self._lock:
+                if self.is_stale():
+                    self.rebuild()
+
+    def rebuild(self, batch_size: int = 500):
+        """分批读取三张表重建索引"""
+        with self._lock:
+            self._reset()
+            for doc_type, (model, title_field, body_field) in self.DOC_TYPES.items():
+                query = db.session.query(model.id, getattr(model, title_field), getattr(model, body_field))
+                for doc_id, title, body in query.yield_per(batch_size):
+                    self._add(doc_type, doc_id, title, body)
+            self._built_at = time.monotonic()
+            self.logger.info(f"社区搜索索引重建完成: {len(self.doc_lengths)} 篇文档, {len(self.postings)} 个词项")
+
+    def invalidate(self):
+        """使整个索引失效，下次搜索时重建"""
+        with self._lock:
+            self._built_at = None
+
+    def _add(self, doc_type: str, doc_id: int, title: Optional[str], body: Optional[str]):
+        key = (doc_type, doc_id)
+        if key in self.doc_terms:
+            self._remove(key)
+        terms = Counter(tokenize(body))
+        for term in tokenize(title):
+            terms[term] += self.TITLE_WEIGHT
+        length = sum(terms.values())
+        self.doc_terms[key] = terms
+        self.doc_lengths[key] = length
+        self.total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[key] = tf
+
+    def _remove(self, key: Tuple[str, int]):
+        terms = self.doc_terms.pop(key, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(key, 0)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(key, None)
+                if not docs:
+                    del self.postings[term]
+
+    # 写入后的增量更新：索引尚未构建时无需处理，下次搜索会整体加载
+
+    def index_document(self, doc_type: str, obj):
+        """新增或编辑任务、故事、帖子后同步索引"""
+        _, title_field, body_field = self.DOC_TYPES[doc_type]
+        with self._lock:
+            if self._built_at is not None:
+                self._add(doc_type, obj.id, getattr(obj, title_field), getattr(obj, body_field))
+
+    def remove_document(self, doc_type: str, doc_id: int):
+        """删除任务、故事、帖子后同步索引"""
+        with self._lock:
+            if self._built_at is not None:
+                self._remove((doc_type, doc_id))
+
+    def search(self, query: str, page: int = 1, per_page: int = 20,
+               doc_types: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        搜索社区内容，要求命中所有查询词项，按BM25得分降序分页
+
+        Args:
+            query: 查询文本
+            page: 页码，从1开始
+            per_page: 每页数量
+            doc_types: 限定的内容类型，默认全部
+
+        Returns:
+            包含 hits（类型、ID、得分）、total、page、per_page、pages 的字典
+        """
+        self.ensure_built()
+        terms = list(dict.fromkeys(tokenize(query, for_query=True)))
+        page = max(page, 1)
+        per_page = max(per_page, 1)
+        result = {'hits': [], 'total': 0, 'page': page, 'per_page': per_page, 'pages': 0}
+        if not terms:
+            return result
+
+        with self._lock:
+            postings = [self.postings.get(term) for term in terms]
+            if not all(postings):
+                return result
+
+            # 从最短的倒排表开始求交集
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for docs in postings[1:]:
+                candidates.intersection_update(docs)
+                if not candidates:
+                    return result
+            if doc_types:
+                candidates = {key for key in candidates if key[0] in doc_types}
+
+            doc_count = len(self.doc_lengths)
+            avg_length = self.total_length / doc_count if doc_count else 0
+            scores = {}
+            for docs in postings:
+                idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                for key in candidates:
+                    tf = docs[key]
+                    norm = 1 - self.B + self.B * self.doc_lengths[key] / avg_length if avg_length else 1
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.K1 + 1) / (tf + self.K1 * norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        start = (page - 1) * per_page
+        result['total'] = len(ranked)
+        result['pages'] = math.ceil(len(ranked) / per_page)
+        result['hits'] = [{'type': key[0], 'id': key[1], 'score': round(score, 4)}
+                          for key, score in ranked[start:start + per_page]]
+        return result
+
+    def load_hits(self, hits: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """
+        按类型批量加载命中的对象，每种类型一次查询，保持得分顺序
+
+        Returns:
+            类型 -> 对象列表
+        """
+        grouped = {doc_type: [] for doc_type in self.DOC_TYPES}
+        for hit in hits:
+            grouped[hit['type']].append(hit['id'])
+
+        loaded = {}
+        for doc_type, ids in grouped.items():
+            if not ids:
+                loaded[doc_type] = []
+                continue
+            model = self.DOC_TYPES[doc_type][0]
+            query = model.query.options(*self.LOAD_OPTIONS[doc_type]).filter(model.id.in_(ids))
+            objects = {obj.id: obj for obj in query.all()}
+            loaded[doc_type] = [objects[doc_id] for doc_id in ids if doc_id in objects]
+        return loaded
+
+# 进程内共享的索引实例
+community_search_index = CommunitySearchIndex()
@@ -0,0 +1,146 @@
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+from flask import current_app
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('SequenceCache')
+
+# 生成算法版本，算法变化时递增以废弃旧缓存和旧ETag
+SEQUENCE_VERSION = 1
+
+def derive_seed(*parts: Any) -> int:
+    """由请求参数推导稳定的随机种子，使相同参数得到相同序列"""
+    digest = hashlib.sha256(json.dumps(parts, ensure_ascii=False, default=str).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big')
+
+def make_etag(*parts: Any) -> str:
+    """由缓存键计算ETag，序列由参数唯一确定，无需生成即可比对"""
+    payload = json.dumps([SEQUENCE_VERSION, *parts], ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def _sizeof(value: Any) -> int:
+    """估算缓存值占用的字节数：响应体按编码后长度，其他值按JSON序列化后的长度"""
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+
+class ActionSequenceCache:
+    """动作序列缓存：进程内LRU+TTL，按条数和总字节数双重限制，可选通过Flask-Caching后端在多进程间共享"""
+
+    def __init__(self, maxsize: int = 256, ttl: int = 3600, max_bytes: int = 32 * 1024 * 1024,
+                 max_item_bytes: int = 4 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            maxsize: 进程内最多缓存的序列数
+            ttl: 缓存有效期（秒）
+            max_bytes: 进程内缓存的总字节数上限
+            max_item_bytes: 单条缓存的字节数上限，超出的值不缓存
+        """
+        self.logger = logger
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _shared_cache(self):
+        """配置了 ACTION_SEQUENCE_SHARED_CACHE 时返回应用的共享缓存"""
+        try:
+            if current_app.config.get('ACTION_SEQUENCE_SHARED_CACHE'):
+                return getattr(current_app, 'cache', None)
+        except RuntimeError:
+            pass
+        return None
+
+    @staticmethod
+    def _shared_key(key: Tuple) -> str:
+        return f'action_sequence:{make_etag(*key)}'
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """读取缓存，先查进程内再查共享缓存"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item and item[0] > now:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item:
+                self._remove(key)
+
+        shared = self._shared_cache()
+        if shared is not None:
+            value = shared.get(self._shared_key(key))
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remove(self, key: Tuple):
+        """删除一条缓存并扣减字节数，调用方持有锁"""
+        _, _, size = self._items.pop(key)
+        self._bytes -= size
+
+    def _store(self, key: Tuple, value: Any, size: Optional[int] = None) -> bool:
+        """写入进程内缓存，按LRU淘汰直到条数和总字节数都不超限；超过单条上限的值不缓存"""
+        size = _sizeof(value) if size is None else size
+        if size > self.max_item_bytes:
+            return False
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (time.monotonic() + self.ttl, value, size)
+            self._bytes += size
+            while len(self._items) > self.maxsize or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._items)))
+        return True
+
+    def set(self, key: Tuple, value: Any):
+        """写入进程内缓存和共享缓存，超过单条上限的值不缓存"""
+        if not self._store(key, value):
+            return
+        shared = self._shared_cache()
+        if shared is not None:
+            try:
+                shared.set(self._shared_key(key), value, timeout=self.ttl)
+            except Exception as e:
+                self.logger.error(f"写入共享缓存失败: {str(e)}")
+
+    def get_or_create(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+        """读取缓存，未命中时调用factory生成并写入"""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        """清空进程内缓存"""
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+# 进程内共享的动作序列缓存
+action_sequence_cache = ActionSequenceCache()
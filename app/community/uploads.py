@@ -0,0 +1,567 @@
+import os
+import uuid
+import queue
+import base64
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Callable, Optional, Tuple
+from flask import url_for, has_app_context
+from sqlalchemy import update, or_, and_
+from werkzeug.utils import secure_filename
+from app import db
+from app.community.models import UploadSession, Task, Dance
+from app.storage.blobstore import blob_store, blob_name, static_key, video_key
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('Uploads')
+
+# tus 协议版本和支持的扩展
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,termination,checksum'
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+# 上传状态
+UPLOADING = 'uploading'
+COMPLETE = 'complete'
+PROCESSING = 'processing'
+PROCESSED = 'processed'
+FAILED = 'failed'
+CONSUMED = 'consumed'  # 已被提交记录使用，文件引用已转交给提交记录
+
+PURPOSES = ('task', 'dance')
+
+# 每次从请求流读取的字节数，内存占用与文件大小无关
+CHUNK_SIZE = 64 * 1024
+
+# 视频文件头特征，用于后处理时确认内容确实是视频
+VIDEO_SIGNATURES = (
+    (4, b'ftyp'),  # mp4, mov
+    (4, b'moov'),
+    (4, b'mdat'),
+    (4, b'wide'),
+    (0, b'\x1a\x45\xdf\xa3'),  # mkv, webm
+    (0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'),  # wmv, asf
+)
+
+class UploadError(ValueError):
+    """上传请求无效，status 为对应的HTTP状态码"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def parse_metadata(header: Optional[str]) -> Dict[str, str]:
+    """
+    解析 tus 的 Upload-Metadata 请求头：逗号分隔的“键 base64值”
+
+    Raises:
+        UploadError: 值不是有效的base64
+    """
+    metadata = {}
+    for pair in (header or '').split(','):
+        parts = pair.strip().split(' ', 1)
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1]).decode('utf-8') if len(parts) > 1 else ''
+        except (ValueError, UnicodeDecodeError):
+            raise UploadError(f"Upload-Metadata 中 {parts[0]} 的值无效")
+    return metadata
+
+def is_video_file(path: str) -> bool:
+    """根据文件头判断是否为视频文件"""
+    with open(path, 'rb') as f:
+        head = f.read(16)
+    if head[:4] == b'RIFF' and head[8:11] == b'AVI':
+        return True
+    return any(head[offset:offset + len(signature)] == signature for offset, signature in VIDEO_SIGNATURES)
+
+class UploadManager:
+    """
+    分片上传管理：请求体按固定大小的块直接写入磁盘上的临时文件，同时累加 SHA-256，
+    已接收字节数写入 upload_session，断线后客户端用 HEAD 查询偏移量继续上传；
+    上传完成后文件移入内容寻址存储，在目标目录创建链接并交给后处理队列
+    """
+
+    def __init__(self):
+        """初始化上传管理器"""
+        self.logger = logger
+        self.app = None
+        self.partial_folder = None
+        self.expire_hours = 24
+        self.lease_seconds = 600
+        self.dance_max_size = 500 * 1024 * 1024
+        # 上传ID -> (已累加的偏移量, 哈希对象)，进程重启或请求落到其他进程时从临时文件重新计算
+        self._hashers: Dict[str, Tuple[int, Any]] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """读取配置并绑定应用"""
+        self.app = app
+        self.partial_folder = app.config.get('UPLOAD_PARTIAL_FOLDER') or os.path.join(
+            app.instance_path, 'uploads', 'partial')
+        self.expire_hours = app.config.get('UPLOAD_EXPIRE_HOURS', self.expire_hours)
+        self.lease_seconds = app.config.get('UPLOAD_LEASE_SECONDS', self.lease_seconds)
+        self.dance_max_size = app.config.get('DANCE_VIDEO_MAX_SIZE', self.dance_max_size)
+
+    def partial_path(self, upload: UploadSession) -> str:
+        return os.path.join(self.partial_folder, f'{upload.id}.part')
+
+    @staticmethod
+    def blob_key(upload: UploadSession) -> str:
+        """完成后文件在内容寻址存储中的引用路径"""
+        if upload.purpose == 'dance':
+            return video_key(upload.stored_name)
+        return static_key(f'uploads/tasks/{upload.stored_name}')
+
+    def destination(self, upload: UploadSession) -> str:
+        """完成后文件的保存路径"""
+        return blob_store.resolve(self.blob_key(upload))
+
+    def _target(self, purpose: str, target_id: int, filename: str, user_id: int) -> Tuple[int, str]:
+        """
+        校验上传目标，返回大小上限和保存文件名（完成后加上摘要前缀）
+
+        Raises:
+            UploadError: 目标不存在、文件类型不允许
+        """
+        ext = os.path.splitext(filename)[1].lower()
+        if purpose == 'task':
+            task = Task.query.get(target_id)
+            if task is None:
+                raise UploadError('任务不存在', 404)
+            if task.file_types:
+                allowed_types = [item.strip().lower() for item in task.file_types.split(',')]
+                if ext and ext[1:] not in allowed_types:
+                    raise UploadError(f'文件类型不允许！允许的类型：{task.file_types}', 415)
+            return (task.file_size_limit or 10) * 1024 * 1024, filename
+        if purpose == 'dance':
+            if Dance.query.get(target_id) is None:
+                raise UploadError('舞蹈不存在', 404)
+            from config import allowed_file
+            if not allowed_file(filename):
+                raise UploadError('不支持的视频格式', 415)
+            return self.dance_max_size, f'submission_{user_id}_{target_id}{ext}'
+        raise UploadError(f'未知的上传用途: {purpose}')
+
+    def create(self, user_id: int, purpose: str, target_id: int, filename: str, length: int) -> UploadSession:
+        """
+        创建上传会话和空的临时文件，文件大小超过上限时直接拒绝
+
+        Args:
+            user_id: 上传用户ID
+            purpose: task 或 dance
+            target_id: 任务ID或舞蹈ID
+            filename: 原始文件名
+            length: 文件总字节数
+
+        Raises:
+            UploadError: 参数无效或文件过大
+        """
+        safe_name = secure_filename(filename or '')
+        if not safe_name:
+            raise UploadError('不支持的文件名！')
+        if length <= 0:
+            raise UploadError('Upload-Length 无效')
+        max_size, stored_name = self._target(purpose, target_id, safe_name, user_id)
+        if length > max_size:
+            raise UploadError(f'文件大小超过限制！最大允许 {max_size // (1024 * 1024)}MB', 413)
+
+        self.prune_expired()
+        upload = UploadSession(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            purpose=purpose,
+            target_id=target_id,
+            filename=safe_name,
+            stored_name=stored_name,
+            upload_length=length,
+            upload_offset=0,
+            max_size=max_size,
+            status=UPLOADING,
+            expires_at=datetime.now() + timedelta(hours=self.expire_hours)
+        )
+        os.makedirs(self.partial_folder, exist_ok=True)
+        open(self.partial_path(upload), 'wb').close()
+        db.session.add(upload)
+        db.session.commit()
+        return upload
+
+    def get(self, upload_id: str, user_id: int) -> Optional[UploadSession]:
+        """查询用户自己的上传会话"""
+        return UploadSession.query.filter_by(id=upload_id, user_id=user_id).first()
+
+    def _claim(self, upload: UploadSession, offset: int) -> bool:
+        """获取写入租约：偏移量一致且没有其他请求正在写入时才成功"""
+        now = datetime.now()
+        result = db.session.execute(
+            update(UploadSession.__table__)
+            .where(UploadSession.id == upload.id)
+            .where(UploadSession.status == UPLOADING)
+            .where(UploadSession.upload_offset == offset)
+            .where(or_(UploadSession.lease_expires_at.is_(None), UploadSession.lease_expires_at < now))
+            .values(lease_expires_at=now + timedelta(seconds=self.lease_seconds))
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _hasher(self, upload: UploadSession, offset: int):
+        """取得累加到 offset 的哈希对象，不在内存中时按块重新读取临时文件"""
+        with self._lock:
+            cached = self._hashers.pop(upload.id, None)
+        if cached and cached[0] == offset:
+            return cached[1]
+        hasher = hashlib.sha256()
+        remaining = offset
+        with open(self.partial_path(upload), 'rb') as f:
+            while remaining > 0:
+                block = f.read(min(CHUNK_SIZE, remaining))
+                if not block:
+                    raise UploadError('临时文件不完整，请重新上传', 410)
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    def write(self, upload: UploadSession, offset: int, stream, checksum: Optional[str] = None) -> int:
+        """
+        从请求流按块写入数据，边接收边检查大小上限；连接中断时保留已落盘的部分
+
+        Args:
+            upload: 上传会话
+            offset: 请求头中的 Upload-Offset
+            stream: 请求体流
+            checksum: 请求头中的 Upload-Checksum（“算法 base64摘要”），校验本次请求的数据
+
+        Returns:
+            新的偏移量
+
+        Raises:
+            UploadError: 偏移量不一致、超过大小、校验失败
+        """
+        if upload.status != UPLOADING:
+            raise UploadError('上传已完成', 409)
+        if offset != upload.upload_offset:
+            raise UploadError('Upload-Offset 与服务器记录不一致', 409)
+
+        expected_digest = None
+        if checksum:
+            algorithm, _, digest = checksum.partition(' ')
+            if algorithm not in CHECKSUM_ALGORITHMS:
+                raise UploadError(f'不支持的校验算法: {algorithm}')
+            try:
+                expected_digest = base64.b64decode(digest)
+            except ValueError:
+                raise UploadError('Upload-Checksum 无效')
+            request_hasher = hashlib.new(algorithm)
+
+        if not self._claim(upload, offset):
+            raise UploadError('该上传正在被其他请求写入', 409)
+
+        limit = min(upload.upload_length, upload.max_size)
+        new_offset = offset
+        error = None
+        hasher = None
+        try:
+            hasher = self._hasher(upload, offset)
+            with open(self.partial_path(upload), 'r+b') as f:
+                # 丢弃上次中断请求在记录的偏移量之后残留的数据
+                f.seek(offset)
+                f.truncate()
+                while True:
+                    block = stream.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    if new_offset + len(block) > limit:
+                        error = UploadError('上传的数据超过 Upload-Length 或文件大小限制', 413)
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    if expected_digest is not None:
+                        request_hasher.update(block)
+                    new_offset += len(block)
+                if expected_digest is not None and error is None and request_hasher.digest() != expected_digest:
+                    error = UploadError('分片校验失败', 460)
+                if error is not None:
+                    f.seek(offset)
+                    f.truncate()
+                    new_offset = offset
+                    hasher = None
+                f.flush()
+                os.fsync(f.fileno())
+        except UploadError as e:
+            error = e
+        except Exception as e:
+            # 客户端断开等读取错误：带校验的请求整体作废，否则保留已落盘的部分供续传
+            self.logger.warning(f"上传 {upload.id} 在偏移量 {new_offset} 处中断: {str(e)}")
+            if expected_digest is not None or hasher is None:
+                with open(self.partial_path(upload), 'r+b') as f:
+                    f.truncate(offset)
+                new_offset = offset
+                hasher = None
+        finally:
+            db.session.rollback()
+            values = {'upload_offset': new_offset, 'updated_at': datetime.now(),
+                      'expires_at': datetime.now() + timedelta(hours=self.expire_hours)}
+            # 数据已全部接收时保留租约，直到 finalize 把状态改为 complete，重试的请求无法再次完成
+            if error is not None or new_offset != upload.upload_length:
+                values['lease_expires_at'] = None
+            db.session.execute(
+                update(UploadSession.__table__)
+                .where(UploadSession.id == upload.id)
+                .values(**values)
+            )
+            db.session.commit()
+
+        if hasher is not None:
+            with self._lock:
+                self._hashers[upload.id] = (new_offset, hasher)
+        if error is not None:
+            raise error
+        if new_offset == upload.upload_length:
+            try:
+                self.finalize(upload)
+            except Exception:
+                # 完成失败时释放租约，客户端可以重试
+                db.session.rollback()
+                db.session.execute(
+                    update(UploadSession.__table__)
+                    .where(UploadSession.id == upload.id, UploadSession.status == UPLOADING)
+                    .values(lease_expires_at=None)
+                )
+                db.session.commit()
+                raise
+        return new_offset
+
+    def finalize(self, upload: UploadSession):
+        """
+        上传完成：计算最终摘要，移入内容寻址存储并在目标目录创建链接，然后提交后处理；
+        状态以条件更新从 uploading 改为 complete，同一上传只完成一次
+        """
+        with self._lock:
+            cached = self._hashers.pop(upload.id, None)
+        hasher = cached[1] if cached and cached[0] == upload.upload_length else self._hasher(upload, upload.upload_length)
+        checksum = hasher.hexdigest()
+        size = blob_store.adopt(self.partial_path(upload), checksum)
+        with db.session.no_autoflush:
+            upload.checksum = checksum
+            upload.stored_name = blob_name(checksum, upload.stored_name)
+            key = self.blob_key(upload)
+            upload.file_url = url_for('static', filename=key.partition(':')[2]) if upload.purpose == 'task' \
+                else url_for('static', filename=f'videos/{upload.stored_name}')
+            result = db.session.execute(
+                update(UploadSession.__table__)
+                .where(UploadSession.id == upload.id, UploadSession.status == UPLOADING)
+                .values(status=COMPLETE, lease_expires_at=None)
+            )
+        if result.rowcount != 1:
+            db.session.rollback()
+            self.logger.warning(f"上传 {upload.id} 已由其他请求完成")
+            return
+        upload.status = COMPLETE
+        upload.lease_expires_at = None
+        blob_store.add_ref(checksum, size, key)
+        db.session.commit()
+        blob_store.link(checksum, key)
+        upload_processor.submit(upload.id)
+
+    def terminate(self, upload: UploadSession):
+        """取消上传，删除临时文件和会话；已完成但未被提交使用的上传释放文件引用"""
+        with self._lock:
+            self._hashers.pop(upload.id, None)
+        if upload.status == UPLOADING:
+            if os.path.exists(self.partial_path(upload)):
+                os.remove(self.partial_path(upload))
+        elif upload.status != CONSUMED:
+            blob_store.release(self.blob_key(upload))
+        db.session.delete(upload)
+        db.session.commit()
+
+    def prune_expired(self, limit: int = 100) -> int:
+        """清理过期未完成的上传和已被提交使用的上传会话（文件引用属于提交记录，不释放）"""
+        expired = UploadSession.query.filter(
+            UploadSession.status.in_([UPLOADING, CONSUMED]),
+            UploadSession.expires_at < datetime.now()
+        ).limit(limit).all()
+        for upload in expired:
+            if upload.status == UPLOADING:
+                with self._lock:
+                    self._hashers.pop(upload.id, None)
+                try:
+                    os.remove(self.partial_path(upload))
+                except FileNotFoundError:
+                    pass
+            db.session.delete(upload)
+        if expired:
+            db.session.commit()
+            self.logger.info(f"清理 {len(expired)} 个过期的上传")
+        return len(expired)
+
+    def resolve(self, upload_id: str, user_id: int, purpose: str, target_id: int) -> UploadSession:
+        """
+        提交表单时取得已通过后处理（如视频格式校验）的上传
+
+        Raises:
+            UploadError: 上传不存在、不属于该目标、未完成、处理中或后处理失败
+        """
+        upload = self.get(upload_id, user_id)
+        if upload is None or upload.purpose != purpose or upload.target_id != target_id:
+            raise UploadError('上传的文件不存在', 404)
+        if upload.status == FAILED:
+            raise UploadError(f'文件处理失败：{upload.error}', 422)
+        if upload.status == UPLOADING:
+            raise UploadError('文件尚未上传完成', 409)
+        if upload.status == CONSUMED:
+            raise UploadError('该文件已提交', 409)
+        if upload.status != PROCESSED:
+            raise UploadError('文件正在处理，请稍后提交', 409)
+        return upload
+
+    def consume(self, upload: UploadSession):
+        """
+        提交记录使用上传的文件：以条件更新把状态改为 consumed，上传持有的文件引用转交给提交记录，
+        之后取消上传不再释放引用；在当前会话的事务中执行，由调用方与提交记录一起提交
+
+        Raises:
+            UploadError: 上传已被其他提交使用
+        """
+        result = db.session.execute(
+            update(UploadSession.__table__)
+            .where(UploadSession.id == upload.id, UploadSession.status == PROCESSED)
+            .values(status=CONSUMED, updated_at=datetime.now())
+        )
+        if result.rowcount != 1:
+            raise UploadError('该文件已提交', 409)
+
+class UploadProcessor:
+    """上传后处理队列：按上传用途依次执行注册的处理步骤，失败时记录错误"""
+
+    def __init__(self):
+        """初始化后处理队列，工作线程在首次提交时启动"""
+        self.logger = logger
+        self.app = None
+        self.workers = 1
+        self.timeout = 600
+        self._steps: Dict[str, List[Callable[[UploadSession], None]]] = {purpose: [] for purpose in PURPOSES}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def init_app(self, app):
+        """读取配置并绑定应用"""
+        self.app = app
+        self.workers = app.config.get('UPLOAD_PROCESSING_WORKERS', self.workers)
+        self.timeout = app.config.get('UPLOAD_PROCESSING_TIMEOUT', self.timeout)
+
+    def register(self, purpose: str, step: Callable[[UploadSession], None]):
+        """
+        注册处理步骤
+
+        Args:
+            purpose: 上传用途
+            step: 接收上传会话，可修改其字段，抛出异常表示处理失败
+        """
+        self._steps[purpose].append(step)
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for index in range(self.workers):
+                threading.Thread(target=self._worker, name=f'upload-processing-{index}', daemon=True).start()
+            self._started = True
+        self.recover()
+
+    def submit(self, upload_id: str):
+        """提交后处理任务"""
+        self._ensure_started()
+        self._queue.put(upload_id)
+
+    def recover(self):
+        """重新入队未处理或处理中断的上传"""
+        if not self.app:
+            return
+        try:
+            if has_app_context():
+                stalled = self._stalled_upload_ids()
+            else:
+                with self.app.app_context():
+                    stalled = self._stalled_upload_ids()
+        except Exception as e:
+            self.logger.error(f"恢复上传后处理任务失败: {str(e)}")
+            return
+        for (upload_id,) in stalled:
+            self._queue.put(upload_id)
+        if stalled:
+            self.logger.info(f"重新入队 {len(stalled)} 个上传后处理任务")
+
+    def _stalled_condition(self):
+        return or_(UploadSession.status == COMPLETE,
+                   and_(UploadSession.status == PROCESSING,
+                        UploadSession.updated_at < datetime.now() - timedelta(seconds=self.timeout)))
+
+    def _stalled_upload_ids(self):
+        return db.session.query(UploadSession.id).filter(self._stalled_condition()).all()
+
+    def _claim(self, upload_id: str) -> bool:
+        """多个进程共享数据库时，只有一个进程处理同一个上传"""
+        result = db.session.execute(
+            update(UploadSession.__table__)
+            .where(UploadSession.id == upload_id)
+            .where(self._stalled_condition())
+            .values(status=PROCESSING, updated_at=datetime.now())
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def process(self, upload_id: str):
+        """执行一个上传的全部处理步骤"""
+        if not self._claim(upload_id):
+            return
+        upload = UploadSession.query.get(upload_id)
+        if upload is None:
+            return
+        try:
+            for step in self._steps.get(upload.purpose, []):
+                step(upload)
+            upload.status = PROCESSED
+            upload.error = None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"上传 {upload_id} 后处理失败: {str(e)}")
+            upload = UploadSession.query.get(upload_id)
+            upload.status = FAILED
+            upload.error = str(e)
+            db.session.commit()
+
+    def _worker(self):
+        while True:
+            upload_id = self._queue.get()
+            try:
+                with self.app.app_context():
+                    try:
+                        self.process(upload_id)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.logger.error(f"上传后处理线程异常: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+def verify_video(upload: UploadSession):
+    """确认舞蹈视频的文件头是视频格式"""
+    if not is_video_file(upload_manager.destination(upload)):
+        raise ValueError('文件内容不是有效的视频')
+
+# 进程内共享的上传管理器和后处理队列
+upload_manager = UploadManager()
+upload_processor = UploadProcessor()
+upload_processor.register('dance', verify_video)
@@ -0,0 +1,221 @@
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator, Tuple, Callable
+from sqlalchemy import func, or_, bindparam
+from app import db
+from app.culture.data_export import EXPORT_TABLES, write_export, file_sha256
+from app.culture.data_import import CultureDataImporter, iter_records
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('CultureBackup')
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# SQLite 中数据库 now() 写入的时间不带小数秒，导入的行带微秒，按文本比较前统一格式
+SQLITE_TIME_FORMAT = '%Y-%m-%d %H:%M:%f'
+
+class IncrementalBackupManager:
+    """
+    增量备份：清单文件记录每次备份的各表高水位（最大 updated_at 和最大ID）与内容摘要，
+    之后的备份只导出高水位之后新增或修改的行，恢复时按顺序回放全量备份和之后的增量备份
+
+    删除的行无法通过高水位发现，会在下一次全量备份时体现
+    """
+
+    def __init__(self, backup_dir: Optional[str] = None):
+        """
+        初始化增量备份管理器
+
+        Args:
+            backup_dir: 备份目录，默认为当前目录下的 backups/incremental
+        """
+        self.logger = logger
+        self.backup_dir = backup_dir or os.path.join(os.getcwd(), 'backups', 'incremental')
+        self.manifest_path = os.path.join(self.backup_dir, MANIFEST_NAME)
+
+    def load_manifest(self) -> Dict[str, Any]:
+        """读取清单，不存在时返回空清单"""
+        if not os.path.exists(self.manifest_path):
+            return {'version': MANIFEST_VERSION, 'backups': []}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        """先写临时文件再改名，避免清单损坏"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, self.manifest_path)
+
+    @staticmethod
+    def _high_water_marks() -> Dict[str, Dict[str, Any]]:
+        """查询各表当前的最大 updated_at 和最大ID，每张表一次聚合查询"""
+        marks = {}
+        for table, (model, _) in EXPORT_TABLES.items():
+            updated_at, max_id = db.session.query(func.max(model.updated_at), func.max(model.id)).one()
+            marks[table] = {
+                'updated_at': updated_at.isoformat() if updated_at else None,
+                'max_id': max_id or 0
+            }
+        return marks
+
+    @staticmethod
+    def _delta_criteria(marks: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        生成增量过滤条件：updated_at 不早于上次高水位，或ID大于上次最大ID
+
+        使用 >= 是因为时间戳精度有限，与高水位同一时刻修改的行会重复导出，恢复时按自然键幂等写入
+        """
+        sqlite = db.session.connection().dialect.name == 'sqlite'
+        criteria = {}
+        for table, (model, _) in EXPORT_TABLES.items():
+            mark = marks.get(table) or {}
+            conditions = [model.id > (mark.get('max_id') or 0)]
+            if mark.get('updated_at'):
+                updated_at = model.updated_at
+                since = bindparam(None, datetime.fromisoformat(mark['updated_at']), type_=model.updated_at.type)
+                if sqlite:
+                    updated_at = func.strftime(SQLITE_TIME_FORMAT, updated_at)
+                    since = func.strftime(SQLITE_TIME_FORMAT, since)
+                conditions.append(updated_at >= since)
+            criteria[table] = or_(*conditions)
+        return criteria
+
+    def backup(self, full: bool = False, compress: bool = True) -> Dict[str, Any]:
+        """
+        执行一次备份，清单为空或指定 full 时做全量备份，否则做增量备份
+
+        Args:
+            full: 是否强制全量备份
+            compress: 是否gzip压缩
+
+        Returns:
+            备份结果
+        """
+        try:
+            manifest = self.load_manifest()
+            backups = manifest['backups']
+            kind = 'full' if full or not backups else 'delta'
+
+            # 先记录高水位再导出，导出期间修改的行会进入下一次增量
+            marks = self._high_water_marks()
+            criteria = self._delta_criteria(backups[-1]['marks']) if kind == 'delta' else None
+
+            timestamp = datetime.now()
+            suffix = '.ndjson.gz' if compress else '.ndjson'
+            filename = f'culture_{kind}_{timestamp.strftime("%Y%m%d_%H%M%S_%f")}{suffix}'
+            path = os.path.join(self.backup_dir, filename)
+
+            hashes = {}
+            counts = write_export(path, 'ndjson', compress=compress, criteria=criteria, hashes=hashes,
+                                  info={'kind': kind, 'base': backups[-1]['file'] if kind == 'delta' else None})
+
+            # 没有变更行，或增量内容与上一次完全相同（只有高水位时刻的重复行）时不保留文件
+            if kind == 'delta' and (not any(counts.values()) or (hashes == backups[-1].get('hashes')
+                                                                  and counts == backups[-1].get('counts'))):
+                os.remove(path)
+                self.logger.info("文化数据无变更，跳过增量备份")
+                return {
+                    "success": True,
+                    "message": "数据无变更，未生成增量备份",
+                    "kind": kind,
+                    "counts": counts
+                }
+
+            entry = {
+                'file': filename,
+                'kind': kind,
+                'timestamp': timestamp.isoformat(),
+                'marks': marks,
+                'counts': counts,
+                'hashes': hashes,
+                'sha256': file_sha256(path)
+            }
+            backups.append(entry)
+            self._save_manifest(manifest)
+
+            self.logger.info(f"文化数据{'全量' if kind == 'full' else '增量'}备份完成: {filename}, 行数: {counts}")
+            return {
+                "success": True,
+                "message": "文化数据备份完成",
+                "backup_path": path,
+                "kind": kind,
+                "counts": counts
+            }
+        except Exception as e:
+            self.logger.error(f"文化数据增量备份失败: {str(e)}")
+            return {
+                "success": False,
+                "error": f"文化数据增量备份失败: {str(e)}"
+            }
+
+    def restore_chain(self, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        获取恢复所需的备份链：截止备份之前最近的一次全量备份及其后的增量备份
+
+        Args:
+            until: 截止的备份文件名，默认最新一次备份
+        """
+        backups = self.load_manifest()['backups']
+        if until is not None:
+            names = [entry['file'] for entry in backups]
+            if until not in names:
+                raise ValueError(f"清单中不存在备份: {until}")
+            backups = backups[:names.index(until) + 1]
+        for index in range(len(backups) - 1, -1, -1):
+            if backups[index]['kind'] == 'full':
+                return backups[index:]
+        raise ValueError("清单中没有可用的全量备份")
+
+    def _iter_chain_records(self, chain: List[Dict[str, Any]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for entry in chain:
+            yield from iter_records(os.path.join(self.backup_dir, entry['file']))
+
+    def restore(self, until: Optional[str] = None, progress_callback: Optional[Callable[[str, int], None]] = None,
+                batch_size: int = 500) -> Dict[str, Any]:
+        """
+        回放全量备份和之后的增量备份，所有文件先校验摘要，再在一个事务中导入
+
+        Args:
+            until: 恢复到的备份文件名，默认最新一次备份
+            progress_callback: 进度回调，参数为表名和该表已处理行数
+            batch_size: 每批写入的行数
+
+        Returns:
+            恢复结果
+        """
+        try:
+            chain = self.restore_chain(until)
+            for entry in chain:
+                path = os.path.join(self.backup_dir, entry['file'])
+                if not os.path.exists(path):
+                    return {"success": False, "error": f"备份文件不存在: {entry['file']}"}
+                if file_sha256(path) != entry['sha256']:
+                    return {"success": False, "error": f"备份文件校验失败: {entry['file']}"}
+
+            importer = CultureDataImporter(batch_size=batch_size, progress_callback=progress_callback)
+            result = importer.run(self._iter_chain_records(chain))
+            if not result['success']:
+                return result
+
+            self.logger.info(f"文化数据恢复完成，回放 {len(chain)} 个备份文件")
+            return {
+                "success": True,
+                "message": "文化数据恢复完成",
+                "files": [entry['file'] for entry in chain],
+                "stats": result['stats']
+            }
+        except Exception as e:
+            self.logger.error(f"文化数据增量恢复失败: {str(e)}")
+            return {
+                "success": False,
+                "error": f"文化数据增量恢复失败: {str(e)}"
+            }
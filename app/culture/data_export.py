@@ -0,0 +1,208 @@
+import os
+import json
+import gzip
+import zlib
+import hashlib
+from datetime import datetime, date
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+from app import db
+from app.culture.models import CultureElement, EthnicGroup, CultureEthnicRelation, CulturePattern, PatternRecognitionResult
+from app.culture.vector_codec import decode_to_list
+
+# 导出格式版本，1.0 为旧的整体JSON导出
+EXPORT_VERSION = '2.0'
+EXPORT_TYPES = ('ndjson', 'json')
+
+# 导出的数据表：表名 -> (模型, 字段列表)，按外键依赖顺序排列
+EXPORT_TABLES = {
+    'culture_elements': (CultureElement, ['id', 'name', 'description', 'image', 'created_at', 'updated_at']),
+    'ethnic_groups': (EthnicGroup, ['id', 'name', 'description', 'image', 'created_at', 'updated_at']),
+    'culture_ethnic_relations': (CultureEthnicRelation, ['id', 'culture_element_id', 'ethnic_group_id', 'culture',
+                                                         'customs', 'created_at', 'updated_at']),
+    'culture_patterns': (CulturePattern, ['id', 'name', 'era', 'region', 'category', 'carrier', 'technique',
+                                          'description', 'image_url', 'pattern_features', 'similarity_score',
+                                          'created_at', 'updated_at']),
+    'recognition_results': (PatternRecognitionResult, ['id', 'pattern_id', 'user_id', 'input_image',
+                                                       'recognized_pattern', 'recognition_score', 'features',
+                                                       'similarity_matrix', 'created_at', 'updated_at']),
+}
+
+def _json_default(value):
+    """序列化日期时间字段和二进制向量字段"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return decode_to_list(value)
+    raise TypeError(f'无法序列化的类型: {type(value).__name__}')
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+def iter_table_rows(table: str, batch_size: int = 1000, criterion=None) -> Iterator[Dict[str, Any]]:
+    """
+    按主键顺序分批读取一张表，只查询列值不构造ORM对象，内存占用与表大小无关
+
+    Args:
+        table: EXPORT_TABLES 中的表名
+        batch_size: 每批从数据库游标读取的行数
+        criterion: 额外的过滤条件，用于增量导出
+
+    Yields:
+        字段名 -> 值 的字典
+    """
+    model, fields = EXPORT_TABLES[table]
+    columns = [getattr(model, field) for field in fields]
+    query = db.session.query(*columns)
+    if criterion is not None:
+        query = query.filter(criterion)
+    query = query.order_by(model.id).execution_options(stream_results=True)
+    for row in query.yield_per(batch_size):
+        yield dict(zip(fields, row))
+
+def iter_export(export_type: str = 'ndjson', tables: Optional[List[str]] = None, batch_size: int = 1000,
+                counts: Optional[Dict[str, int]] = None, info: Optional[Dict[str, Any]] = None,
+                criteria: Optional[Dict[str, Any]] = None, hashes: Optional[Dict[str, str]] = None) -> Iterator[str]:
+    """
+    逐行生成导出内容
+
+    ndjson：首行为 {"export_info": ...}，之后每行一条 {"table": 表名, "data": 行数据}，
+    末行为 {"export_summary": {"counts": ...}}；
+    json：与1.0版相同的 {"export_info": ..., "data": {表名: [...]}} 结构，按数组元素分块输出
+
+    Args:
+        export_type: ndjson 或 json
+        tables: 导出的表，默认全部
+        batch_size: 每批读取的行数
+        counts: 传入字典时写入各表导出的行数
+        info: 附加到 export_info 中的信息
+        criteria: 表名 -> 过滤条件，用于增量导出
+        hashes: 传入字典时写入各表导出内容的SHA-256
+
+    Yields:
+        文本片段
+    """
+    if export_type not in EXPORT_TYPES:
+        raise ValueError(f"不支持的导出类型: {export_type}")
+    tables = tables or list(EXPORT_TABLES)
+    counts = counts if counts is not None else {}
+    hashes = hashes if hashes is not None else {}
+    criteria = criteria or {}
+
+    def rows(table):
+        # 逐行计算内容摘要，用于校验和比对备份内容
+        digest = hashlib.sha256()
+        for row in iter_table_rows(table, batch_size, criteria.get(table)):
+            line = dumps(row)
+            digest.update(line.encode('utf-8'))
+            yield line
+        hashes[table] = digest.hexdigest()
+
+    export_info = {
+        'type': export_type,
+        'timestamp': datetime.now().isoformat(),
+        'version': EXPORT_VERSION,
+        'tables': tables
+    }
+    export_info.update(info or {})
+
+    if export_type == 'ndjson':
+        yield dumps({'export_info': export_info}) + '\n'
+        for table in tables:
+            counts[table] = 0
+            for line in rows(table):
+                counts[table] += 1
+                yield '{"table": ' + dumps(table) + ', "data": ' + line + '}\n'
+        yield dumps({'export_summary': {'counts': counts, 'hashes': hashes}}) + '\n'
+        return
+
+    yield '{"export_info": ' + dumps(export_info) + ', "data": {'
+    for index, table in enumerate(tables):
+        counts[table] = 0
+        yield ('' if index == 0 else ', ') + dumps(table) + ': ['
+        for line in rows(table):
+            yield (',\n' if counts[table] else '\n') + line
+            counts[table] += 1
+        yield '\n]'
+    yield '}}\n'
+
+def iter_gzip(chunks: Iterator[str], level: int = 6) -> Iterator[bytes]:
+    """边生成边压缩为gzip字节流，用于流式HTTP响应"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def write_export(path: str, export_type: str = 'ndjson', compress: bool = False,
+                 tables: Optional[List[str]] = None, batch_size: int = 1000,
+                 info: Optional[Dict[str, Any]] = None, criteria: Optional[Dict[str, Any]] = None,
+                 hashes: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    """
+    流式写入导出文件，先写临时文件完成后再改名，避免留下不完整的备份
+
+    Args:
+        path: 输出文件路径
+        export_type: ndjson 或 json
+        compress: 是否gzip压缩
+        tables: 导出的表，默认全部
+        batch_size: 每批读取的行数
+        info: 附加到 export_info 中的信息
+        criteria: 表名 -> 过滤条件，用于增量导出
+        hashes: 传入字典时写入各表导出内容的SHA-256
+
+    Returns:
+        各表导出的行数
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    counts = {}
+    temp_path = path + '.tmp'
+    opener = gzip.open if compress else open
+    try:
+        with opener(temp_path, 'wt', encoding='utf-8') as f:
+            for chunk in iter_export(export_type, tables, batch_size, counts, info, criteria, hashes):
+                f.write(chunk)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return counts
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """分块计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def open_export(path: str):
+    """按文件头自动识别gzip，以文本方式打开导出文件"""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def read_export_info(path: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    读取导出文件的格式和 export_info，NDJSON只读取首行
+
+    Returns:
+        (格式, export_info)，旧版整体JSON备份返回其 backup_info 或 export_info
+    """
+    with open_export(path) as f:
+        first_line = f.readline()
+        try:
+            header = json.loads(first_line)
+            if 'export_info' in header and len(header) == 1:
+                return 'ndjson', header['export_info']
+        except ValueError:
+            pass
+        # 整体JSON文件需要完整解析
+        f.seek(0)
+        data = json.load(f)
+    return 'json', data.get('export_info') or data.get('backup_info') or {}
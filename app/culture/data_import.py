@@ -0,0 +1,346 @@
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator, Tuple, Callable
+from app import db
+from app.culture.models import CultureElement, EthnicGroup, CultureEthnicRelation, CulturePattern, PatternRecognitionResult
+from app.culture.data_export import EXPORT_TABLES, open_export
+from app.culture.vector_codec import encode_features, encode_matrix
+from app.caching import cache_invalidator
+from app.user.models import User
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('DataImport')
+
+# 字段校验规则：表名 -> {字段: (类型, 是否必填)}，类型也可以是转换函数（如向量编码）
+TABLE_SCHEMAS = {
+    'culture_elements': {
+        'id': (int, False), 'name': (str, True), 'description': (str, True), 'image': (str, False),
+        'created_at': (datetime, False), 'updated_at': (datetime, False)
+    },
+    'ethnic_groups': {
+        'id': (int, False), 'name': (str, True), 'description': (str, False), 'image': (str, False),
+        'created_at': (datetime, False), 'updated_at': (datetime, False)
+    },
+    'culture_ethnic_relations': {
+        'id': (int, False), 'culture_element_id': (int, False), 'ethnic_group_id': (int, False),
+        'culture_element': (str, False), 'ethnic_group': (str, False),
+        'culture': (str, True), 'customs': (str, True),
+        'created_at': (datetime, False), 'updated_at': (datetime, False)
+    },
+    'culture_patterns': {
+        'id': (int, False), 'name': (str, True), 'era': (str, False), 'region': (str, False),
+        'category': (str, False), 'carrier': (str, False), 'technique': (str, False),
+        'description': (str, False), 'image_url': (str, False), 'pattern_features': (str, False),
+        'similarity_score': (float, False), 'created_at': (datetime, False), 'updated_at': (datetime, False)
+    },
+    'recognition_results': {
+        'id': (int, False), 'pattern_id': (int, False), 'user_id': (int, False), 'input_image': (str, True),
+        'recognized_pattern': (str, True), 'recognition_score': (float, True), 'features': (encode_features, False),
+        'similarity_matrix': (encode_matrix, False), 'created_at': (datetime, False), 'updated_at': (datetime, False)
+    },
+}
+
+# 1.0版备份文件中的表名
+LEGACY_TABLE_NAMES = {'patterns': 'culture_patterns'}
+
+# 最多记录的校验错误数
+MAX_REPORTED_ERRORS = 50
+
+class ImportValidationError(ValueError):
+    """导入数据行不符合校验规则"""
+
+    def __init__(self, table: str, row_number: int, message: str):
+        super().__init__(f"{table} 第{row_number}行: {message}")
+        self.table = table
+        self.row_number = row_number
+
+def _coerce(value: Any, field_type: type) -> Any:
+    """按字段类型转换值，类型不符时抛出ValueError"""
+    if field_type is datetime:
+        return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if field_type is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError('应为数值')
+        return float(value)
+    if field_type is int:
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError('应为整数')
+        return value
+    if field_type is not str:
+        return field_type(value)
+    if not isinstance(value, str):
+        raise ValueError('应为字符串')
+    return value
+
+def validate_row(table: str, row: Any, row_number: int) -> Dict[str, Any]:
+    """
+    按 TABLE_SCHEMAS 校验并规整一行数据，忽略未知字段
+
+    Raises:
+        ImportValidationError: 表名未知、缺少必填字段或字段类型错误
+    """
+    schema = TABLE_SCHEMAS.get(table)
+    if schema is None:
+        raise ImportValidationError(table, row_number, '未知的数据表')
+    if not isinstance(row, dict):
+        raise ImportValidationError(table, row_number, '数据行应为对象')
+
+    cleaned = {}
+    for field, (field_type, required) in schema.items():
+        value = row.get(field)
+        if value is None or value == '' and field_type is not str:
+            if required:
+                raise ImportValidationError(table, row_number, f'缺少必填字段 {field}')
+            continue
+        try:
+            cleaned[field] = _coerce(value, field_type)
+        except (TypeError, ValueError) as e:
+            raise ImportValidationError(table, row_number, f'字段 {field} 无效: {str(e)}')
+    return cleaned
+
+def iter_records(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    逐条读取导出或备份文件，NDJSON逐行解析，旧版整体JSON文件一次性解析
+
+    Yields:
+        (表名, 行数据)
+    """
+    with open_export(path) as f:
+        first_line = f.readline()
+        try:
+            header = json.loads(first_line)
+        except ValueError:
+            header = None
+        if isinstance(header, dict) and 'export_info' in header and len(header) == 1:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'table' in record:
+                    yield record['table'], record.get('data')
+            return
+        f.seek(0)
+        data = json.load(f)
+    yield from iter_data_records(data)
+
+def iter_data_records(data: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """将 {"data": {表名: [...]}} 或 {表名: [...]} 结构的数据展开为记录，按外键依赖顺序输出"""
+    tables = data.get('data', data) if isinstance(data, dict) else {}
+    tables = {LEGACY_TABLE_NAMES.get(name, name): rows for name, rows in tables.items() if isinstance(rows, list)}
+    for table in EXPORT_TABLES:
+        for row in tables.pop(table, []):
+            yield table, row
+    # 未知表名交给校验报错
+    for table, rows in tables.items():
+        for row in rows:
+            yield table, row
+
+class CultureDataImporter:
+    """文化数据批量导入：校验、按自然键批量upsert、外键按内存映射解析，整个导入在一个事务中完成"""
+
+    def __init__(self, batch_size: int = 500, progress_callback: Optional[Callable[[str, int], None]] = None):
+        """
+        初始化导入器
+
+        Args:
+            batch_size: 每批写入的行数
+            progress_callback: 每批写入后调用，参数为表名和该表已处理行数
+        """
+        self.logger = logger
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+
+    def _reset(self):
+        # 目标库自然键 -> ID
+        self.element_ids = dict(db.session.query(CultureElement.name, CultureElement.id))
+        self.group_ids = dict(db.session.query(EthnicGroup.name, EthnicGroup.id))
+        self.pattern_ids = dict(db.session.query(CulturePattern.name, CulturePattern.id))
+        self.relation_ids = {(element_id, group_id): relation_id for relation_id, element_id, group_id in
+                             db.session.query(CultureEthnicRelation.id, CultureEthnicRelation.culture_element_id,
+                                              CultureEthnicRelation.ethnic_group_id)}
+        # 源数据ID -> 自然键，用于解析源数据中的外键
+        self.source_element_names = {}
+        self.source_group_names = {}
+        self.source_pattern_names = {}
+
+        self.stats = {table: {'inserted': 0, 'updated': 0, 'skipped': 0} for table in EXPORT_TABLES}
+        self.processed = {table: 0 for table in EXPORT_TABLES}
+        self.errors = []
+
+    def run(self, records: Iterator[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        执行导入，记录需按外键依赖顺序排列（导出文件即为此顺序）
+
+        存在校验错误时整体回滚，不写入任何数据
+
+        Returns:
+            导入结果，包含各表插入、更新、跳过的行数
+        """
+        self._reset()
+        try:
+            table, batch, row_number = None, [], 0
+            for record_table, row in records:
+                if record_table != table:
+                    self._flush(table, batch)
+                    table, batch, row_number = record_table, [], 0
+                row_number += 1
+                try:
+                    batch.append((row_number, validate_row(record_table, row, row_number)))
+                except ImportValidationError as e:
+                    self._error(str(e))
+                if len(batch) >= self.batch_size:
+                    self._flush(table, batch)
+                    batch = []
+            self._flush(table, batch)
+
+            if self.errors:
+                db.session.rollback()
+                return {
+                    "success": False,
+                    "error": f"数据校验失败，共 {len(self.errors)} 处错误，未导入任何数据",
+                    "errors": self.errors[:MAX_REPORTED_ERRORS]
+                }
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        from app.culture.graph_index import culture_graph_index
+        from app.culture.pattern_similarity import pattern_similarity_index
+        from app.culture.pattern_ann import pattern_ann_index
+        culture_graph_index.invalidate()
+        pattern_similarity_index.invalidate()
+        patterns = self.stats['culture_patterns']
+        if patterns['inserted'] or patterns['updated']:
+            pattern_ann_index.mark_stale()
+        return {
+            "success": True,
+            "stats": self.stats
+        }
+
+    def _error(self, message: str):
+        self.errors.append(message)
+
+    def _flush(self, table: Optional[str], batch: List[Tuple[int, Dict[str, Any]]]):
+        if not table or not batch or table not in TABLE_SCHEMAS:
+            return
+        if not self.errors:
+            getattr(self, f'_write_{table}')(batch)
+            db.session.flush()
+        self.processed[table] += len(batch)
+        if self.progress_callback:
+            self.progress_callback(table, self.processed[table])
+
+    def _upsert(self, table: str, model, rows: List[Dict[str, Any]], keys: List[Any], id_map: Dict[Any, int],
+                refresh: Callable[[List[Any]], Iterator[Tuple[Any, int]]]):
+        """按自然键拆分为批量更新和批量插入，插入后一次查询补全新行的ID"""
+        inserts, updates = {}, {}
+        for key, row in zip(keys, rows):
+            if key in id_map:
+                updates[key] = dict(row, id=id_map[key])
+            else:
+                inserts[key] = row
+        # 批量写入不触发flush事件，手动登记缓存失效
+        cache_invalidator.mark_changed(db.session, model, pks=[row['id'] for row in updates.values()])
+        if updates:
+            db.session.bulk_update_mappings(model, list(updates.values()))
+        if inserts:
+            db.session.bulk_insert_mappings(model, list(inserts.values()))
+            db.session.flush()
+            id_map.update(refresh(list(inserts)))
+        self.stats[table]['updated'] += len(updates)
+        self.stats[table]['inserted'] += len(inserts)
+        self.stats[table]['skipped'] += len(rows) - len(updates) - len(inserts)
+
+    def _upsert_by_name(self, table: str, model, batch, id_map: Dict[str, int], source_names: Dict[int, str]):
+        rows = []
+        for _, row in batch:
+            source_id = row.pop('id', None)
+            if source_id is not None:
+                # 增量备份中同一源ID改名时，沿用旧名称对应的目标行
+                previous_name = source_names.get(source_id)
+                if previous_name and previous_name != row['name'] and previous_name in id_map \
+                        and row['name'] not in id_map:
+                    id_map[row['name']] = id_map.pop(previous_name)
+                source_names[source_id] = row['name']
+            rows.append(row)
+        self._upsert(table, model, rows, [row['name'] for row in rows], id_map,
+                     lambda names: db.session.query(model.name, model.id).filter(model.name.in_(names)))
+
+    def _write_culture_elements(self, batch):
+        self._upsert_by_name('culture_elements', CultureElement, batch, self.element_ids, self.source_element_names)
+
+    def _write_ethnic_groups(self, batch):
+        self._upsert_by_name('ethnic_groups', EthnicGroup, batch, self.group_ids, self.source_group_names)
+
+    def _write_culture_patterns(self, batch):
+        self._upsert_by_name('culture_patterns', CulturePattern, batch, self.pattern_ids, self.source_pattern_names)
+
+    def _write_culture_ethnic_relations(self, batch):
+        rows, keys = [], []
+        for row_number, row in batch:
+            row.pop('id', None)
+            element_name = row.pop('culture_element', None) or self.source_element_names.get(row.get('culture_element_id'))
+            group_name = row.pop('ethnic_group', None) or self.source_group_names.get(row.get('ethnic_group_id'))
+            element_id = self.element_ids.get(element_name)
+            group_id = self.group_ids.get(group_name)
+            if element_id is None or group_id is None:
+                self._error(f"culture_ethnic_relations 第{row_number}行: 无法解析关联的文化元素或民族")
+                continue
+            row['culture_element_id'] = element_id
+            row['ethnic_group_id'] = group_id
+            rows.append(row)
+            keys.append((element_id, group_id))
+        if self.errors:
+            return
+
+        def refresh(pairs):
+            element_ids = {pair[0] for pair in pairs}
+            query = db.session.query(CultureEthnicRelation.culture_element_id, CultureEthnicRelation.ethnic_group_id,
+                                     CultureEthnicRelation.id).filter(CultureEthnicRelation.culture_element_id.in_(element_ids))
+            return [((element_id, group_id), relation_id) for element_id, group_id, relation_id in query]
+
+        self._upsert('culture_ethnic_relations', CultureEthnicRelation, rows, keys, self.relation_ids, refresh)
+
+    def _write_recognition_results(self, batch):
+        rows = []
+        for row_number, row in batch:
+            row.pop('id', None)
+            pattern_name = self.source_pattern_names.get(row.get('pattern_id')) or row['recognized_pattern']
+            pattern_id = self.pattern_ids.get(pattern_name)
+            if pattern_id is None:
+                self._error(f"recognition_results 第{row_number}行: 无法解析关联的文化图案")
+                continue
+            row['pattern_id'] = pattern_id
+            rows.append(row)
+        if self.errors or not rows:
+            return
+
+        # 识别结果没有自然键，按（图案、输入图像、创建时间）去重，每批一次查询
+        images = {row['input_image'] for row in rows}
+        existing = set(db.session.query(PatternRecognitionResult.pattern_id, PatternRecognitionResult.input_image,
+                                        PatternRecognitionResult.created_at)
+                       .filter(PatternRecognitionResult.input_image.in_(images)))
+        user_ids = {row['user_id'] for row in rows if row.get('user_id') is not None}
+        if user_ids:
+            user_ids = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(user_ids))}
+
+        inserts = []
+        for row in rows:
+            key = (row['pattern_id'], row['input_image'], row.get('created_at'))
+            if key in existing:
+                continue
+            existing.add(key)
+            if row.get('user_id') not in user_ids:
+                row['user_id'] = None
+            inserts.append(row)
+        if inserts:
+            db.session.bulk_insert_mappings(PatternRecognitionResult, inserts)
+            cache_invalidator.mark_changed(db.session, PatternRecognitionResult)
+        self.stats['recognition_results']['inserted'] += len(inserts)
+        self.stats['recognition_results']['skipped'] += len(rows) - len(inserts)
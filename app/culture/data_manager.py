@@ -1,10 +1,13 @@
 import os
-import json
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Callable
 from app.culture.knowledge_graph import KnowledgeGraphManager
 from app.culture.pattern_recognition import PatternRecognitionManager
+from app.culture.data_export import EXPORT_TYPES, iter_export, iter_gzip, write_export, read_export_info
+from app.culture.data_import import CultureDataImporter, iter_records, iter_data_records
+from app.culture.backup import IncrementalBackupManager, MANIFEST_NAME
+from app.culture.sync import culture_sync_engine
 from app import db
 
 # 设置日志
@@ -61,26 +64,27 @@ class CultureDataManager:
                 'timestamp': datetime.now().isoformat()
             }
     
-    def sync_data(self) -> Dict[str, Any]:
+    def sync_data(self, background: bool = True, resume: bool = True) -> Dict[str, Any]:
         """
         同步数据，确保知识图谱和纹样数据的一致性
         
+        修复识别结果与图案目录不一致的记录，删除孤立的文化-民族关系，
+        分块执行并记录检查点，多节点部署时同一时间只有一个节点执行
+        
+        Args:
+            background: 是否在后台线程执行，立即返回任务状态
+            resume: 是否从上次中断的检查点继续
+            
         Returns:
             同步结果
         """
         try:
-            # 这里可以实现数据同步逻辑，例如：
-            # 1. 检查知识图谱和纹样数据的一致性
-            # 2. 同步新增的数据
-            # 3. 更新过时的数据
-            # 4. 删除无效的数据
-            
-            self.logger.info("数据同步完成")
-            return {
-                "success": True,
-                "message": "数据同步完成",
-                "timestamp": datetime.now().isoformat()
-            }
+            if background:
+                result = culture_sync_engine.start(resume)
+            else:
+                result = culture_sync_engine.run(resume)
+            result['timestamp'] = datetime.now().isoformat()
+            return result
         except Exception as e:
             self.logger.error(f"数据同步失败: {str(e)}")
             return {
@@ -89,54 +93,54 @@ class CultureDataManager:
                 "timestamp": datetime.now().isoformat()
             }
     
-    def backup_data(self, backup_path: Optional[str] = None) -> Dict[str, Any]:
+    def get_sync_status(self) -> Dict[str, Any]:
         """
-        备份文化数据
+        获取数据同步任务状态
+        
+        Returns:
+            任务状态，包括阶段、检查点和各阶段修复数量
+        """
+        return culture_sync_engine.status()
+    
+    def backup_data(self, backup_path: Optional[str] = None, compress: bool = True,
+                    incremental: bool = False) -> Dict[str, Any]:
+        """
+        备份文化数据，按表分批读取并逐行写入NDJSON，内存占用与数据量无关
         
         Args:
-            backup_path: 备份路径，可选
+            backup_path: 备份路径，可选；增量备份时为备份目录
+            compress: 是否gzip压缩，默认压缩
+            incremental: 是否增量备份，首次增量备份为全量
             
         Returns:
             备份结果
         """
+        if incremental:
+            return IncrementalBackupManager(backup_path).backup(compress=compress)
+        
         try:
             # 默认备份路径
             if not backup_path:
-                backup_path = os.path.join(os.getcwd(), 'backups', f'culture_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+                suffix = '.ndjson.gz' if compress else '.ndjson'
+                backup_path = os.path.join(os.getcwd(), 'backups', f'culture_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}{suffix}')
             
-            # 确保备份目录存在
-            backup_dir = os.path.dirname(backup_path)
-            if not os.path.exists(backup_dir):
-                os.makedirs(backup_dir, exist_ok=True)
+            # 流式写入备份数据
+            counts = write_export(backup_path, 'ndjson', compress=compress, info={'kind': 'backup'})
             
-            # 获取所有文化数据
-            graph_data = self.knowledge_graph.get_all_culture_elements()
-            ethnic_groups = self.knowledge_graph.get_all_ethnic_groups()
-            patterns = self.pattern_recognition.get_culture_patterns()
-            
-            # 整合备份数据
-            backup_data = {
-                'backup_info': {
-                    'timestamp': datetime.now().isoformat(),
-                    'total_culture_elements': len(graph_data),
-                    'total_ethnic_groups': len(ethnic_groups),
-                    'total_patterns': len(patterns)
-                },
-                'culture_elements': graph_data,
-                'ethnic_groups': ethnic_groups,
-                'patterns': patterns
+            backup_info = {
+                'timestamp': datetime.now().isoformat(),
+                'total_culture_elements': counts.get('culture_elements', 0),
+                'total_ethnic_groups': counts.get('ethnic_groups', 0),
+                'total_patterns': counts.get('culture_patterns', 0),
+                'counts': counts
             }
             
-            # 保存备份数据
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, ensure_ascii=False, indent=4)
-            
             self.logger.info(f"文化数据备份完成，备份路径: {backup_path}")
             return {
                 "success": True,
                 "message": "文化数据备份完成",
                 "backup_path": backup_path,
-                "backup_info": backup_data['backup_info']
+                "backup_info": backup_info
             }
         except Exception as e:
             self.logger.error(f"文化数据备份失败: {str(e)}")
@@ -145,16 +149,24 @@ class CultureDataManager:
                 "error": f"文化数据备份失败: {str(e)}"
             }
     
-    def restore_data(self, backup_path: str) -> Dict[str, Any]:
+    def restore_data(self, backup_path: str, progress_callback: Optional[Callable[[str, int], None]] = None,
+                     batch_size: int = 500) -> Dict[str, Any]:
         """
-        从备份恢复文化数据
+        从备份恢复文化数据，逐行读取备份并分批upsert，整个恢复在一个事务中完成
         
         Args:
-            backup_path: 备份文件路径
+            backup_path: 备份文件路径，或增量备份目录及其清单文件
+            progress_callback: 进度回调，参数为表名和该表已处理行数
+            batch_size: 每批写入的行数
             
         Returns:
             恢复结果
         """
+        # 增量备份目录或清单文件：回放全量备份和之后的增量备份
+        if os.path.isdir(backup_path) or os.path.basename(backup_path) == MANIFEST_NAME:
+            backup_dir = backup_path if os.path.isdir(backup_path) else os.path.dirname(backup_path)
+            return IncrementalBackupManager(backup_dir).restore(progress_callback=progress_callback, batch_size=batch_size)
+        
         try:
             # 检查备份文件是否存在
             if not os.path.exists(backup_path):
@@ -163,22 +175,24 @@ class CultureDataManager:
                     "error": f"备份文件不存在: {backup_path}"
                 }
             
-            # 读取备份数据
-            with open(backup_path, 'r', encoding='utf-8') as f:
-                backup_data = json.load(f)
+            # 读取备份信息
+            backup_format, backup_info = read_export_info(backup_path)
             
-            # 这里可以实现数据恢复逻辑，例如：
-            # 1. 验证备份数据格式
-            # 2. 清空现有数据（可选，根据需求）
-            # 3. 导入备份数据
-            # 4. 验证恢复结果
+            # 流式读取并批量写入
+            importer = CultureDataImporter(batch_size=batch_size, progress_callback=progress_callback)
+            result = importer.run(iter_records(backup_path))
+            if not result['success']:
+                self.logger.error(f"文化数据恢复失败: {result['error']}")
+                return result
             
             self.logger.info(f"文化数据恢复完成，备份路径: {backup_path}")
             return {
                 "success": True,
                 "message": "文化数据恢复完成",
                 "backup_path": backup_path,
-                "restored_info": backup_data['backup_info']
+                "backup_format": backup_format,
+                "restored_info": backup_info,
+                "stats": result['stats']
             }
         except Exception as e:
             self.logger.error(f"文化数据恢复失败: {str(e)}")
@@ -214,28 +228,31 @@ class CultureDataManager:
                 "error": f"获取文化数据统计信息失败: {str(e)}"
             }
     
-    def import_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    def import_data(self, data: Dict[str, Any], progress_callback: Optional[Callable[[str, int], None]] = None,
+                    batch_size: int = 500) -> Dict[str, Any]:
         """
-        导入文化数据
+        导入文化数据，已存在的文化元素、民族、图案按名称更新，关系按（文化元素、民族）更新
         
         Args:
-            data: 要导入的数据
+            data: 要导入的数据，{"data": {表名: [...]}} 或 {表名: [...]}，与导出格式相同
+            progress_callback: 进度回调，参数为表名和该表已处理行数
+            batch_size: 每批写入的行数
             
         Returns:
             导入结果
         """
         try:
-            # 这里可以实现数据导入逻辑，例如：
-            # 1. 验证导入数据格式
-            # 2. 导入文化元素
-            # 3. 导入民族
-            # 4. 导入文化-民族关系
-            # 5. 导入文化图案
+            importer = CultureDataImporter(batch_size=batch_size, progress_callback=progress_callback)
+            result = importer.run(iter_data_records(data))
+            if not result['success']:
+                result['timestamp'] = datetime.now().isoformat()
+                return result
             
             self.logger.info("文化数据导入完成")
             return {
                 "success": True,
                 "message": "文化数据导入完成",
+                "stats": result['stats'],
                 "timestamp": datetime.now().isoformat()
             }
         except Exception as e:
@@ -246,107 +263,38 @@ class CultureDataManager:
                 "timestamp": datetime.now().isoformat()
             }
     
-    def export_data(self, export_type: str = 'json') -> Dict[str, Any]:
+    def export_data(self, export_type: str = 'json', export_path: Optional[str] = None,
+                    compress: bool = False) -> Dict[str, Any]:
         """
-        导出文化数据
+        导出文化数据到文件，按表分批读取并增量写入
         
         Args:
-            export_type: 导出类型，目前仅支持json
+            export_type: 导出类型，json（分块写入的JSON文档）或 ndjson
+            export_path: 导出文件路径，可选
+            compress: 是否gzip压缩
             
         Returns:
-            导出结果，包含导出的数据
+            导出结果，包含导出文件路径和各表行数
         """
         try:
-            if export_type != 'json':
+            if export_type not in EXPORT_TYPES:
                 return {
                     "success": False,
                     "error": f"不支持的导出类型: {export_type}"
                 }
             
-            # 获取所有文化数据
-            from app.culture.models import CultureElement, EthnicGroup, CultureEthnicRelation, CulturePattern, PatternRecognitionResult
-            
-            # 导出文化元素
-            culture_elements = []
-            for element in CultureElement.query.all():
-                culture_elements.append({
-                    'id': element.id,
-                    'name': element.name,
-                    'description': element.description,
-                    'image': element.image
-                })
-            
-            # 导出民族
-            ethnic_groups = []
-            for group in EthnicGroup.query.all():
-                ethnic_groups.append({
-                    'id': group.id,
-                    'name': group.name,
-                    'description': group.description,
-                    'image': group.image
-                })
+            # 默认导出路径
+            if not export_path:
+                suffix = f'.{export_type}' + ('.gz' if compress else '')
+                export_path = os.path.join(os.getcwd(), 'exports', f'culture_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}{suffix}')
             
-            # 导出文化-民族关系
-            relations = []
-            for relation in CultureEthnicRelation.query.all():
-                relations.append({
-                    'id': relation.id,
-                    'culture_element_id': relation.culture_element_id,
-                    'ethnic_group_id': relation.ethnic_group_id,
-                    'culture': relation.culture,
-                    'customs': relation.customs
-                })
-            
-            # 导出文化图案
-            patterns = []
-            for pattern in CulturePattern.query.all():
-                patterns.append({
-                    'id': pattern.id,
-                    'name': pattern.name,
-                    'era': pattern.era,
-                    'region': pattern.region,
-                    'category': pattern.category,
-                    'carrier': pattern.carrier,
-                    'technique': pattern.technique,
-                    'description': pattern.description,
-                    'image_url': pattern.image_url,
-                    'pattern_features': pattern.pattern_features,
-                    'similarity_score': pattern.similarity_score
-                })
-            
-            # 导出识别结果
-            recognition_results = []
-            for result in PatternRecognitionResult.query.all():
-                recognition_results.append({
-                    'id': result.id,
-                    'pattern_id': result.pattern_id,
-                    'user_id': result.user_id,
-                    'input_image': result.input_image,
-                    'recognized_pattern': result.recognized_pattern,
-                    'recognition_score': result.recognition_score,
-                    'features': result.features,
-                    'similarity_matrix': result.similarity_matrix
-                })
-            
-            # 整合导出数据
-            export_data = {
-                'export_info': {
-                    'type': export_type,
-                    'timestamp': datetime.now().isoformat(),
-                    'version': '1.0'
-                },
-                'data': {
-                    'culture_elements': culture_elements,
-                    'ethnic_groups': ethnic_groups,
-                    'culture_ethnic_relations': relations,
-                    'culture_patterns': patterns,
-                    'recognition_results': recognition_results
-                }
-            }
+            counts = write_export(export_path, export_type, compress=compress)
             
+            self.logger.info(f"文化数据导出完成，导出路径: {export_path}")
             return {
                 "success": True,
-                "data": export_data,
+                "export_path": export_path,
+                "counts": counts,
                 "message": "文化数据导出完成",
                 "timestamp": datetime.now().isoformat()
             }
@@ -357,3 +305,17 @@ class CultureDataManager:
                 "error": f"文化数据导出失败: {str(e)}",
                 "timestamp": datetime.now().isoformat()
             }
+    
+    def stream_export(self, export_type: str = 'ndjson', compress: bool = False) -> Iterator[Any]:
+        """
+        生成流式导出内容，用于HTTP响应
+        
+        Args:
+            export_type: 导出类型，ndjson 或 json
+            compress: 是否gzip压缩，压缩时生成字节片段
+            
+        Returns:
+            文本或字节片段的生成器
+        """
+        chunks = iter_export(export_type)
+        return iter_gzip(chunks) if compress else chunks
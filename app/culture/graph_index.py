@@ -0,0 +1,367 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple, Callable
+from app import db
+from app.culture.models import CultureElement, EthnicGroup, CultureEthnicRelation, CulturalPractice
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('CultureGraphIndex')
+
+class GraphData:
+    """
+    索引数据的一个版本：发布后不再修改，读取方拿到引用即可无锁遍历；
+    局部更新时复制出新版本修改后整体替换，邻接表中的列表也整体替换而不是原地修改
+    """
+
+    FIELDS = ('elements', 'element_ids_by_name', 'ethnic_groups', 'ethnic_group_ids_by_name', 'relations',
+              'element_relations', 'ethnic_group_relations', 'practices', 'relation_practices')
+
+    def __init__(self):
+        self.elements = {}  # 文化元素ID -> 文化元素数据
+        self.element_ids_by_name = {}  # 文化元素名称 -> 文化元素ID
+        self.ethnic_groups = {}  # 民族ID -> 民族数据
+        self.ethnic_group_ids_by_name = {}  # 民族名称 -> 民族ID
+        self.relations = {}  # 关系ID -> 关系数据
+        self.element_relations = {}  # 文化元素ID -> 关系ID列表
+        self.ethnic_group_relations = {}  # 民族ID -> 关系ID列表
+        self.practices = {}  # 习俗ID -> 习俗数据
+        self.relation_practices = {}  # 关系ID -> 习俗ID列表
+
+    def copy(self) -> 'GraphData':
+        """浅复制各字典，得到可修改的新版本"""
+        data = GraphData()
+        for field in self.FIELDS:
+            setattr(data, field, dict(getattr(self, field)))
+        return data
+
+    @staticmethod
+    def _append(adjacency: Dict[int, List[int]], key, value):
+        adjacency[key] = adjacency.get(key, []) + [value]
+
+    @staticmethod
+    def _discard(adjacency: Dict[int, List[int]], key, value):
+        ids = adjacency.get(key)
+        if ids and value in ids:
+            adjacency[key] = [item for item in ids if item != value]
+
+    def put_element(self, element_id, name, description, image):
+        old = self.elements.get(element_id)
+        if old and old['name'] != name:
+            self.element_ids_by_name.pop(old['name'], None)
+        self.elements[element_id] = {
+            'id': element_id,
+            'name': name,
+            'description': description,
+            'image': image
+        }
+        self.element_ids_by_name[name] = element_id
+
+    def put_ethnic_group(self, group_id, name, description, image):
+        old = self.ethnic_groups.get(group_id)
+        if old and old['name'] != name:
+            self.ethnic_group_ids_by_name.pop(old['name'], None)
+        self.ethnic_groups[group_id] = {
+            'id': group_id,
+            'name': name,
+            'description': description,
+            'image': image
+        }
+        self.ethnic_group_ids_by_name[name] = group_id
+
+    def put_relation(self, relation_id, culture_element_id, ethnic_group_id, culture, customs):
+        if relation_id in self.relations:
+            self.drop_relation(relation_id)
+        self.relations[relation_id] = {
+            'id': relation_id,
+            'culture_element_id': culture_element_id,
+            'ethnic_group_id': ethnic_group_id,
+            'culture': culture,
+            'customs': customs
+        }
+        self._append(self.element_relations, culture_element_id, relation_id)
+        self._append(self.ethnic_group_relations, ethnic_group_id, relation_id)
+
+    def put_practice(self, practice_id, name, description, relation_id):
+        old = self.practices.get(practice_id)
+        if old:
+            self._discard(self.relation_practices, old['relation_id'], practice_id)
+        self.practices[practice_id] = {
+            'id': practice_id,
+            'name': name,
+            'description': description,
+            'relation_id': relation_id
+        }
+        if relation_id is not None:
+            self._append(self.relation_practices, relation_id, practice_id)
+
+    def drop_relation(self, relation_id):
+        relation = self.relations.pop(relation_id, None)
+        if not relation:
+            return
+        self._discard(self.element_relations, relation['culture_element_id'], relation_id)
+        self._discard(self.ethnic_group_relations, relation['ethnic_group_id'], relation_id)
+
+class CultureGraphIndex:
+    """文化知识图谱内存索引，以邻接表保存 文化元素 -> 关系 -> 民族，图谱查询只做字典查找"""
+
+    def __init__(self, ttl: int = 300):
+        """
+        初始化图谱索引
+
+        Args:
+            ttl: 索引有效期（秒），超时后下次访问时整体重建，用于同步其他进程写入的数据
+        """
+        self.logger = logger
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._data = GraphData()
+
+    def is_stale(self) -> bool:
+        """判断索引是否需要重建"""
+        if self._built_at is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self._built_at > self.ttl
+
+    def ensure_built(self):
+        """确保索引可用，未构建或已过期时重建"""
+        if self.is_stale():
+            with self._lock:
+                if self.is_stale():
+                    self.rebuild()
+
+    def snapshot(self) -> GraphData:
+        """确保索引可用并返回当前版本，之后的重建和写入不影响该版本"""
+        self.ensure_built()
+        return self._data
+
+    def rebuild(self):
+        """从数据库一次性加载各表，在新版本中重建邻接表后整体替换"""
+        with self._lock:
+            data = GraphData()
+
+            # 只查询需要的列，避免构建ORM对象
+            for row in db.session.query(CultureElement.id, CultureElement.name,
+                                        CultureElement.description, CultureElement.image):
+                data.put_element(row.id, row.name, row.description, row.image)
+
+            for row in db.session.query(EthnicGroup.id, EthnicGroup.name,
+                                        EthnicGroup.description, EthnicGroup.image):
+                data.put_ethnic_group(row.id, row.name, row.description, row.image)
+
+            for row in db.session.query(CultureEthnicRelation.id, CultureEthnicRelation.culture_element_id,
+                                        CultureEthnicRelation.ethnic_group_id, CultureEthnicRelation.culture,
+                                        CultureEthnicRelation.customs).order_by(CultureEthnicRelation.id):
+                data.put_relation(row.id, row.culture_element_id, row.ethnic_group_id, row.culture, row.customs)
+
+            for row in db.session.query(CulturalPractice.id, CulturalPractice.name, CulturalPractice.description,
+                                        CulturalPractice.relation_id).order_by(CulturalPractice.id):
+                data.put_practice(row.id, row.name, row.description, row.relation_id)
+
+            self._data = data
+            self._built_at = time.monotonic()
+            self.logger.info(f"图谱索引重建完成: {len(data.elements)} 个文化元素, "
+                             f"{len(data.ethnic_groups)} 个民族, {len(data.relations)} 条关系, "
+                             f"{len(data.practices)} 个习俗")
+
+    def invalidate(self):
+        """使整个索引失效，下次访问时重建"""
+        with self._lock:
+            self._built_at = None
+
+    # 写入后的局部更新：索引尚未构建时无需处理，下次访问会整体加载
+
+    def _update(self, apply: Callable[[GraphData], None]):
+        """复制当前版本、修改后替换，正在遍历旧版本的读取方不受影响"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            data = self._data.copy()
+            apply(data)
+            self._data = data
+
+    def upsert_element(self, element: CultureElement):
+        """新增或更新文化元素后同步索引"""
+        self._update(lambda data: data.put_element(element.id, element.name, element.description, element.image))
+
+    def upsert_ethnic_group(self, group: EthnicGroup):
+        """新增或更新民族后同步索引"""
+        self._update(lambda data: data.put_ethnic_group(group.id, group.name, group.description, group.image))
+
+    def upsert_relation(self, relation: CultureEthnicRelation):
+        """新增或更新文化-民族关系后同步索引"""
+        self._update(lambda data: data.put_relation(relation.id, relation.culture_element_id,
+                                                    relation.ethnic_group_id, relation.culture, relation.customs))
+
+    def upsert_practice(self, practice: CulturalPractice):
+        """新增或更新文化习俗后同步索引"""
+        self._update(lambda data: data.put_practice(practice.id, practice.name, practice.description,
+                                                    practice.relation_id))
+
+    def remove_relation(self, relation_id: int):
+        """删除文化-民族关系后同步索引"""
+        self._update(lambda data: data.drop_relation(relation_id))
+
+    # 查询接口
+
+    def find_element(self, name: str) -> Optional[Dict[str, Any]]:
+        """按名称精确查找文化元素"""
+        data = self.snapshot()
+        element_id = data.element_ids_by_name.get(name)
+        return data.elements.get(element_id) if element_id is not None else None
+
+    def search_elements(self, keyword: str) -> List[Dict[str, Any]]:
+        """按名称或描述模糊查找文化元素，与 LIKE '%kw%' 一致（忽略大小写），按ID排序"""
+        data = self.snapshot()
+        needle = (keyword or '').casefold()
+        return [element for _, element in sorted(data.elements.items())
+                if needle in (element['name'] or '').casefold()
+                or needle in (element['description'] or '').casefold()]
+
+    def find_ethnic_group(self, name: str) -> Optional[Dict[str, Any]]:
+        """按名称精确查找民族"""
+        data = self.snapshot()
+        group_id = data.ethnic_group_ids_by_name.get(name)
+        return data.ethnic_groups.get(group_id) if group_id is not None else None
+
+    def get_element_relations(self, culture_element_id: int,
+                              ethnic_group_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        获取文化元素的民族关系，附带民族数据
+
+        Args:
+            culture_element_id: 文化元素ID
+            ethnic_group_id: 民族ID，可选，用于筛选
+
+        Returns:
+            关系列表，每条关系包含 ethnic_group 字段
+        """
+        data = self.snapshot()
+        result = []
+        for relation_id in data.element_relations.get(culture_element_id, ()):
+            relation = data.relations.get(relation_id)
+            if not relation:
+                continue
+            if ethnic_group_id is not None and relation['ethnic_group_id'] != ethnic_group_id:
+                continue
+            result.append(dict(relation, ethnic_group=data.ethnic_groups.get(relation['ethnic_group_id'])))
+        return result
+
+    # 多跳遍历
+    # 节点以 (类型, ID) 表示：element 文化元素、ethnic_group 民族、practice 习俗
+    # 文化元素与民族通过关系相连，习俗挂在关系上，与该关系两端的文化元素和民族相连
+
+    def _neighbors(self, data: GraphData, node: Tuple[str, int]) -> Iterator[Tuple[Tuple[str, int], int]]:
+        """返回节点的邻居及连接它们的关系ID"""
+        node_type, node_id = node
+        if node_type == 'practice':
+            practice = data.practices.get(node_id)
+            relation = data.relations.get(practice['relation_id']) if practice else None
+            if relation:
+                yield ('element', relation['culture_element_id']), relation['id']
+                yield ('ethnic_group', relation['ethnic_group_id']), relation['id']
+            return
+
+        if node_type == 'element':
+            relation_ids = data.element_relations.get(node_id, ())
+            other_end = ('ethnic_group', 'ethnic_group_id')
+        else:
+            relation_ids = data.ethnic_group_relations.get(node_id, ())
+            other_end = ('element', 'culture_element_id')
+
+        for relation_id in relation_ids:
+            relation = data.relations.get(relation_id)
+            if not relation:
+                continue
+            yield (other_end[0], relation[other_end[1]]), relation_id
+            for practice_id in data.relation_practices.get(relation_id, ()):
+                yield ('practice', practice_id), relation_id
+
+    def _node_data(self, data: GraphData, node: Tuple[str, int]) -> Optional[Dict[str, Any]]:
+        """将节点转换为响应数据"""
+        node_type, node_id = node
+        source = {
+            'element': data.elements,
+            'ethnic_group': data.ethnic_groups,
+            'practice': data.practices
+        }[node_type].get(node_id)
+        if not source:
+            return None
+        return {
+            'id': f'{node_type}:{node_id}',
+            'type': node_type,
+            'name': source['name'],
+            'description': source['description']
+        }
+
+    def expand(self, seed_element_ids: Iterable[int], max_hops: int = 2, max_nodes: int = 200,
+               include_practices: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        从若干文化元素出发做有界广度优先遍历，逐层产出结果
+
+        Args:
+            seed_element_ids: 起始文化元素ID
+            max_hops: 最大跳数
+            max_nodes: 最多返回的节点数
+            include_practices: 是否遍历文化习俗节点
+
+        Yields:
+            每一层的数据：depth、nodes、edges，最后一层带 truncated 标记
+        """
+        # 遍历开始时取当前版本：流式响应会在两层之间挂起，期间的重建和写入发布新版本，不影响本次遍历
+        data = self.snapshot()
+        visited = set()
+        frontier = []
+        nodes = []
+        for element_id in seed_element_ids:
+            node = ('element', element_id)
+            if node in visited or element_id not in data.elements:
+                continue
+            if len(visited) >= max_nodes:
+                break
+            visited.add(node)
+            frontier.append(node)
+            nodes.append(self._node_data(data, node))
+        truncated = False
+        yield {'depth': 0, 'nodes': nodes, 'edges': [], 'truncated': False}
+
+        seen_edges = set()
+        depth = 0
+        while frontier and depth < max_hops and not truncated:
+            depth += 1
+            next_frontier = []
+            nodes = []
+            edges = []
+            for node in frontier:
+                for neighbor, relation_id in self._neighbors(data, node):
+                    if neighbor[0] == 'practice' and not include_practices:
+                        continue
+                    if neighbor not in visited:
+                        if len(visited) >= max_nodes:
+                            truncated = True
+                            continue
+                        node_data = self._node_data(data, neighbor)
+                        if not node_data:
+                            continue
+                        visited.add(neighbor)
+                        next_frontier.append(neighbor)
+                        nodes.append(node_data)
+                    edge_key = (min(node, neighbor), max(node, neighbor), relation_id)
+                    if edge_key in seen_edges:
+                        continue
+                    seen_edges.add(edge_key)
+                    edges.append({
+                        'source': f'{node[0]}:{node[1]}',
+                        'target': f'{neighbor[0]}:{neighbor[1]}',
+                        'relation_id': relation_id
+                    })
+            frontier = next_frontier
+            yield {'depth': depth, 'nodes': nodes, 'edges': edges, 'truncated': truncated}
+
+# 进程内共享的索引实例
+culture_graph_index = CultureGraphIndex()
@@ -2,9 +2,10 @@ import os
 import json
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
 from app import db
 from app.culture.models import CultureElement, EthnicGroup, CultureEthnicRelation, CulturalPractice
+from app.culture.graph_index import CultureGraphIndex, culture_graph_index
 
 # 设置日志
 logging.basicConfig(
@@ -16,9 +17,15 @@ logger = logging.getLogger('KnowledgeGraph')
 class KnowledgeGraphManager:
     """知识图谱管理器，负责知识图谱的数据管理和操作"""
     
-    def __init__(self):
-        """初始化知识图谱管理器"""
+    def __init__(self, graph_index: Optional[CultureGraphIndex] = None):
+        """
+        初始化知识图谱管理器
+        
+        Args:
+            graph_index: 图谱内存索引，默认使用进程内共享索引
+        """
         self.logger = logger
+        self.graph_index = graph_index or culture_graph_index
     
     def get_culture_graph_data(self, keyword: str = '茶', ethnic_group: str = '全部', 
                               culture_type: str = '全部', aspect: str = '全部') -> Dict[str, Any]:
@@ -48,27 +55,18 @@ class KnowledgeGraphManager:
                 ]
             }
             
-            # 查询文化元素，支持模糊搜索
-            from sqlalchemy import or_
-            
-            # 先尝试精确匹配
-            culture_element = CultureElement.query.filter_by(name=keyword).first()
+            # 先尝试精确匹配（索引内字典查找，不访问数据库）
+            culture_element = self.graph_index.find_element(keyword)
             culture_elements = []
             
             if culture_element:
                 # 如果精确匹配到，直接使用
                 culture_elements = [culture_element]
-                self.logger.info(f'精确匹配到文化元素: {culture_element.name}')
+                self.logger.info(f'精确匹配到文化元素: {culture_element["name"]}')
             else:
                 # 如果没有精确匹配到，尝试模糊匹配
                 self.logger.info(f'未精确匹配到文化元素，尝试模糊匹配: {keyword}')
-                query = CultureElement.query.filter(
-                    or_(
-                        CultureElement.name.like(f'%{keyword}%'),
-                        CultureElement.description.like(f'%{keyword}%')
-                    )
-                )
-                culture_elements = query.all()
+                culture_elements = self.graph_index.search_elements(keyword)
                 self.logger.info(f'模糊匹配到 {len(culture_elements)} 个文化元素')
             
             # 如果没有找到匹配的文化元素，返回默认数据
@@ -79,52 +77,40 @@ class KnowledgeGraphManager:
             # 如果有多个匹配，取第一个
             culture_element = culture_elements[0]
             
-            # 查询文化-民族关系
-            relations_query = CultureEthnicRelation.query.filter_by(culture_element_id=culture_element.id)
-            
-            # 如果指定了民族，进行筛选
-            if ethnic_group and ethnic_group != '全部':
-                ethnic = EthnicGroup.query.filter_by(name=ethnic_group).first()
-                if ethnic:
-                    relations_query = relations_query.filter_by(ethnic_group_id=ethnic.id)
-            
             # 处理文化类型筛选
             if culture_type and culture_type != '全部':
                 self.logger.info(f'处理文化类型筛选: {culture_type}')
-                # 如果文化类型不是全部，先检查是否是精确匹配
-                culture_element_by_type = CultureElement.query.filter_by(name=culture_type).first()
+                # 如果文化类型精确匹配到文化元素，直接使用该文化元素
+                culture_element_by_type = self.graph_index.find_element(culture_type)
                 if culture_element_by_type:
-                    # 如果是精确匹配，直接使用该文化元素
                     culture_element = culture_element_by_type
-                    self.logger.info(f'文化类型精确匹配到文化元素: {culture_element.name}')
-                    # 重新查询关系
-                    relations_query = CultureEthnicRelation.query.filter_by(
-                        culture_element_id=culture_element.id
-                    )
-                    # 如果同时指定了民族，进一步筛选
-                    if ethnic_group and ethnic_group != '全部':
-                        ethnic = EthnicGroup.query.filter_by(name=ethnic_group).first()
-                        if ethnic:
-                            relations_query = relations_query.filter_by(ethnic_group_id=ethnic.id)
-                            self.logger.info(f'同时筛选民族: {ethnic.name}')
+                    self.logger.info(f'文化类型精确匹配到文化元素: {culture_element["name"]}')
             
-            relations = relations_query.all()
+            # 如果指定了民族，进行筛选
+            ethnic_group_id = None
+            if ethnic_group and ethnic_group != '全部':
+                ethnic = self.graph_index.find_ethnic_group(ethnic_group)
+                if ethnic:
+                    ethnic_group_id = ethnic['id']
+            
+            relations = self.graph_index.get_element_relations(culture_element['id'], ethnic_group_id)
             
             # 构建响应数据
             graph_data = {
-                'central_topic': culture_element.name,
-                'description': culture_element.description,
+                'central_topic': culture_element['name'],
+                'description': culture_element['description'],
                 'ethnic_groups': []
             }
             
             # 遍历关系，构建民族文化数据
             for relation in relations:
                 # 确保关系中的ethnic_group存在
-                if relation.ethnic_group:
+                ethnic = relation['ethnic_group']
+                if ethnic:
                     ethnic_data = {
-                        'name': relation.ethnic_group.name,
-                        'culture': relation.culture or f'{relation.ethnic_group.name}的{keyword}文化',
-                        'customs': relation.customs or f'{relation.ethnic_group.name}关于{keyword}的传统习俗'
+                        'name': ethnic['name'],
+                        'culture': relation['culture'] or f'{ethnic["name"]}的{keyword}文化',
+                        'customs': relation['customs'] or f'{ethnic["name"]}关于{keyword}的传统习俗'
                     }
                     graph_data['ethnic_groups'].append(ethnic_data)
             
@@ -140,6 +126,33 @@ class KnowledgeGraphManager:
             # 如果数据库查询失败，返回默认数据
             return default_graph_data
     
+    def expand_culture_graph(self, keyword: str = '', element_id: Optional[int] = None, max_hops: int = 2,
+                             max_nodes: int = 200, include_practices: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        多跳展开文化知识图谱：文化元素 <-> 民族 <-> 文化元素 <-> 文化习俗
+        
+        Args:
+            keyword: 关键词，精确匹配优先，否则以所有模糊匹配结果作为起点
+            element_id: 起始文化元素ID，指定时忽略关键词
+            max_hops: 最大跳数
+            max_nodes: 最多返回的节点数
+            include_practices: 是否包含文化习俗节点
+            
+        Returns:
+            逐层产出的图谱数据
+        """
+        if element_id is not None:
+            seed_ids = [element_id]
+        else:
+            exact = self.graph_index.find_element(keyword)
+            if exact:
+                seed_ids = [exact['id']]
+            else:
+                seed_ids = [element['id'] for element in self.graph_index.search_elements(keyword)]
+        self.logger.info(f"展开图谱，关键词: {keyword}, 起点数: {len(seed_ids)}, 跳数: {max_hops}, 节点上限: {max_nodes}")
+        return self.graph_index.expand(seed_ids, max_hops=max_hops, max_nodes=max_nodes,
+                                       include_practices=include_practices)
+    
     def add_culture_element(self, name: str, description: str, image: Optional[str] = None) -> Dict[str, Any]:
         """
         添加文化元素
@@ -170,6 +183,7 @@ class KnowledgeGraphManager:
             
             db.session.add(new_element)
             db.session.commit()
+            self.graph_index.upsert_element(new_element)
             
             return {
                 "success": True,
@@ -218,6 +232,7 @@ class KnowledgeGraphManager:
             
             db.session.add(new_group)
             db.session.commit()
+            self.graph_index.upsert_ethnic_group(new_group)
             
             return {
                 "success": True,
@@ -288,6 +303,7 @@ class KnowledgeGraphManager:
             
             db.session.add(new_relation)
             db.session.commit()
+            self.graph_index.upsert_relation(new_relation)
             
             return {
                 "success": True,
@@ -356,15 +372,15 @@ class KnowledgeGraphManager:
             文化-民族关系列表
         """
         try:
-            relations = CultureEthnicRelation.query.filter_by(culture_element_id=culture_element_id).all()
+            relations = self.graph_index.get_element_relations(culture_element_id)
             result = []
             for relation in relations:
                 result.append({
-                    'id': relation.id,
-                    'ethnic_group_id': relation.ethnic_group_id,
-                    'ethnic_group_name': relation.ethnic_group.name,
-                    'culture': relation.culture,
-                    'customs': relation.customs
+                    'id': relation['id'],
+                    'ethnic_group_id': relation['ethnic_group_id'],
+                    'ethnic_group_name': relation['ethnic_group']['name'] if relation['ethnic_group'] else None,
+                    'culture': relation['culture'],
+                    'customs': relation['customs']
                 })
             return result
         except Exception as e:
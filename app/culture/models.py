@@ -162,8 +162,9 @@ class PatternRecognitionResult(db.Model):
     input_image = db.Column(db.String(200), nullable=False)  # 输入图像路径
     recognized_pattern = db.Column(db.String(120), nullable=False)  # 识别出的纹样名称
     recognition_score = db.Column(db.Float, nullable=False)  # 识别评分
-    features = db.Column(db.Text, nullable=True)  # 识别特征向量
-    similarity_matrix = db.Column(db.Text, nullable=True)  # 相似度矩阵
+    # 特征向量和相似度矩阵以 float32 二进制存储（见 vector_codec），延迟加载，列表查询不读取
+    features = db.deferred(db.Column(db.LargeBinary, nullable=True))  # 识别特征向量
+    similarity_matrix = db.deferred(db.Column(db.LargeBinary, nullable=True))  # 相似度矩阵
     created_at = db.Column(db.DateTime, default=db.func.now())
     updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
     
@@ -186,4 +187,23 @@ class TourismResource(db.Model):
     updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
     
     def __repr__(self):
-        return '<TourismResource {}>'.format(self.name)
\ No newline at end of file
+        return '<TourismResource {}>'.format(self.name)
+
+# 数据同步任务状态模型
+class SyncJobState(db.Model):
+    """数据同步任务状态，兼作跨节点锁（持有者+租约）和断点续跑的检查点"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)  # 任务名称
+    status = db.Column(db.String(20), nullable=False, default='idle')  # idle/running/completed/failed
+    owner = db.Column(db.String(120), nullable=True)  # 当前持有锁的节点
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # 锁租约到期时间，过期后其他节点可接管
+    phase = db.Column(db.String(50), nullable=True)  # 当前阶段
+    checkpoint = db.Column(db.Integer, nullable=False, default=0)  # 当前阶段已处理到的最大ID
+    stats = db.Column(db.Text, nullable=True)  # 各阶段修复数量（JSON）
+    error = db.Column(db.Text, nullable=True)  # 最近一次失败原因
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    
+    def __repr__(self):
+        return '<SyncJobState {} {}>'.format(self.name, self.status)
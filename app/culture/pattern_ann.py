@@ -0,0 +1,573 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+from flask import has_app_context
+from app import db
+from app.culture.models import CulturePattern
+from app.culture.pattern_similarity import VECTOR_DIM, PatternSimilarityIndex, vectorize_pattern
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('PatternANN')
+
+CURRENT_FILE = 'CURRENT'
+DELTA_FILE = 'delta.npz'
+LOCK_FILE = 'LOCK'
+STALE_FILE = 'STALE'
+
+def spherical_kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10,
+                     seed: int = 0, chunk_size: int = 65536) -> np.ndarray:
+    """
+    球面K均值：向量均为单位向量，按内积分配簇，簇中心归一化
+
+    Args:
+        vectors: (n, d) 训练向量
+        clusters: 簇数量
+        iterations: 迭代次数
+
+    Returns:
+        (clusters, d) 的簇中心
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assign = assign_lists(vectors, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=clusters)
+        # 空簇随机重新选点
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """分块计算每个向量最近的簇中心"""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        block = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        assign[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+class PatternANNIndex:
+    """
+    图案特征的近似最近邻索引（IVF倒排文件）
+
+    向量按K均值簇分组后连续存放，查询时只扫描与查询最接近的 nprobe 个簇。
+    主数据以 .npy 保存并以内存映射方式加载，向量按float16存储；
+    新增图案先写入增量区（同样持久化），增量过大时在后台从数据库重建；
+    批量导入后整体标记为过期（同样持久化），重建完成前查询回退到精确搜索。
+    多个进程共享索引目录：增量区的读-改-写和版本切换都在目录文件锁内进行，
+    写入前先以磁盘上的当前版本和增量为准，重建期间新增的增量在切换时带入新版本。
+    nprobe 越大召回率越高、延迟越高
+    """
+
+    def __init__(self, index_dir: Optional[str] = None, nprobe: int = 8, min_size: int = 20000,
+                 max_delta_ratio: float = 0.1):
+        """
+        初始化索引
+
+        Args:
+            index_dir: 索引目录
+            nprobe: 默认扫描的簇数量
+            min_size: 图案数量达到该值才构建索引，之前使用精确矩阵搜索
+            max_delta_ratio: 增量区超过主数据的该比例时触发重建
+        """
+        self.logger = logger
+        self.app = None
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.max_delta_ratio = max_delta_ratio
+        self._lock = threading.RLock()
+        self._version = None
+        self._delta_mtime = None
+        self._checked_at = float('-inf')
+        self._building = False
+        self._rebuild_pending = False
+        self._stale = False
+        self._reset()
+
+    def init_app(self, app):
+        """读取配置并绑定应用"""
+        self.app = app
+        self.index_dir = app.config.get('PATTERN_ANN_DIR') or os.path.join(app.instance_path, 'pattern_ann')
+        self.nprobe = app.config.get('PATTERN_ANN_NPROBE', self.nprobe)
+        self.min_size = app.config.get('PATTERN_ANN_MIN_SIZE', self.min_size)
+
+    def _reset(self):
+        self.centroids = None
+        self.vectors = None
+        self.ids = None
+        self.offsets = None
+        self._sorted_ids = None
+        # 增量区：图案ID -> (向量, 簇号, 写入时间)；被更新或删除的图案ID -> 写入时间
+        self.delta = {}
+        self.deleted = {}
+        self._delta_cache = None
+
+    @property
+    def available(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self):
+        if not self.available:
+            return 0
+        return len(self.ids) - len(self.deleted) + len(self.delta)
+
+    # 持久化
+
+    @contextmanager
+    def _file_lock(self):
+        """索引目录的跨进程排他锁"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, LOCK_FILE), 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.index_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _version_dir(self, version: str) -> str:
+        return os.path.join(self.index_dir, version)
+
+    def load(self) -> bool:
+        """从磁盘加载当前版本的索引，主数据以内存映射方式打开"""
+        with self._lock:
+            version = self._read_current()
+            if version is None:
+                return False
+            path = self._version_dir(version)
+            try:
+                centroids = np.load(os.path.join(path, 'centroids.npy'))
+                vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+                ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+                offsets = np.load(os.path.join(path, 'offsets.npy'))
+            except (OSError, ValueError) as e:
+                self.logger.error(f"加载图案近似索引失败: {str(e)}")
+                return False
+            self._reset()
+            self.centroids, self.vectors, self.ids, self.offsets = centroids, vectors, ids, offsets
+            self._sorted_ids = np.sort(ids)
+            self._version = version
+            self._load_delta()
+            self.logger.info(f"图案近似索引已加载: 版本 {version}, {len(ids)} 个向量, {len(centroids)} 个簇")
+            return True
+
+    def _delta_path(self, version: Optional[str] = None) -> str:
+        return os.path.join(self._version_dir(version or self._version), DELTA_FILE)
+
+    @staticmethod
+    def _read_delta(path: str) -> Tuple[Dict[int, Tuple[np.ndarray, int, float]], Dict[int, float]]:
+        """读取增量文件，返回 (图案ID -> (向量, 簇号, 写入时间), 被更新或删除的图案ID -> 写入时间)"""
+        delta, deleted = {}, {}
+        if not os.path.exists(path):
+            return delta, deleted
+        with np.load(path) as data:
+            times = data['times'].tolist() if 'times' in data.files else [0.0] * len(data['ids'])
+            deleted_times = data['deleted_times'].tolist() if 'deleted_times' in data.files else [0.0] * len(data['deleted'])
+            for pattern_id, vector, list_id, written_at in zip(data['ids'].tolist(), data['vectors'],
+                                                               data['lists'].tolist(), times):
+                delta[pattern_id] = (vector, list_id, written_at)
+            deleted = dict(zip(data['deleted'].tolist(), deleted_times))
+        return delta, deleted
+
+    def _load_delta(self):
+        path = self._delta_path()
+        self._delta_cache = None
+        self._delta_mtime = None
+        self.delta, self.deleted = self._read_delta(path)
+        if os.path.exists(path):
+            self._delta_mtime = os.path.getmtime(path)
+
+    def _save_delta(self):
+        """写入增量文件，调用方持有目录文件锁"""
+        path = self._delta_path()
+        temp_path = path + '.tmp.npz'
+        ids, vectors, lists, deleted = self._delta_arrays()
+        np.savez(temp_path, ids=ids, vectors=vectors, lists=lists, deleted=deleted,
+                 times=np.array([self.delta[pattern_id][2] for pattern_id in ids.tolist()], dtype=np.float64),
+                 deleted_times=np.array([self.deleted[pattern_id] for pattern_id in deleted.tolist()],
+                                        dtype=np.float64))
+        os.replace(temp_path, path)
+        self._delta_mtime = os.path.getmtime(path)
+
+    def _sync_from_disk(self):
+        """持有目录文件锁时调用：以磁盘上的当前版本和增量为准，避免覆盖其他进程的写入或写入已删除的旧版本"""
+        version = self._read_current()
+        if version is not None and version != self._version:
+            self.load()
+        elif self.available:
+            self._load_delta()
+
+    def _stale_since(self) -> Optional[float]:
+        """读取过期标记的写入时间，未标记时返回None"""
+        try:
+            with open(os.path.join(self.index_dir, STALE_FILE), 'r', encoding='utf-8') as f:
+                return float(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return None
+
+    def _refresh(self):
+        """其他进程重建索引、写入增量或标记过期后重新加载，每秒最多检查一次"""
+        now = time.monotonic()
+        if now - self._checked_at < 1.0:
+            return
+        self._checked_at = now
+        self._stale = self._stale_since() is not None
+        version = self._read_current()
+        if version is None:
+            return
+        if version != self._version:
+            self.load()
+            return
+        path = self._delta_path()
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime != self._delta_mtime:
+            with self._lock:
+                self._load_delta()
+
+    def ensure_ready(self) -> bool:
+        """
+        确保索引可用：磁盘上有索引时加载，没有且图案数量足够时在后台构建
+
+        Returns:
+            索引当前是否可用，不可用或已过期时调用方应使用精确搜索
+        """
+        if self.index_dir is None:
+            return False
+        if self.available:
+            self._refresh()
+            return not self._stale
+        # 索引不存在时每分钟最多检查一次，避免每次查询都统计图案数量
+        now = time.monotonic()
+        if now - self._checked_at < 60:
+            return False
+        self._checked_at = now
+        if self.load():
+            self._stale = self._stale_since() is not None
+            return not self._stale
+        if has_app_context() and not self._building:
+            count = db.session.query(db.func.count(CulturePattern.id)).scalar() or 0
+            if count >= self.min_size:
+                self.start_build()
+        return False
+
+    # 构建
+
+    def build(self, batch_size: int = 10000, iterations: int = 10, train_size: int = 50000) -> Dict[str, Any]:
+        """
+        从数据库读取全部图案构建索引并切换为当前版本
+
+        Args:
+            batch_size: 每批读取的图案数
+            iterations: K均值迭代次数
+            train_size: K均值训练采样数量
+
+        Returns:
+            构建结果
+        """
+        started = time.monotonic()
+        # 读取数据库之前的时间，之后写入旧版本的增量在切换时带入新版本（留出时钟误差的余量）
+        snapshot_at = time.time() - 1.0
+        count = db.session.query(db.func.count(CulturePattern.id)).scalar() or 0
+        if count == 0:
+            return {"success": False, "error": "没有可索引的文化图案"}
+
+        vectors = np.zeros((count, VECTOR_DIM), dtype=np.float32)
+        ids = np.zeros(count, dtype=np.int64)
+        size = 0
+        query = db.session.query(*[getattr(CulturePattern, column) for column in PatternSimilarityIndex.COLUMNS])
+        for row in query.yield_per(batch_size):
+            if size == count:
+                break
+            vectors[size] = vectorize_pattern(row)
+            ids[size] = row.id
+            size += 1
+        vectors, ids = vectors[:size], ids[:size]
+
+        # 簇数量约为 sqrt(n)，每簇平均约 sqrt(n) 个向量
+        lists = int(min(max(np.sqrt(size), 1), 4096))
+        rng = np.random.default_rng(0)
+        sample = vectors if size <= train_size else vectors[rng.choice(size, train_size, replace=False)]
+        centroids = spherical_kmeans(sample, lists, iterations)
+        assign = assign_lists(vectors, centroids)
+        order = np.argsort(assign, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=lists))]).astype(np.int64)
+
+        version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        path = self._version_dir(version)
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'centroids.npy'), centroids)
+        np.save(os.path.join(path, 'vectors.npy'), vectors[order].astype(np.float16))
+        np.save(os.path.join(path, 'ids.npy'), ids[order])
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'size': int(size), 'lists': lists, 'dim': VECTOR_DIM,
+                       'created_at': datetime.now().isoformat()}, f)
+
+        # 在目录文件锁内原子切换当前版本：带入读取数据库之后写入旧版本的增量，再删除旧版本目录
+        # （已映射的进程仍可继续读取，写入增量前会先切换到新版本）
+        with self._lock, self._file_lock():
+            previous = self._read_current()
+            current_path = os.path.join(self.index_dir, CURRENT_FILE)
+            with open(current_path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(version)
+            os.replace(current_path + '.tmp', current_path)
+            self.load()
+            carried = 0
+            if previous and previous != version:
+                carried = self._carry_over(previous, snapshot_at)
+                shutil.rmtree(self._version_dir(previous), ignore_errors=True)
+            # 读取数据库之前标记的过期已包含在新版本中，之后的标记等待下一次重建
+            stale_since = self._stale_since()
+            if stale_since is not None and stale_since < snapshot_at:
+                os.remove(os.path.join(self.index_dir, STALE_FILE))
+                stale_since = None
+            self._stale = stale_since is not None
+
+        elapsed = round(time.monotonic() - started, 2)
+        self.logger.info(f"图案近似索引构建完成: {size} 个向量, {lists} 个簇, "
+                         f"带入 {carried} 条构建期间的增量, 耗时 {elapsed} 秒")
+        return {"success": True, "size": int(size), "lists": lists, "carried": carried, "seconds": elapsed}
+
+    def _carry_over(self, previous: str, since: float) -> int:
+        """
+        把旧版本中写入时间不早于 since 的增量应用到刚加载的新版本；
+        这些图案在构建读取数据库之后才新增、修改或删除，新版本的主数据中没有或不是最新值。
+        调用方持有线程锁和目录文件锁
+
+        Returns:
+            带入的增量条数
+        """
+        delta, deleted = self._read_delta(self._delta_path(previous))
+        changes = sorted([(written_at, pattern_id, vector) for pattern_id, (vector, _, written_at) in delta.items()
+                          if written_at >= since] +
+                         [(written_at, pattern_id, None) for pattern_id, written_at in deleted.items()
+                          if written_at >= since and pattern_id not in delta],
+                         key=lambda change: change[0])
+        if not changes:
+            return 0
+        for written_at, pattern_id, vector in changes:
+            if vector is None:
+                self._apply_remove(pattern_id, written_at)
+            else:
+                self._apply_add(pattern_id, vector, written_at)
+        self._save_delta()
+        return len(changes)
+
+    def start_build(self):
+        """在后台线程构建索引，构建期间再次请求时完成后重新构建一次"""
+        with self._lock:
+            if self.app is None:
+                return
+            if self._building:
+                self._rebuild_pending = True
+                return
+            self._building = True
+
+        def run():
+            with self.app.app_context():
+                try:
+                    while True:
+                        self._rebuild_pending = False
+                        self.build()
+                        if not self._rebuild_pending:
+                            break
+                except Exception as e:
+                    self.logger.error(f"图案近似索引构建失败: {str(e)}")
+                finally:
+                    self._building = False
+                    db.session.remove()
+
+        threading.Thread(target=run, name='pattern-ann-build', daemon=True).start()
+
+    # 增量更新
+
+    def _in_main(self, pattern_id: int) -> bool:
+        position = np.searchsorted(self._sorted_ids, pattern_id)
+        return position < len(self._sorted_ids) and self._sorted_ids[position] == pattern_id
+
+    def _apply_add(self, pattern_id: int, vector: np.ndarray, written_at: float):
+        vector = np.asarray(vector, dtype=np.float32)
+        list_id = int(np.argmax(self.centroids @ vector))
+        self.delta[pattern_id] = (vector, list_id, written_at)
+        if self._in_main(pattern_id):
+            self.deleted[pattern_id] = written_at
+        self._delta_cache = None
+
+    def _apply_remove(self, pattern_id: int, written_at: float):
+        self.delta.pop(pattern_id, None)
+        self.deleted[pattern_id] = written_at
+        self._delta_cache = None
+
+    def add(self, pattern_id: int, vector: np.ndarray):
+        """新增或修改图案后写入增量区（在目录文件锁内与磁盘上的增量合并），增量区过大时触发后台重建"""
+        with self._lock:
+            if self.index_dir is None:
+                return
+            with self._file_lock():
+                self._sync_from_disk()
+                if not self.available:
+                    return
+                self._apply_add(pattern_id, vector, time.time())
+                self._save_delta()
+            too_large = len(self.delta) > max(1000, len(self.ids) * self.max_delta_ratio)
+        if too_large:
+            self.start_build()
+
+    def remove(self, pattern_id: int):
+        """删除图案后同步索引"""
+        with self._lock:
+            if self.index_dir is None:
+                return
+            with self._file_lock():
+                self._sync_from_disk()
+                if not self.available:
+                    return
+                self._apply_remove(pattern_id, time.time())
+                self._save_delta()
+
+    def mark_stale(self):
+        """
+        批量导入或恢复图案后调用：标记索引过期并在后台重建
+
+        过期标记写入索引目录，所有进程在重建完成前都回退到精确搜索
+        """
+        with self._lock:
+            if self.index_dir is None:
+                return
+            with self._file_lock():
+                if self._read_current() is None:
+                    # 索引尚未构建，由 ensure_ready 按图案数量决定是否构建
+                    return
+                path = os.path.join(self.index_dir, STALE_FILE)
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    f.write(repr(time.time()))
+                os.replace(path + '.tmp', path)
+                self._stale = True
+        self.start_build()
+
+    # 查询
+
+    def _delta_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """增量区转换为数组后缓存，查询时向量化过滤"""
+        if self._delta_cache is None:
+            ids = list(self.delta)
+            self._delta_cache = (
+                np.array(ids, dtype=np.int64),
+                np.array([self.delta[pattern_id][0] for pattern_id in ids], dtype=np.float32).reshape(-1, VECTOR_DIM),
+                np.array([self.delta[pattern_id][1] for pattern_id in ids], dtype=np.int32),
+                np.array(sorted(self.deleted), dtype=np.int64)
+            )
+        return self._delta_cache
+
+    def search(self, vector: np.ndarray, top_k: int = 10, nprobe: Optional[int] = None,
+               exclude_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        查询最相似的图案
+
+        Args:
+            vector: 查询向量
+            top_k: 返回数量
+            nprobe: 扫描的簇数量，默认使用配置值
+            exclude_id: 需排除的图案ID
+
+        Returns:
+            [(图案ID, 相似度), ...]，按相似度降序
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            nprobe = int(min(max(nprobe or self.nprobe, 1), len(self.centroids)))
+            lists = np.argpartition(-(self.centroids @ vector), nprobe - 1)[:nprobe]
+            segments = [(self.offsets[list_id], self.offsets[list_id + 1]) for list_id in lists]
+            ids = np.concatenate([self.ids[start:end] for start, end in segments])
+            scores = np.concatenate([np.asarray(self.vectors[start:end], dtype=np.float32) @ vector
+                                     for start, end in segments])
+            delta_ids, delta_vectors, delta_lists, deleted = self._delta_arrays()
+            if len(deleted):
+                scores[np.isin(ids, deleted)] = -np.inf
+
+            # 增量区中落在所扫描簇内的向量
+            in_lists = np.isin(delta_lists, lists)
+            if in_lists.any():
+                ids = np.concatenate([ids, delta_ids[in_lists]])
+                scores = np.concatenate([scores, delta_vectors[in_lists] @ vector])
+
+        if exclude_id is not None:
+            scores[ids == exclude_id] = -np.inf
+        valid = np.isfinite(scores)
+        ids, scores = ids[valid], scores[valid]
+        k = min(top_k, len(ids))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(ids[row]), float(scores[row])) for row in top]
+
+    def recall(self, queries: np.ndarray, top_k: int = 10, nprobe: Optional[int] = None) -> Dict[str, Any]:
+        """
+        以主数据上的精确搜索为基准评估召回率和平均延迟，用于调整 nprobe
+
+        Args:
+            queries: (m, d) 查询向量
+            top_k: 每个查询比较的数量
+            nprobe: 扫描的簇数量
+
+        Returns:
+            包含 recall 和 latency_ms 的字典
+        """
+        hits, elapsed = 0, 0.0
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._lock:
+            vectors, ids = self.vectors, np.asarray(self.ids)
+        # 分块对主数据做精确搜索，避免一次性转换全部向量
+        exact_scores = np.concatenate([np.asarray(vectors[start:start + 65536], dtype=np.float32) @ queries.T
+                                       for start in range(0, len(ids), 65536)])
+        for index, query in enumerate(queries):
+            exact = set(ids[np.argsort(-exact_scores[:, index])[:top_k]].tolist())
+            started = time.perf_counter()
+            approximate = self.search(query, top_k, nprobe)
+            elapsed += time.perf_counter() - started
+            hits += len(exact & {pattern_id for pattern_id, _ in approximate})
+        total = max(len(queries) * top_k, 1)
+        return {
+            'recall': round(hits / total, 4),
+            'latency_ms': round(elapsed * 1000 / max(len(queries), 1), 3),
+            'nprobe': nprobe or self.nprobe
+        }
+
+# 进程内共享的近似索引实例
+pattern_ann_index = PatternANNIndex()
@@ -1,11 +1,27 @@
 import os
 import json
 import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
 from flask import current_app
+from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
+from sqlalchemy.orm import joinedload, undefer
 from app import db
 from app.culture.models import CulturePattern, PatternRecognitionResult
+from app.culture.pattern_similarity import (PatternSimilarityIndex, pattern_similarity_index, vectorize_pattern,
+                                           VECTOR_DIM)
+from app.culture.pattern_ann import PatternANNIndex, pattern_ann_index
+from app.culture.vector_codec import encode_features, encode_matrix, decode_array, decode_to_list
+from app.caching import cache_invalidator
+from app.storage.blobstore import blob_store, blob_name
+
+# 识别结果中体积较大、默认不在列表中返回的字段，通过 fields 参数请求
+RECOGNITION_VECTOR_FIELDS = ('features', 'similarity_matrix')
 
 # 设置日志
 logging.basicConfig(
@@ -14,12 +30,112 @@ logging.basicConfig(
 )
 logger = logging.getLogger('PatternRecognition')
 
+# 批量识别时提取特征的线程池，首次使用时按配置创建
+_feature_executor = None
+_feature_executor_lock = threading.Lock()
+
+def get_feature_executor() -> ThreadPoolExecutor:
+    """获取特征提取线程池（特征计算主要在 numpy 中进行，会释放GIL）"""
+    global _feature_executor
+    if _feature_executor is None:
+        with _feature_executor_lock:
+            if _feature_executor is None:
+                workers = current_app.config.get('PATTERN_BATCH_WORKERS', 4)
+                _feature_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pattern-features')
+    return _feature_executor
+
+def feature_vector(features: Any) -> np.ndarray:
+    """
+    将请求中的特征（数值列表、数值文本或特征标签）转换为单位特征向量
+
+    无特征或数值向量长度不是 VECTOR_DIM 时返回零向量，不参与匹配（特征仍原样存储）
+    """
+    encoded = encode_features(features)
+    vector = None if encoded is None else decode_array(encoded).reshape(-1)
+    if vector is None or vector.shape != (VECTOR_DIM,):
+        return np.zeros(VECTOR_DIM, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def extract_item_features(item: Dict[str, Any]) -> Tuple[Optional[np.ndarray], Optional[str],
+                                                         Optional[Tuple[str, int, str]], Optional[str]]:
+    """
+    提取单个批量识别条目的特征，在线程池中执行
+
+    上传的图像只写入内容寻址存储的对象目录，引用和对外链接在写入识别结果时于请求线程中登记
+
+    Args:
+        item: 条目，包含 input_image、features，上传的图像文件在 file 中
+
+    Returns:
+        (特征向量, 输入图像路径, 上传图像的 (sha256, 字节数, 引用路径), 错误信息)
+    """
+    blob = None
+    try:
+        input_image = item.get('input_image')
+        image_file = item.get('file')
+        if isinstance(image_file, FileStorage) and image_file.filename:
+            sha256, size = blob_store.ingest(image_file.stream)
+            input_image = f'uploads/culture/{blob_name(sha256, secure_filename(image_file.filename))}'
+            blob = (sha256, size, f'static:{input_image}')
+        if not input_image:
+            return None, None, blob, "缺少输入图像"
+        vector = feature_vector(item.get('features'))
+        if not vector.any():
+            return None, input_image, blob, "无法提取图像特征"
+        return vector, input_image, blob, None
+    except Exception as e:
+        return None, item.get('input_image'), blob, f"提取特征失败: {str(e)}"
+
 class PatternRecognitionManager:
     """纹样识别管理器，负责纹样识别的数据管理和操作"""
     
-    def __init__(self):
-        """初始化纹样识别管理器"""
+    def __init__(self, similarity_index: Optional[PatternSimilarityIndex] = None,
+                 ann_index: Optional[PatternANNIndex] = None):
+        """
+        初始化纹样识别管理器
+        
+        Args:
+            similarity_index: 图案相似度索引（精确搜索），默认使用进程内共享索引
+            ann_index: 图案近似最近邻索引，图案数量较多时用于识别匹配，默认使用进程内共享索引
+        """
         self.logger = logger
+        self.similarity_index = similarity_index or pattern_similarity_index
+        self.ann_index = ann_index or pattern_ann_index
+    
+    def match_pattern(self, vector, top_k: int = 1, nprobe: Optional[int] = None) -> List[Any]:
+        """
+        在全部图案中查找与特征向量最相似的图案，近似索引可用时使用近似索引，否则精确搜索
+        
+        Args:
+            vector: 特征向量
+            top_k: 返回数量
+            nprobe: 近似索引扫描的簇数量，越大召回率越高、延迟越高
+            
+        Returns:
+            [(图案ID, 相似度), ...]
+        """
+        if self.ann_index.ensure_ready():
+            return self.ann_index.search(vector, top_k, nprobe)
+        return self.similarity_index.search(vector, top_k)
+    
+    def match_patterns(self, vectors: np.ndarray, top_k: int = 1, nprobe: Optional[int] = None) -> List[List[Any]]:
+        """
+        批量匹配特征向量，精确搜索时全部向量在一次矩阵乘法中完成
+        
+        Args:
+            vectors: (m, VECTOR_DIM) 的特征向量
+            top_k: 每个向量返回的数量
+            nprobe: 近似索引扫描的簇数量
+            
+        Returns:
+            每个向量的 [(图案ID, 相似度), ...]
+        """
+        if not len(vectors):
+            return []
+        if self.ann_index.ensure_ready():
+            return [self.ann_index.search(vector, top_k, nprobe) for vector in vectors]
+        return self.similarity_index.search_batch(vectors, top_k)
     
     def get_culture_patterns(self, category: Optional[str] = None, region: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -111,6 +227,8 @@ class PatternRecognitionManager:
             
             db.session.add(new_pattern)
             db.session.commit()
+            self.similarity_index.upsert(new_pattern)
+            self.ann_index.add(new_pattern.id, vectorize_pattern(new_pattern))
             
             return {
                 "success": True,
@@ -130,8 +248,8 @@ class PatternRecognitionManager:
     
     def recognize_pattern(self, input_image: str, 
                         recognized_pattern: str, recognition_score: float,
-                        user_id: Optional[int] = None, features: Optional[str] = None, 
-                        similarity_matrix: Optional[str] = None, pattern_id: Optional[int] = None) -> Dict[str, Any]:
+                        user_id: Optional[int] = None, features: Optional[Any] = None, 
+                        similarity_matrix: Optional[Any] = None, pattern_id: Optional[int] = None) -> Dict[str, Any]:
         """
         记录纹样识别结果
         
@@ -140,22 +258,33 @@ class PatternRecognitionManager:
             input_image: 输入图像路径
             recognized_pattern: 识别出的纹样名称
             recognition_score: 识别评分
-            features: 识别特征向量
-            similarity_matrix: 相似度矩阵
-            pattern_id: 关联的文化图案ID
+            features: 识别特征向量（数值列表或文本）或特征标签，以 float32 二进制存储
+            similarity_matrix: 相似度矩阵（嵌套数值列表或JSON文本），以 float32 二进制存储
+            pattern_id: 关联的文化图案ID，为空时按 features 匹配最相似的图案
             
         Returns:
             操作结果
         """
         try:
+            # 未指定关联图案时，按特征在全库中匹配最相似的图案
+            vector = feature_vector(features) if pattern_id is None and features else None
+            if vector is not None and vector.any():
+                matches = self.match_pattern(vector)
+                matched_pattern = CulturePattern.query.get(matches[0][0]) if matches else None
+                # 索引中的图案可能已被删除，此时不关联图案
+                if matched_pattern is not None:
+                    pattern_id = matched_pattern.id
+                    recognized_pattern = recognized_pattern or matched_pattern.name
+                    recognition_score = round(max(matches[0][1], 0.0), 4)
+            
             # 创建新的识别结果记录
             new_result = PatternRecognitionResult(
                 user_id=user_id,
                 input_image=input_image,
                 recognized_pattern=recognized_pattern,
                 recognition_score=recognition_score,
-                features=features,
-                similarity_matrix=similarity_matrix,
+                features=encode_features(features),
+                similarity_matrix=encode_matrix(similarity_matrix),
                 pattern_id=pattern_id
             )
             
@@ -179,8 +308,115 @@ class PatternRecognitionManager:
                 "error": f"记录纹样识别结果失败: {str(e)}"
             }
     
+    def recognize_patterns_batch(self, items: List[Dict[str, Any]], user_id: Optional[int] = None,
+                                 top_k: int = 1, batch_size: int = 500) -> Dict[str, Any]:
+        """
+        批量纹样识别：线程池并行提取特征，一次向量化匹配全部条目，所有识别结果在同一事务中批量写入
+        
+        特征提取、匹配和提交都在返回前完成，调用方可以在发送响应前处理其中的异常
+        
+        Args:
+            items: 识别条目列表，每项包含 input_image、features（特征标签或特征向量）
+            user_id: 识别结果归属的用户ID
+            top_k: 每个条目返回的候选图案数量，第一个作为识别结果
+            batch_size: 每次批量插入的行数
+            
+        Returns:
+            {"results": [逐条识别结果], "summary": {...}}
+        """
+        # 并行提取特征，map 保持条目顺序
+        extracted = list(get_feature_executor().map(
+            extract_item_features, items))
+        
+        valid = [index for index, (_, _, _, error) in enumerate(extracted) if error is None]
+        vectors = np.stack([extracted[index][0] for index in valid]) if valid else np.zeros((0, VECTOR_DIM), dtype=np.float32)
+        matches = dict(zip(valid, self.match_patterns(vectors, top_k)))
+        
+        # 一次查询加载全部命中图案的名称
+        matched_ids = {candidates[0][0] for candidates in matches.values() if candidates}
+        names = dict(db.session.query(CulturePattern.id, CulturePattern.name)
+                     .filter(CulturePattern.id.in_(matched_ids))) if matched_ids else {}
+        
+        outcomes, rows, blob_refs = [], [], Counter()
+        for index, (vector, input_image, blob, error) in enumerate(extracted):
+            candidates = [(pattern_id, score) for pattern_id, score in matches.get(index, []) if pattern_id in names] \
+                if error is None else []
+            if error is None and not candidates:
+                error = "未匹配到文化图案"
+            if error is not None:
+                outcomes.append({"index": index, "success": False, "input_image": input_image, "error": error})
+                continue
+            pattern_id, score = candidates[0]
+            if blob is not None:
+                blob_refs[blob] += 1
+            rows.append({
+                'user_id': user_id,
+                'input_image': input_image,
+                'recognized_pattern': names[pattern_id],
+                'recognition_score': round(max(score, 0.0), 4),
+                'features': encode_features(vector),
+                'pattern_id': pattern_id
+            })
+            outcomes.append({
+                "index": index,
+                "success": True,
+                "input_image": input_image,
+                "pattern_id": pattern_id,
+                "recognized_pattern": names[pattern_id],
+                "recognition_score": rows[-1]['recognition_score'],
+                "candidates": [{"pattern_id": candidate_id, "similarity_score": round(candidate_score, 4)}
+                               for candidate_id, candidate_score in candidates],
+                "blob_key": blob[2] if blob is not None else None
+            })
+        
+        # 全部结果在同一事务中分块批量插入
+        error = None
+        try:
+            for start in range(0, len(rows), batch_size):
+                db.session.bulk_insert_mappings(PatternRecognitionResult, rows[start:start + batch_size])
+            cache_invalidator.mark_changed(db.session, PatternRecognitionResult)
+            # 上传图像的引用与识别结果同一事务提交
+            for (sha256, size, key), count in blob_refs.items():
+                blob_store.add_ref(sha256, size, key, count)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            error = f"批量写入识别结果失败: {str(e)}"
+            self.logger.error(error)
+        
+        # 提交后再创建对外链接，失败时识别结果已保存，只在对应条目上报告
+        link_errors = {}
+        if error is None:
+            for sha256, _, key in blob_refs:
+                try:
+                    blob_store.link(sha256, key)
+                except Exception as e:
+                    link_errors[key] = f"创建图像链接失败: {str(e)}"
+                    self.logger.error(f"{link_errors[key]} ({key})")
+        
+        for outcome in outcomes:
+            blob_key = outcome.pop("blob_key", None)
+            if blob_key in link_errors:
+                outcome["warning"] = link_errors[blob_key]
+        if error is not None:
+            outcomes = [{"index": outcome["index"], "success": False,
+                         "input_image": outcome["input_image"], "error": error} if outcome["success"] else outcome
+                        for outcome in outcomes]
+        
+        return {
+            "results": outcomes,
+            "summary": {
+                "total": len(items),
+                "recognized": len(rows) if error is None else 0,
+                "failed": len(items) - len(rows) if error is None else len(items),
+                "committed": error is None,
+                "error": error,
+                "link_errors": len(link_errors)
+            }
+        }
+    
     def get_recognition_results(self, user_id: Optional[int] = None, limit: int = 10, 
-                              offset: int = 0) -> Dict[str, Any]:
+                              offset: int = 0, fields: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         获取纹样识别结果列表
         
@@ -188,12 +424,18 @@ class PatternRecognitionManager:
             user_id: 用户ID，可选，用于筛选特定用户的识别结果
             limit: 返回结果数量限制
             offset: 结果偏移量
+            fields: 额外返回的字段（features、similarity_matrix），默认不读取也不返回
             
         Returns:
             识别结果列表
         """
         try:
-            query = PatternRecognitionResult.query
+            vector_fields = [field for field in RECOGNITION_VECTOR_FIELDS if fields and field in fields]
+            
+            # 预加载关联图案，避免逐条懒加载；请求的向量字段随列表一次查询读取
+            query = PatternRecognitionResult.query.options(
+                joinedload(PatternRecognitionResult.culture_pattern),
+                *[undefer(getattr(PatternRecognitionResult, field)) for field in vector_fields])
             
             # 应用筛选条件
             if user_id:
@@ -213,12 +455,12 @@ class PatternRecognitionManager:
                     'input_image': result.input_image,
                     'recognized_pattern': result.recognized_pattern,
                     'recognition_score': result.recognition_score,
-                    'features': result.features,
-                    'similarity_matrix': result.similarity_matrix,
                     'pattern_id': result.pattern_id,
                     'created_at': result.created_at.isoformat(),
                     'updated_at': result.updated_at.isoformat()
                 }
+                for field in vector_fields:
+                    result_dict[field] = decode_to_list(getattr(result, field))
                 
                 # 如果关联了文化图案，添加图案信息
                 if result.culture_pattern:
@@ -244,16 +486,18 @@ class PatternRecognitionManager:
                 "error": f"获取纹样识别结果列表失败: {str(e)}"
             }
     
-    def analyze_pattern_similarity(self, pattern_id: int, other_pattern_ids: List[int]) -> Dict[str, Any]:
+    def analyze_pattern_similarity(self, pattern_id: int, other_pattern_ids: Optional[List[int]] = None,
+                                   top_k: int = 10) -> Dict[str, Any]:
         """
-        分析图案相似度
+        分析图案相似度，基于特征向量的余弦相似度
         
         Args:
             pattern_id: 基准图案ID
-            other_pattern_ids: 其他图案ID列表
+            other_pattern_ids: 其他图案ID列表，为空时在全部图案中查找
+            top_k: 返回最相似的图案数量
             
         Returns:
-            相似度分析结果
+            相似度分析结果，按相似度降序
         """
         try:
             # 获取基准图案
@@ -264,35 +508,20 @@ class PatternRecognitionManager:
                     "error": f"未找到ID为 {pattern_id} 的文化图案"
                 }
             
-            # 获取其他图案
-            other_patterns = CulturePattern.query.filter(CulturePattern.id.in_(other_pattern_ids)).all()
+            # 一次矩阵运算计算全部候选图案的相似度
+            if other_pattern_ids:
+                top_k = len(other_pattern_ids)
+            matches = self.similarity_index.similar_to(pattern_id, top_k, other_pattern_ids or None) or []
             
-            # 简单的相似度计算（实际项目中应使用更复杂的算法）
-            similarity_results = []
-            for pattern in other_patterns:
-                # 这里使用简单的字符串相似度计算（实际项目中应使用图像处理算法）
-                # 示例：基于名称和特征的简单相似度
-                similarity_score = 0.0
-                
-                # 名称相似度（示例）
-                if base_pattern.name == pattern.name:
-                    similarity_score += 0.5
-                
-                # 特征相似度（示例）
-                if base_pattern.pattern_features and pattern.pattern_features:
-                    # 简单的字符串重叠率计算
-                    base_features = set(base_pattern.pattern_features.split(','))
-                    other_features = set(pattern.pattern_features.split(','))
-                    intersection = base_features.intersection(other_features)
-                    if base_features or other_features:
-                        similarity_score += len(intersection) / max(len(base_features), len(other_features)) * 0.5
-                
-                similarity_results.append({
-                    'pattern_id': pattern.id,
-                    'name': pattern.name,
-                    'similarity_score': round(similarity_score, 2),
-                    'image_url': pattern.image_url
-                })
+            # 批量加载命中的图案，保持相似度顺序
+            patterns = {pattern.id: pattern for pattern in
+                        CulturePattern.query.filter(CulturePattern.id.in_([match_id for match_id, _ in matches]))}
+            similarity_results = [{
+                'pattern_id': match_id,
+                'name': patterns[match_id].name,
+                'similarity_score': round(score, 4),
+                'image_url': patterns[match_id].image_url
+            } for match_id, score in matches if match_id in patterns]
             
             return {
                 "success": True,
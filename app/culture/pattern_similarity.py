@@ -0,0 +1,245 @@
+import re
+import time
+import zlib
+import logging
+import threading
+from typing import List, Any, Optional, Iterable, Tuple
+import numpy as np
+from app import db
+from app.culture.models import CulturePattern
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('PatternSimilarity')
+
+# 特征向量维度
+VECTOR_DIM = 256
+
+# 特征标签分隔符，兼容中英文逗号、顿号、分号和空白
+FEATURE_SEPARATOR = re.compile(r'[,，、;；\s]+')
+
+# 参与向量化的属性字段及权重，特征标签权重为1
+ATTRIBUTE_WEIGHTS = {
+    'category': 0.5,
+    'technique': 0.4,
+    'carrier': 0.3,
+    'era': 0.3,
+    'region': 0.3,
+}
+
+def split_features(pattern_features: Optional[str]) -> List[str]:
+    """将特征描述拆分为标签"""
+    if not pattern_features:
+        return []
+    return [tag for tag in FEATURE_SEPARATOR.split(pattern_features.strip().lower()) if tag]
+
+def _bucket(token: str) -> Tuple[int, float]:
+    """特征哈希：稳定的CRC32决定维度和符号，跨进程结果一致"""
+    digest = zlib.crc32(token.encode('utf-8'))
+    return digest % VECTOR_DIM, 1.0 if digest & 0x80000000 else -1.0
+
+def vectorize(pattern_features: Optional[str] = None, **attributes: Optional[str]) -> np.ndarray:
+    """
+    将图案的特征标签和属性转换为定长单位向量
+
+    Args:
+        pattern_features: 特征描述，逗号等分隔的标签
+        attributes: category、technique、carrier、era、region 等属性值
+
+    Returns:
+        float32 单位向量，无任何特征时为零向量
+    """
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for tag in set(split_features(pattern_features)):
+        index, sign = _bucket(f'tag:{tag}')
+        vector[index] += sign
+    for field, weight in ATTRIBUTE_WEIGHTS.items():
+        value = attributes.get(field)
+        if value:
+            index, sign = _bucket(f'{field}:{value.strip().lower()}')
+            vector[index] += sign * weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def parse_features(features: Any) -> np.ndarray:
+    """
+    将识别请求中的特征转换为单位向量
+
+    Args:
+        features: 特征标签文本，或长度为 VECTOR_DIM 的数值列表（已提取的特征向量）
+
+    Raises:
+        ValueError: 数值向量长度不符
+    """
+    if isinstance(features, (list, tuple)):
+        vector = np.asarray(features, dtype=np.float32)
+        if vector.shape != (VECTOR_DIM,):
+            raise ValueError(f"特征向量长度应为 {VECTOR_DIM}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    return vectorize(features)
+
+def vectorize_pattern(pattern) -> np.ndarray:
+    """将 CulturePattern（或具有相同字段的行）转换为特征向量"""
+    return vectorize(pattern.pattern_features, **{field: getattr(pattern, field) for field in ATTRIBUTE_WEIGHTS})
+
+class PatternSimilarityIndex:
+    """文化图案相似度索引：全部图案的特征向量存放在一个矩阵中，一次矩阵乘法完成全库余弦相似度计算"""
+
+    # 读取图案时查询的列
+    COLUMNS = ('id', 'pattern_features') + tuple(ATTRIBUTE_WEIGHTS)
+
+    def __init__(self, ttl: Optional[int] = 600):
+        """
+        初始化相似度索引
+
+        Args:
+            ttl: 索引有效期（秒），超时后下次查询时整体重建，用于同步其他进程写入的数据
+        """
+        self.logger = logger
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._reset()
+
+    def _reset(self, capacity: int = 1024):
+        self.matrix = np.zeros((capacity, VECTOR_DIM), dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.rows = {}  # 图案ID -> 矩阵行号
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def is_stale(self) -> bool:
+        """判断索引是否需要重建"""
+        if self._built_at is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self._built_at > self.ttl
+
+    def ensure_built(self):
+        """确保索引可用，未构建或已过期时重建"""
+        if self.is_stale():
+            with self._lock:
+                if self.is_stale():
+                    self.rebuild()
+
+    def rebuild(self, batch_size: int = 1000):
+        """分批读取全部图案重建矩阵"""
+        with self._lock:
+            count = db.session.query(db.func.count(CulturePattern.id)).scalar() or 0
+            self._reset(max(count, 1024))
+            query = db.session.query(*[getattr(CulturePattern, column) for column in self.COLUMNS])
+            for row in query.yield_per(batch_size):
+                self._set(row.id, vectorize_pattern(row))
+            self._built_at = time.monotonic()
+            self.logger.info(f"图案相似度索引重建完成: {self.size} 个图案")
+
+    def invalidate(self):
+        """使索引失效，下次查询时重建"""
+        with self._lock:
+            self._built_at = None
+
+    def _set(self, pattern_id: int, vector: np.ndarray):
+        row = self.rows.get(pattern_id)
+        if row is None:
+            if self.size == len(self.ids):
+                # 容量不足时倍增
+                self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+                self.ids = np.concatenate([self.ids, np.zeros_like(self.ids)])
+            row = self.size
+            self.rows[pattern_id] = row
+            self.ids[row] = pattern_id
+            self.size += 1
+        self.matrix[row] = vector
+
+    def upsert(self, pattern):
+        """新增或修改图案后同步索引，索引尚未构建时无需处理"""
+        with self._lock:
+            if self._built_at is not None:
+                self._set(pattern.id, vectorize_pattern(pattern))
+
+    def remove(self, pattern_id: int):
+        """删除图案后同步索引，用最后一行填补空位"""
+        with self._lock:
+            row = self.rows.pop(pattern_id, None)
+            if row is None:
+                return
+            last = self.size - 1
+            if row != last:
+                self.matrix[row] = self.matrix[last]
+                self.ids[row] = self.ids[last]
+                self.rows[int(self.ids[row])] = row
+            self.matrix[last] = 0
+            self.size = last
+
+    def vector_of(self, pattern_id: int) -> Optional[np.ndarray]:
+        """获取图案的特征向量"""
+        self.ensure_built()
+        with self._lock:
+            row = self.rows.get(pattern_id)
+            return None if row is None else self.matrix[row].copy()
+
+    def search_batch(self, vectors: np.ndarray, top_k: int = 10,
+                     exclude_ids: Optional[Iterable[Optional[int]]] = None,
+                     candidate_ids: Optional[List[int]] = None) -> List[List[Tuple[int, float]]]:
+        """
+        批量查询最相似的图案：一次矩阵乘法得到全部相似度，argpartition 取前K个
+
+        Args:
+            vectors: (m, VECTOR_DIM) 的查询向量
+            top_k: 每个查询返回的数量
+            exclude_ids: 与查询一一对应、需从结果中排除的图案ID（通常是查询图案自身）
+            candidate_ids: 只在这些图案中查找，默认全库
+
+        Returns:
+            每个查询的 [(图案ID, 相似度), ...]，按相似度降序
+        """
+        self.ensure_built()
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        exclude_ids = list(exclude_ids) if exclude_ids is not None else [None] * len(vectors)
+        with self._lock:
+            if candidate_ids is not None:
+                rows = np.array([self.rows[pattern_id] for pattern_id in candidate_ids if pattern_id in self.rows],
+                                dtype=np.int64)
+                matrix, ids = self.matrix[rows], self.ids[rows]
+            else:
+                matrix, ids = self.matrix[:self.size], self.ids[:self.size]
+            scores = vectors @ matrix.T
+
+        results = []
+        for query_scores, exclude_id in zip(scores, exclude_ids):
+            if exclude_id is not None:
+                query_scores[ids == exclude_id] = -np.inf
+            k = min(top_k, len(ids) - (1 if exclude_id is not None and exclude_id in ids else 0))
+            if k <= 0:
+                results.append([])
+                continue
+            top = np.argpartition(-query_scores, k - 1)[:k]
+            top = top[np.argsort(-query_scores[top], kind='stable')]
+            results.append([(int(ids[row]), float(query_scores[row])) for row in top])
+        return results
+
+    def search(self, vector: np.ndarray, top_k: int = 10, exclude_id: Optional[int] = None,
+               candidate_ids: Optional[List[int]] = None) -> List[Tuple[int, float]]:
+        """查询与单个向量最相似的图案"""
+        return self.search_batch(vector[np.newaxis, :], top_k, [exclude_id], candidate_ids)[0]
+
+    def similar_to(self, pattern_id: int, top_k: int = 10,
+                   candidate_ids: Optional[List[int]] = None) -> Optional[List[Tuple[int, float]]]:
+        """
+        查询与指定图案最相似的图案（不含自身）
+
+        Returns:
+            [(图案ID, 相似度), ...]，图案不存在时返回None
+        """
+        vector = self.vector_of(pattern_id)
+        if vector is None:
+            return None
+        return self.search(vector, top_k, pattern_id, candidate_ids)
+
+# 进程内共享的相似度索引实例
+pattern_similarity_index = PatternSimilarityIndex()
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, current_app, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import FileField, SubmitField, SelectMultipleField, StringField, SelectField
@@ -6,6 +6,7 @@ from wtforms.widgets import ListWidget, CheckboxInput
 from wtforms.validators import DataRequired
 from werkzeug.utils import secure_filename
 import os
+import json
 import random
 from datetime import datetime
 from app import db
@@ -14,6 +15,7 @@ from app.user.models import User
 from app.culture.knowledge_graph import KnowledgeGraphManager
 from app.culture.pattern_recognition import PatternRecognitionManager
 from app.culture.data_manager import CultureDataManager
+from app.storage import blob_store
 
 bp = Blueprint('culture', __name__)
 
@@ -90,10 +92,9 @@ def engine():
         try:
             image = form.image.data
             filename = secure_filename(image.filename)
-            upload_dir = os.path.join(current_app.root_path, 'static/uploads/culture')
-            os.makedirs(upload_dir, exist_ok=True)
-            image_path = os.path.join(upload_dir, filename)
-            image.save(image_path)
+            # 上传图像写入内容寻址存储，相同图像只保存一份，3张海报记录引用同一原图
+            _, key = blob_store.save(image.stream, 'static:uploads/culture', filename, count=3)
+            original_image = key.partition(':')[2]
             
             # 模拟AI生成结果
             generated_posters = []
@@ -117,8 +118,8 @@ def engine():
                 # 保存生成记录到数据库
                 generated_poster = EthnicImpression(
                     user_id=current_user.id if current_user.is_authenticated else None,
-                    original_image=f'uploads/culture/{filename}',
-                    generated_image=f'uploads/culture/{filename.replace(".", f"_var{i+1}.")}',  # 生成不同版本的图像名称
+                    original_image=original_image,
+                    generated_image=original_image.replace(".", f"_var{i+1}."),  # 生成不同版本的图像名称
                     title=f'民族融合海报_{i+1}',
                     description=f'融合了{ethnic_elements_str}文化元素的海报设计_{i+1} - {variation_styles[i]}',
                     ethnic_elements=ethnic_elements_str  # 保存到数据库
@@ -134,10 +135,10 @@ def engine():
             
             # 渲染结果页面
             # 调试：打印路径
-            print(f"Original Image Path: uploads/culture/{filename}")
+            print(f"Original Image Path: {original_image}")
             for idx, poster in enumerate(generated_posters):
                 print(f"Generated Image {idx+1} Path: {poster.generated_image}")
-            return render_template('culture/engine_result.html', original_image=f'uploads/culture/{filename}', posters=generated_posters, form=favorite_form)
+            return render_template('culture/engine_result.html', original_image=original_image, posters=generated_posters, form=favorite_form)
         except Exception as e:
             # 处理所有可能的错误
             error_message = f'生成海报时发生错误: {str(e)}'
@@ -192,6 +193,54 @@ def get_culture_graph():
             'message': f'获取图谱数据失败: {str(e)}'
         }), 500
 
+# 多跳展开的参数上限
+GRAPH_EXPAND_MAX_HOPS = 5
+GRAPH_EXPAND_MAX_NODES = 1000
+
+@bp.route('/api/culture/graph/expand', methods=['GET'])
+def expand_culture_graph():
+    """
+    多跳展开文化知识图谱
+    按层返回节点和边，stream=1 时以NDJSON逐层流式输出
+    """
+    try:
+        # 获取查询参数
+        keyword = request.args.get('keyword', '茶')
+        element_id = request.args.get('element_id', type=int)
+        hops = min(max(request.args.get('hops', type=int, default=2), 0), GRAPH_EXPAND_MAX_HOPS)
+        max_nodes = min(max(request.args.get('max_nodes', type=int, default=200), 1), GRAPH_EXPAND_MAX_NODES)
+        include_practices = request.args.get('include_practices', '1') != '0'
+        stream = request.args.get('stream', '0') == '1'
+        
+        levels = knowledge_graph_manager.expand_culture_graph(keyword, element_id, hops, max_nodes, include_practices)
+        
+        if stream:
+            def generate():
+                for level in levels:
+                    yield json.dumps(level, ensure_ascii=False) + '\n'
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        # 非流式时合并所有层
+        graph_data = {'nodes': [], 'edges': [], 'levels': 0, 'truncated': False}
+        for level in levels:
+            for node in level['nodes']:
+                node['depth'] = level['depth']
+                graph_data['nodes'].append(node)
+            graph_data['edges'].extend(level['edges'])
+            graph_data['levels'] = level['depth']
+            graph_data['truncated'] = level['truncated']
+        
+        return jsonify({
+            'success': True,
+            'data': graph_data
+        })
+    except Exception as e:
+        print(f'展开图谱数据失败: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': f'展开图谱数据失败: {str(e)}'
+        }), 500
+
 @bp.route('/api/culture/patterns', methods=['GET'])
 def get_patterns():
     """
@@ -217,6 +266,9 @@ def get_patterns():
             'message': f'获取文化图案列表失败: {str(e)}'
         }), 500
 
+# 相似图案查询数量上限
+PATTERN_SIMILARITY_MAX_TOP_K = 100
+
 @bp.route('/api/culture/recognize-pattern', methods=['POST'])
 def recognize_pattern():
     """
@@ -252,6 +304,68 @@ def recognize_pattern():
             'message': f'纹样识别失败: {str(e)}'
         }), 500
 
+@bp.route('/api/culture/recognize-pattern/batch', methods=['POST'])
+def recognize_pattern_batch():
+    """
+    批量纹样识别API
+    JSON请求体 {"items": [{"input_image", "features"}], "top_k"}，
+    或 multipart 表单上传多个 images 文件，features 按顺序与文件对应；
+    识别结果归属当前登录用户，未登录时不关联用户；
+    识别和写入完成后以NDJSON逐条返回识别结果，最后一行为汇总
+    """
+    try:
+        max_items = current_app.config.get('PATTERN_BATCH_MAX_ITEMS', 1000)
+        
+        if request.files:
+            images = request.files.getlist('images')
+            features = request.form.getlist('features')
+            items = [{'file': image, 'features': features[i] if i < len(features) else None}
+                     for i, image in enumerate(images)]
+            top_k = request.form.get('top_k', 1)
+        else:
+            data = request.get_json() or {}
+            items = data.get('items') or []
+            top_k = data.get('top_k', 1)
+        
+        if not items:
+            return jsonify({
+                'success': False,
+                'message': '识别条目不能为空'
+            }), 400
+        if len(items) > max_items:
+            return jsonify({
+                'success': False,
+                'message': f'单次最多识别 {max_items} 个条目'
+            }), 400
+        if not all(isinstance(item, dict) for item in items):
+            return jsonify({
+                'success': False,
+                'message': '识别条目格式错误'
+            }), 400
+        try:
+            top_k = min(max(int(top_k), 1), PATTERN_SIMILARITY_MAX_TOP_K)
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'top_k参数无效'
+            }), 400
+        
+        user_id = current_user.id if current_user.is_authenticated else None
+        result = pattern_recognition_manager.recognize_patterns_batch(items, user_id, top_k)
+        
+        # 识别和提交已完成，只流式输出结果
+        def generate():
+            for outcome in result['results']:
+                yield json.dumps(outcome, ensure_ascii=False) + '\n'
+            yield json.dumps({'summary': result['summary']}, ensure_ascii=False) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
+    except Exception as e:
+        print(f'批量纹样识别失败: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': f'批量纹样识别失败: {str(e)}'
+        }), 500
+
 @bp.route('/api/culture/recognition-results', methods=['GET'])
 def get_recognition_results():
     """
@@ -262,9 +376,11 @@ def get_recognition_results():
         user_id = request.args.get('user_id', type=int)
         limit = request.args.get('limit', type=int, default=10)
         offset = request.args.get('offset', type=int, default=0)
+        # 特征向量等大字段默认不返回，如 fields=features,similarity_matrix
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
         
         # 使用纹样识别管理器获取结果
-        results = pattern_recognition_manager.get_recognition_results(user_id, limit, offset)
+        results = pattern_recognition_manager.get_recognition_results(user_id, limit, offset, fields)
         
         return jsonify(results)
     except Exception as e:
@@ -278,11 +394,13 @@ def get_recognition_results():
 def analyze_pattern_similarity():
     """
     分析图案相似度
+    未指定 other_pattern_ids 时在全部图案中返回最相似的 top_k 个
     """
     try:
         # 获取查询参数
         pattern_id = request.args.get('pattern_id', type=int)
         other_pattern_ids = request.args.getlist('other_pattern_ids', type=int)
+        top_k = min(max(request.args.get('top_k', type=int, default=10), 1), PATTERN_SIMILARITY_MAX_TOP_K)
         
         if not pattern_id:
             return jsonify({
@@ -291,7 +409,7 @@ def analyze_pattern_similarity():
             }), 400
         
         # 使用纹样识别管理器分析相似度
-        result = pattern_recognition_manager.analyze_pattern_similarity(pattern_id, other_pattern_ids)
+        result = pattern_recognition_manager.analyze_pattern_similarity(pattern_id, other_pattern_ids, top_k)
         
         return jsonify(result)
     except Exception as e:
@@ -301,6 +419,51 @@ def analyze_pattern_similarity():
             'message': f'分析图案相似度失败: {str(e)}'
         }), 500
 
+@bp.route('/api/culture/pattern-index', methods=['GET'])
+@login_required
+def get_pattern_index_status():
+    """
+    查询图案近似索引状态，提供 nprobe 时以随机图案为查询评估召回率和延迟（top_k 最大100）
+    """
+    try:
+        ann_index = pattern_recognition_manager.ann_index
+        data = {
+            'available': ann_index.ensure_ready(),
+            'size': len(ann_index),
+            'nprobe': ann_index.nprobe
+        }
+        nprobe = request.args.get('nprobe', type=int)
+        if nprobe and data['available']:
+            import numpy as np
+            rng = np.random.default_rng()
+            sample = rng.choice(len(ann_index.ids), min(20, len(ann_index.ids)), replace=False)
+            queries = np.asarray(ann_index.vectors[np.sort(sample)], dtype=np.float32)
+            top_k = max(min(request.args.get('top_k', 10, type=int), 100), 1)
+            data['evaluation'] = ann_index.recall(queries, top_k, nprobe)
+        
+        return jsonify({
+            'success': True,
+            'data': data
+        })
+    except Exception as e:
+        print(f'获取图案索引状态失败: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': f'获取图案索引状态失败: {str(e)}'
+        }), 500
+
+@bp.route('/api/culture/pattern-index', methods=['POST'])
+@login_required
+def rebuild_pattern_index():
+    """
+    在后台重建图案近似索引
+    """
+    pattern_recognition_manager.ann_index.start_build()
+    return jsonify({
+        'success': True,
+        'message': '图案索引重建已启动'
+    }), 202
+
 @bp.route('/api/culture/combined-data', methods=['GET'])
 def get_combined_culture_data():
     """
@@ -347,15 +510,17 @@ def get_culture_stats():
         }), 500
 
 @bp.route('/api/culture/sync-data', methods=['POST'])
+@login_required
 def sync_data():
     """
     同步文化数据
     """
     try:
-        # 使用数据管理器同步数据
-        result = culture_data_manager.sync_data()
+        # 使用数据管理器启动后台同步，resume=0 时从头开始
+        resume = request.args.get('resume', '1') != '0'
+        result = culture_data_manager.sync_data(resume=resume)
         
-        return jsonify(result)
+        return jsonify(result), (202 if result['success'] else 409)
     except Exception as e:
         print(f'数据同步失败: {str(e)}')
         return jsonify({
@@ -363,6 +528,68 @@ def sync_data():
             'message': f'数据同步失败: {str(e)}'
         }), 500
 
+@bp.route('/api/culture/sync-data', methods=['GET'])
+def get_sync_status():
+    """
+    查询数据同步任务状态
+    """
+    try:
+        return jsonify({
+            'success': True,
+            'data': culture_data_manager.get_sync_status()
+        })
+    except Exception as e:
+        print(f'获取数据同步状态失败: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': f'获取数据同步状态失败: {str(e)}'
+        }), 500
+
+@bp.route('/api/culture/import', methods=['POST'])
+@login_required
+def import_culture_data():
+    """
+    批量导入文化数据，请求体格式与导出的JSON格式相同
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({
+                'success': False,
+                'message': '请求体应为JSON对象'
+            }), 400
+        
+        result = culture_data_manager.import_data(data)
+        return jsonify(result), (200 if result['success'] else 400)
+    except Exception as e:
+        print(f'文化数据导入失败: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': f'文化数据导入失败: {str(e)}'
+        }), 500
+
+@bp.route('/api/culture/export', methods=['GET'])
+@login_required
+def export_culture_data():
+    """
+    流式导出文化数据，支持 format=ndjson|json 和 gzip=1
+    """
+    export_type = request.args.get('format', 'ndjson')
+    compress = request.args.get('gzip', '0') in ('1', 'true')
+    if export_type not in ('ndjson', 'json'):
+        return jsonify({
+            'success': False,
+            'message': f'不支持的导出类型: {export_type}'
+        }), 400
+
+    filename = f'culture_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{export_type}' + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else ('application/x-ndjson' if export_type == 'ndjson' else 'application/json')
+    return Response(
+        stream_with_context(culture_data_manager.stream_export(export_type, compress)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}', 'X-Accel-Buffering': 'no'}
+    )
+
 @bp.route('/api/culture/elements', methods=['GET'])
 def get_culture_elements():
     """
@@ -0,0 +1,304 @@
+import os
+import json
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any
+from sqlalchemy import select, update, delete, exists, func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from flask import has_app_context
+from app import db
+from app.culture.models import (CultureElement, EthnicGroup, CultureEthnicRelation, CulturalPractice,
+                                CulturePattern, PatternRecognitionResult, SyncJobState)
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('CultureSync')
+
+JOB_NAME = 'culture_sync'
+
+# 任务状态
+IDLE = 'idle'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+# 同步阶段，按顺序执行：阶段名 -> 按ID分块扫描的模型
+PHASES = {
+    'relink_results': PatternRecognitionResult,
+    'rename_results': PatternRecognitionResult,
+    'orphan_relations': CultureEthnicRelation,
+}
+
+class SyncLockError(RuntimeError):
+    """其他节点正在执行同步"""
+
+class CultureSyncEngine:
+    """
+    知识图谱与纹样目录的数据同步：
+
+    1. relink_results：识别结果关联的图案已不存在时，按识别出的纹样名称重新关联
+    2. rename_results：识别结果的 recognized_pattern 与关联图案名称不一致时，以图案名称为准
+    3. orphan_relations：删除文化元素或民族已不存在的文化-民族关系及其下的习俗
+
+    每个阶段按主键分块执行集合式SQL，每块与检查点在同一事务中提交，中断后从检查点继续；
+    sync_job_state 表中的持有者和租约作为跨节点锁，同一时间只有一个节点执行同步
+    """
+
+    def __init__(self, chunk_size: int = 1000, lease_seconds: int = 300):
+        """
+        初始化同步引擎
+
+        Args:
+            chunk_size: 每块处理的ID范围
+            lease_seconds: 锁租约时长（秒），每处理一块续约一次，节点宕机后租约过期即可被接管
+        """
+        self.logger = logger
+        self.app = None
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self.node_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """读取配置并绑定应用"""
+        self.app = app
+        self.chunk_size = app.config.get('CULTURE_SYNC_CHUNK_SIZE', self.chunk_size)
+        self.lease_seconds = app.config.get('CULTURE_SYNC_LEASE_SECONDS', self.lease_seconds)
+
+    # 跨节点锁
+
+    def _state(self) -> SyncJobState:
+        state = SyncJobState.query.filter_by(name=JOB_NAME).first()
+        if state is None:
+            try:
+                db.session.add(SyncJobState(name=JOB_NAME, status=IDLE, checkpoint=0))
+                db.session.commit()
+            except IntegrityError:
+                # 其他节点同时创建
+                db.session.rollback()
+            state = SyncJobState.query.filter_by(name=JOB_NAME).first()
+        return state
+
+    def _acquire(self) -> bool:
+        """
+        以条件更新抢占锁：无持有者或租约已过期时成功；
+        本节点已持有时同样失败，同一进程内的两个线程不会同时执行同步
+        """
+        self._state()
+        now = datetime.utcnow()
+        result = db.session.execute(
+            update(SyncJobState.__table__)
+            .where(SyncJobState.name == JOB_NAME)
+            .where(or_(SyncJobState.owner.is_(None), SyncJobState.lease_expires_at < now))
+            .values(owner=self.node_id, lease_expires_at=now + timedelta(seconds=self.lease_seconds))
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _renew(self):
+        """
+        以本节点持有为条件续约，锁已被其他节点接管时中止；
+        在写入检查点的事务开始时调用，条件更新同时锁定状态行，本事务之后对状态的修改不会覆盖新持有者
+        """
+        result = db.session.execute(
+            update(SyncJobState.__table__)
+            .where(SyncJobState.name == JOB_NAME, SyncJobState.owner == self.node_id)
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+        )
+        if result.rowcount != 1:
+            raise SyncLockError("同步锁已被其他节点接管")
+
+    def _release(self):
+        db.session.execute(
+            update(SyncJobState.__table__)
+            .where(SyncJobState.name == JOB_NAME, SyncJobState.owner == self.node_id)
+            .values(owner=None, lease_expires_at=None)
+        )
+        db.session.commit()
+
+    # 各阶段的集合式修复，均限定在 [start, end] 的ID范围内
+
+    def _relink_results(self, start: int, end: int) -> int:
+        results = PatternRecognitionResult.__table__
+        patterns = CulturePattern.__table__
+        pattern_missing = ~exists().where(patterns.c.id == results.c.pattern_id)
+        name_match = select(func.min(patterns.c.id)).where(patterns.c.name == results.c.recognized_pattern)
+        return db.session.execute(
+            update(results)
+            .where(results.c.id.between(start, end), pattern_missing,
+                   exists().where(patterns.c.name == results.c.recognized_pattern))
+            .values(pattern_id=name_match.scalar_subquery())
+        ).rowcount
+
+    def _rename_results(self, start: int, end: int) -> int:
+        results = PatternRecognitionResult.__table__
+        patterns = CulturePattern.__table__
+        mismatch = exists().where(and_(patterns.c.id == results.c.pattern_id,
+                                       patterns.c.name != results.c.recognized_pattern))
+        pattern_name = select(patterns.c.name).where(patterns.c.id == results.c.pattern_id)
+        return db.session.execute(
+            update(results)
+            .where(results.c.id.between(start, end), mismatch)
+            .values(recognized_pattern=pattern_name.scalar_subquery())
+        ).rowcount
+
+    def _orphan_relations(self, start: int, end: int) -> int:
+        relations = CultureEthnicRelation.__table__
+        orphaned = select(relations.c.id).where(
+            relations.c.id.between(start, end),
+            or_(~exists().where(CultureElement.__table__.c.id == relations.c.culture_element_id),
+                ~exists().where(EthnicGroup.__table__.c.id == relations.c.ethnic_group_id))
+        )
+        practices = CulturalPractice.__table__
+        # 先删除挂在孤立关系下的习俗，再删除关系
+        db.session.execute(
+            delete(practices).where(practices.c.relation_id.in_(orphaned))
+        )
+        # 再查一次ID，避免 MySQL 不允许在 DELETE 中引用目标表
+        orphan_ids = [relation_id for (relation_id,) in db.session.execute(orphaned)]
+        if not orphan_ids:
+            return 0
+        return db.session.execute(
+            delete(relations).where(relations.c.id.in_(orphan_ids))
+        ).rowcount
+
+    def _unresolved_results(self) -> int:
+        """修复后仍无法关联到图案的识别结果数量"""
+        patterns = CulturePattern.__table__
+        return db.session.query(func.count(PatternRecognitionResult.id)).filter(
+            ~exists().where(patterns.c.id == PatternRecognitionResult.pattern_id)
+        ).scalar()
+
+    def run(self, resume: bool = True) -> Dict[str, Any]:
+        """
+        在当前线程执行同步
+
+        Args:
+            resume: 是否从上次中断的检查点继续，否则从头开始
+
+        Returns:
+            同步结果，包含各阶段修复的行数
+        """
+        if not self._acquire():
+            return {
+                "success": False,
+                "error": "其他节点正在执行数据同步"
+            }
+        try:
+            self._renew()
+            state = self._state()
+            phases = list(PHASES)
+            if not resume or state.status not in (FAILED, RUNNING) or state.phase not in phases:
+                state.phase = phases[0]
+                state.checkpoint = 0
+                state.stats = json.dumps({phase: 0 for phase in phases})
+                state.started_at = datetime.utcnow()
+            state.status = RUNNING
+            state.error = None
+            state.finished_at = None
+            db.session.commit()
+            stats = json.loads(state.stats)
+
+            for phase in phases[phases.index(state.phase):]:
+                model = PHASES[phase]
+                max_id = db.session.query(func.max(model.id)).scalar() or 0
+                if state.phase != phase:
+                    state.phase = phase
+                    state.checkpoint = 0
+                start = state.checkpoint + 1
+                while start <= max_id:
+                    end = start + self.chunk_size - 1
+                    self._renew()
+                    stats[phase] += getattr(self, f'_{phase}')(start, end)
+                    # 修复结果与检查点在同一事务中提交
+                    state.checkpoint = end
+                    state.stats = json.dumps(stats)
+                    db.session.commit()
+                    start = end + 1
+
+            self._renew()
+            stats['unresolved_results'] = self._unresolved_results()
+            state.status = COMPLETED
+            state.stats = json.dumps(stats)
+            state.finished_at = datetime.utcnow()
+            db.session.commit()
+
+            if stats['orphan_relations']:
+                from app.culture.graph_index import culture_graph_index
+                culture_graph_index.invalidate()
+
+            self.logger.info(f"数据同步完成: {stats}")
+            return {
+                "success": True,
+                "message": "数据同步完成",
+                "stats": stats
+            }
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"数据同步失败: {str(e)}")
+            db.session.execute(
+                update(SyncJobState.__table__)
+                .where(SyncJobState.name == JOB_NAME, SyncJobState.owner == self.node_id)
+                .values(status=FAILED, error=str(e))
+            )
+            db.session.commit()
+            return {
+                "success": False,
+                "error": f"数据同步失败: {str(e)}"
+            }
+        finally:
+            self._release()
+
+    def start(self, resume: bool = True) -> Dict[str, Any]:
+        """
+        在后台线程启动同步，立即返回当前状态
+
+        Args:
+            resume: 是否从上次中断的检查点继续
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return {"success": False, "error": "本节点的数据同步正在执行", "job": self.status()}
+
+            state = self.status()
+            if state['locked']:
+                return {"success": False, "error": "其他节点正在执行数据同步", "job": state}
+
+            self._thread = threading.Thread(target=self._run_in_context, args=(resume,),
+                                            name='culture-sync', daemon=True)
+            self._thread.start()
+        return {"success": True, "message": "数据同步任务已启动", "job": state}
+
+    def _run_in_context(self, resume: bool):
+        with self.app.app_context():
+            try:
+                self.run(resume)
+            finally:
+                db.session.remove()
+
+    def status(self) -> Dict[str, Any]:
+        """查询同步任务状态"""
+        if not has_app_context():
+            with self.app.app_context():
+                return self.status()
+        state = self._state()
+        return {
+            'status': state.status,
+            'phase': state.phase,
+            'checkpoint': state.checkpoint,
+            'stats': json.loads(state.stats) if state.stats else {},
+            'error': state.error,
+            'locked': bool(state.owner and state.lease_expires_at and state.lease_expires_at > datetime.utcnow()),
+            'started_at': state.started_at.isoformat() if state.started_at else None,
+            'finished_at': state.finished_at.isoformat() if state.finished_at else None
+        }
+
+# 进程内共享的同步引擎
+culture_sync_engine = CultureSyncEngine()
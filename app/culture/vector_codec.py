@@ -0,0 +1,92 @@
+import json
+import struct
+from typing import Any, List, Optional
+import numpy as np
+from app.culture.pattern_similarity import FEATURE_SEPARATOR, vectorize
+
+# 二进制格式：版本号(1字节) + 维数(1字节) + 各维长度(uint32) + float32小端数据
+CODEC_VERSION = 1
+_HEADER = struct.Struct('<BB')
+_DIM = struct.Struct('<I')
+
+def encode_array(array: np.ndarray) -> bytes:
+    """将数组编码为紧凑的 float32 二进制"""
+    array = np.ascontiguousarray(array, dtype='<f4')
+    header = _HEADER.pack(CODEC_VERSION, array.ndim) + b''.join(_DIM.pack(dim) for dim in array.shape)
+    return header + array.tobytes()
+
+def decode_array(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    """
+    解码 encode_array 生成的二进制，只读视图不复制数据
+
+    Raises:
+        ValueError: 版本号或长度不符
+    """
+    if blob is None:
+        return None
+    version, ndim = _HEADER.unpack_from(blob)
+    if version != CODEC_VERSION:
+        raise ValueError(f"不支持的向量编码版本: {version}")
+    offset = _HEADER.size
+    shape = tuple(_DIM.unpack_from(blob, offset + i * _DIM.size)[0] for i in range(ndim))
+    offset += ndim * _DIM.size
+    return np.frombuffer(blob, dtype='<f4', count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+def _parse_numbers(value: Any) -> Optional[np.ndarray]:
+    """解析数值数组：列表、JSON文本或分隔符分隔的数字文本，无法解析时返回None"""
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return None
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = [token for token in FEATURE_SEPARATOR.split(text) if token]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = [value]
+    if not isinstance(value, (list, tuple, np.ndarray)):
+        return None
+    try:
+        return np.asarray(value, dtype=np.float32)
+    except (TypeError, ValueError):
+        return None
+
+def encode_features(features: Any) -> Optional[bytes]:
+    """
+    编码识别特征向量
+
+    Args:
+        features: 数值列表、JSON或分隔的数字文本；特征标签文本按 vectorize 转换为特征向量
+
+    Returns:
+        二进制，特征为空时返回None
+    """
+    if features is None or isinstance(features, bytes):
+        return features
+    vector = _parse_numbers(features)
+    if vector is None:
+        if not isinstance(features, str) or not features.strip():
+            return None
+        vector = vectorize(features)
+    return encode_array(vector.reshape(-1))
+
+def encode_matrix(matrix: Any) -> Optional[bytes]:
+    """
+    编码相似度矩阵
+
+    Raises:
+        ValueError: 无法解析为数值数组（如不规则的嵌套列表）
+    """
+    if matrix is None or isinstance(matrix, bytes):
+        return matrix
+    array = _parse_numbers(matrix)
+    if array is None:
+        if isinstance(matrix, str) and not matrix.strip():
+            return None
+        raise ValueError("相似度矩阵应为数值数组")
+    return encode_array(array)
+
+def decode_to_list(blob: Optional[bytes]) -> Optional[List[Any]]:
+    """解码为可JSON序列化的列表"""
+    array = decode_array(blob)
+    return None if array is None else array.tolist()
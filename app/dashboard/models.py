@@ -0,0 +1,35 @@
+from app import db
+
+# 看板统计汇总，每个统计范围一行，看板只读取这一行
+class DashboardStats(db.Model):
+    """看板统计汇总：由提交钩子增量更新，定期全量校准"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)  # 统计范围，目前只有 global
+    total_users = db.Column(db.Integer, nullable=False, default=0)
+    total_stories = db.Column(db.Integer, nullable=False, default=0)
+    total_tasks = db.Column(db.Integer, nullable=False, default=0)
+    total_user_tasks = db.Column(db.Integer, nullable=False, default=0)
+    completed_tasks = db.Column(db.Integer, nullable=False, default=0)
+    rebuilt_at = db.Column(db.DateTime, nullable=True)  # 最近一次全量校准时间
+    rebuild_lease_until = db.Column(db.DateTime, nullable=True)  # 全量构建租约，到期前其他请求或进程不能同时构建
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    
+    def __repr__(self):
+        return '<DashboardStats {}>'.format(self.name)
+
+# 统计时间序列，按小时和天分桶记录新增数量
+class StatsBucket(db.Model):
+    """统计时间序列：每个指标在每个时间桶内的新增数量"""
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)  # 时间桶起点
+    metric = db.Column(db.String(50), nullable=False)  # users, stories, tasks, user_tasks, completed_tasks
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    # 唯一约束用于增量更新时定位时间桶，同时作为按指标查询时间范围的索引
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'metric', 'bucket_start', name='uq_stats_bucket'),
+    )
+    
+    def __repr__(self):
+        return '<StatsBucket {} {} {}={}>'.format(self.granularity, self.bucket_start, self.metric, self.value)
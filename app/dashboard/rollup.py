@@ -0,0 +1,410 @@
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, update, insert, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from app import db
+from app.dashboard.models import DashboardStats, StatsBucket
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('StatsRollup')
+
+SCOPE = 'global'
+
+# 时间桶粒度
+GRANULARITIES = ('hour', 'day')
+
+# 指标 -> 汇总行中的总数字段
+METRICS = {
+    'users': 'total_users',
+    'stories': 'total_stories',
+    'tasks': 'total_tasks',
+    'user_tasks': 'total_user_tasks',
+    'completed_tasks': 'completed_tasks',
+}
+
+# 单次查询时间序列的最大桶数
+MAX_SERIES_BUCKETS = 24 * 90
+
+# 活跃用户统计窗口
+ACTIVE_USER_DAYS = 30
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """时间所在时间桶的起点，粒度为 minute、hour 或 day"""
+    moment = moment.replace(second=0, microsecond=0)
+    if granularity == 'minute':
+        return moment
+    moment = moment.replace(minute=0)
+    return moment.replace(hour=0) if granularity == 'day' else moment
+
+def bucket_step(granularity: str) -> timedelta:
+    return {'minute': timedelta(minutes=1), 'day': timedelta(days=1)}.get(granularity, timedelta(hours=1))
+
+def increment_rows(conn, table, rows: List[Dict[str, Any]], key_columns: List[str], value_column: str):
+    """
+    按唯一键累加计数列，不存在时插入
+
+    SQLite和PostgreSQL使用一条 INSERT ... ON CONFLICT DO UPDATE 批量执行，其他数据库逐行先更新后插入
+
+    Args:
+        conn: 数据库连接（调用方负责事务）
+        table: 数据表
+        rows: 每行包含 key_columns 和 value_column 的值
+        key_columns: 唯一约束的列
+        value_column: 累加的列
+    """
+    if not rows:
+        return
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        if conn.dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        statement = upsert(table)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={value_column: table.c[value_column] + statement.excluded[value_column]}), rows)
+        return
+    for row in rows:
+        result = conn.execute(update(table).where(
+            *[table.c[column] == row[column] for column in key_columns]
+        ).values({value_column: table.c[value_column] + row[value_column]}))
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(**row))
+
+def _tracked_models() -> Dict[type, str]:
+    """被统计的模型 -> 指标，延迟导入避免循环依赖"""
+    from app.user.models import User
+    from app.community.models import Story, Task, UserTask
+    return {User: 'users', Story: 'stories', Task: 'tasks', UserTask: 'user_tasks'}
+
+class StatsRollup:
+    """
+    看板统计汇总：提交钩子把用户、故事、任务的增减累加到 dashboard_stats 的一行中，
+    并按小时和天写入 stats_bucket 时间序列；定期用 COUNT 全量校准总数，修正批量写入等未经过钩子的变更
+    """
+
+    def __init__(self, reconcile_interval: int = 3600, rebuild_lease: int = 1800):
+        """
+        初始化统计汇总
+
+        Args:
+            reconcile_interval: 全量校准间隔（秒），多进程部署时只有一个进程执行
+            rebuild_lease: 全量构建租约（秒），构建进程异常退出后超过该时间可重新构建
+        """
+        self.logger = logger
+        self.app = None
+        self.reconcile_interval = reconcile_interval
+        self.rebuild_lease = rebuild_lease
+        self._models = None
+        self._installed = False
+
+    def init_app(self, app):
+        """读取配置，注册SQLAlchemy会话事件和 flask stats 命令"""
+        self.app = app
+        self.reconcile_interval = app.config.get('DASHBOARD_STATS_RECONCILE_SECONDS', self.reconcile_interval)
+        self.rebuild_lease = app.config.get('DASHBOARD_STATS_REBUILD_LEASE_SECONDS', self.rebuild_lease)
+        app.cli.add_command(stats_cli)
+        if self._installed:
+            return
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        self._installed = True
+
+    # 增量更新
+
+    def _after_flush(self, session: Session, flush_context):
+        if self._models is None:
+            self._models = _tracked_models()
+        models = self._models
+        totals = session.info.setdefault('stats_totals', Counter())
+        created = session.info.setdefault('stats_created', Counter())
+
+        for instance in session.new:
+            metric = models.get(type(instance))
+            if metric is None:
+                continue
+            totals[METRICS[metric]] += 1
+            created[metric] += 1
+            if metric == 'user_tasks' and instance.is_completed:
+                totals['completed_tasks'] += 1
+                created['completed_tasks'] += 1
+
+        for instance in session.deleted:
+            metric = models.get(type(instance))
+            if metric is None:
+                continue
+            totals[METRICS[metric]] -= 1
+            if metric == 'user_tasks' and instance.is_completed:
+                totals['completed_tasks'] -= 1
+
+        for instance in session.dirty:
+            if models.get(type(instance)) != 'user_tasks':
+                continue
+            history = get_history(instance, 'is_completed')
+            if history.added and history.deleted and bool(history.added[0]) != bool(history.deleted[0]):
+                if history.added[0]:
+                    totals['completed_tasks'] += 1
+                    created['completed_tasks'] += 1
+                else:
+                    totals['completed_tasks'] -= 1
+
+    def _after_rollback(self, session: Session):
+        session.info.pop('stats_totals', None)
+        session.info.pop('stats_created', None)
+
+    def _after_commit(self, session: Session):
+        totals = session.info.pop('stats_totals', None)
+        created = session.info.pop('stats_created', None)
+        if not any((totals or {}).values()) and not any((created or {}).values()):
+            return
+        try:
+            self.apply(totals, created)
+        except Exception as e:
+            # 统计失败不影响业务提交，下次校准时修正
+            self.logger.error(f"更新看板统计失败: {str(e)}")
+
+    def apply(self, totals: Optional[Dict[str, int]], created: Optional[Dict[str, int]],
+              moment: Optional[datetime] = None):
+        """
+        在独立事务中累加总数和时间桶
+
+        Args:
+            totals: 总数字段 -> 增量
+            created: 指标 -> 新增数量
+            moment: 新增发生的时间，默认当前时间
+        """
+        moment = moment or datetime.now()
+        table = DashboardStats.__table__
+        with db.engine.begin() as conn:
+            values = {column: table.c[column] + delta for column, delta in (totals or {}).items() if delta}
+            if values:
+                conn.execute(update(table).where(table.c.name == SCOPE).values(**values))
+            increment_rows(conn, StatsBucket.__table__, [
+                {'granularity': granularity, 'bucket_start': bucket_start(moment, granularity),
+                 'metric': metric, 'value': count}
+                for metric, count in (created or {}).items() if count for granularity in GRANULARITIES
+            ], ['granularity', 'metric', 'bucket_start'], 'value')
+
+    # 全量构建与校准
+
+    def _count_totals(self) -> Dict[str, int]:
+        from app.community.models import UserTask
+        counts = {METRICS[metric]: db.session.query(func.count(model.id)).scalar() or 0
+                  for model, metric in _tracked_models().items()}
+        counts['completed_tasks'] = db.session.query(func.count(UserTask.id)).filter(
+            UserTask.is_completed.is_(True)).scalar() or 0
+        return counts
+
+    def _stats_row(self) -> DashboardStats:
+        stats = DashboardStats.query.filter_by(name=SCOPE).first()
+        if stats is None:
+            try:
+                db.session.add(DashboardStats(name=SCOPE))
+                db.session.commit()
+            except IntegrityError:
+                # 其他进程同时创建
+                db.session.rollback()
+            stats = DashboardStats.query.filter_by(name=SCOPE).first()
+        return stats
+
+    def rebuild(self, backfill: bool = True, batch_size: int = 5000) -> Dict[str, Any]:
+        """
+        全量统计总数，可选按创建时间重建时间桶；以汇总行上的租约保证同一时间只有一个构建
+
+        提交钩子只累加当前所在的时间桶，重建只替换开始构建之前已结束的时间桶，
+        不会覆盖构建期间钩子写入的增量
+
+        Args:
+            backfill: 是否重建时间序列（需要扫描各表的创建时间列）
+            batch_size: 扫描时每批读取的行数
+        """
+        try:
+            if not self._acquire_rebuild():
+                return {
+                    "success": False,
+                    "busy": True,
+                    "error": "看板统计正在重建，请稍后再试"
+                }
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"重建看板统计失败: {str(e)}")
+            return {
+                "success": False,
+                "error": f"重建看板统计失败: {str(e)}"
+            }
+        try:
+            if backfill:
+                self._backfill(batch_size)
+
+            # 总数在扫描之后统计，缩短与钩子增量并发的窗口，剩余误差由下次校准修正
+            counts = self._count_totals()
+            stats = self._stats_row()
+            for column, value in counts.items():
+                setattr(stats, column, value)
+            stats.rebuilt_at = datetime.now()
+            stats.rebuild_lease_until = None
+            db.session.commit()
+            self.logger.info(f"看板统计校准完成: {counts}")
+            return {
+                "success": True,
+                "message": "看板统计已重建" if backfill else "看板统计已校准",
+                "data": counts
+            }
+        except Exception as e:
+            db.session.rollback()
+            self._release_rebuild()
+            self.logger.error(f"重建看板统计失败: {str(e)}")
+            return {
+                "success": False,
+                "error": f"重建看板统计失败: {str(e)}"
+            }
+
+    def _backfill(self, batch_size: int):
+        """按创建时间重建已结束的时间桶（各粒度当前所在的桶由钩子继续累加，不做替换）"""
+        from app.community.models import UserTask
+        now = datetime.now()
+        cutoffs = {granularity: bucket_start(now, granularity) for granularity in GRANULARITIES}
+        buckets = Counter()
+        columns = {metric: model.created_at for model, metric in _tracked_models().items()}
+        columns['completed_tasks'] = UserTask.completed_at
+        latest = max(cutoffs.values())
+        for metric, column in columns.items():
+            query = db.session.query(column).filter(column.isnot(None), column < latest)
+            for (moment,) in query.execution_options(stream_results=True).yield_per(batch_size):
+                for granularity, cutoff in cutoffs.items():
+                    if moment < cutoff:
+                        buckets[(granularity, bucket_start(moment, granularity), metric)] += 1
+        db.session.query(StatsBucket).filter(or_(*[
+            and_(StatsBucket.granularity == granularity, StatsBucket.bucket_start < cutoff)
+            for granularity, cutoff in cutoffs.items()
+        ])).delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(StatsBucket, [
+            {'granularity': granularity, 'bucket_start': start, 'metric': metric, 'value': value}
+            for (granularity, start, metric), value in buckets.items()])
+
+    def _acquire_rebuild(self) -> bool:
+        """以条件更新取得构建租约，租约未过期时其他请求或进程的构建直接返回"""
+        self._stats_row()
+        table = DashboardStats.__table__
+        now = datetime.now()
+        result = db.session.execute(
+            update(table)
+            .where(table.c.name == SCOPE, or_(table.c.rebuild_lease_until.is_(None),
+                                              table.c.rebuild_lease_until < now))
+            .values(rebuild_lease_until=now + timedelta(seconds=self.rebuild_lease))
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _release_rebuild(self):
+        try:
+            table = DashboardStats.__table__
+            db.session.execute(update(table).where(table.c.name == SCOPE).values(rebuild_lease_until=None))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"释放看板统计构建租约失败: {str(e)}")
+
+    def _claim_reconcile(self) -> bool:
+        """以条件更新抢占校准任务（从未校准或校准过期），保证多进程中只有一个执行"""
+        table = DashboardStats.__table__
+        now = datetime.now()
+        result = db.session.execute(
+            update(table)
+            .where(table.c.name == SCOPE, or_(table.c.rebuilt_at.is_(None),
+                                              table.c.rebuilt_at < now - timedelta(seconds=self.reconcile_interval)))
+            .values(rebuilt_at=now)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _reconcile_in_context(self):
+        with self.app.app_context():
+            try:
+                self.rebuild(backfill=False)
+            finally:
+                db.session.remove()
+
+    # 读取
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        读取汇总行；从未校准或校准过期时在后台校准总数
+
+        时间序列的全量构建需扫描各表，不在请求中执行，部署后运行 flask stats rebuild
+        """
+        stats = self._stats_row()
+        if self.app is not None and (stats.rebuilt_at is None or
+                                     stats.rebuilt_at < datetime.now() - timedelta(seconds=self.reconcile_interval)):
+            if self._claim_reconcile():
+                threading.Thread(target=self._reconcile_in_context, name='stats-reconcile', daemon=True).start()
+
+        # 近30天新增用户，由小时桶求和
+        since = bucket_start(datetime.now() - timedelta(days=ACTIVE_USER_DAYS), 'hour')
+        active_users = db.session.query(func.coalesce(func.sum(StatsBucket.value), 0)).filter(
+            StatsBucket.granularity == 'hour', StatsBucket.metric == 'users', StatsBucket.bucket_start >= since
+        ).scalar()
+        return {
+            'total_users': stats.total_users,
+            'active_users': int(active_users),
+            'total_stories': stats.total_stories,
+            'total_tasks': stats.total_tasks,
+            'total_user_tasks': stats.total_user_tasks,
+            'completed_tasks': stats.completed_tasks,
+            'rebuilt_at': stats.rebuilt_at.isoformat() if stats.rebuilt_at else None,
+            'updated_at': stats.updated_at.isoformat() if stats.updated_at else None
+        }
+
+    def series(self, metric: str, granularity: str = 'hour', periods: int = 24,
+               end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        查询指标的时间序列，缺失的时间桶补0
+
+        Args:
+            metric: 指标名称，见 METRICS
+            granularity: hour 或 day
+            periods: 时间桶数量
+            end: 最后一个时间桶所在的时间，默认当前时间
+
+        Raises:
+            ValueError: 指标或粒度无效
+        """
+        if metric not in METRICS:
+            raise ValueError(f"未知的统计指标: {metric}")
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"未知的时间粒度: {granularity}")
+        periods = min(max(periods, 1), MAX_SERIES_BUCKETS)
+        step = bucket_step(granularity)
+        last = bucket_start(end or datetime.now(), granularity)
+        first = last - step * (periods - 1)
+        values = dict(db.session.query(StatsBucket.bucket_start, StatsBucket.value).filter(
+            StatsBucket.granularity == granularity, StatsBucket.metric == metric,
+            StatsBucket.bucket_start.between(first, last)))
+        return [{'bucket': (first + step * i).isoformat(), 'value': values.get(first + step * i, 0)}
+                for i in range(periods)]
+
+# 进程内共享的统计汇总
+stats_rollup = StatsRollup()
+
+stats_cli = AppGroup('stats', help='看板统计汇总')
+
+@stats_cli.command('rebuild')
+@click.option('--no-backfill', is_flag=True, help='只校准总数，不重建时间序列')
+def rebuild_command(no_backfill):
+    """全量统计总数并重建时间序列（部署统计表后执行一次）"""
+    result = stats_rollup.rebuild(backfill=not no_backfill)
+    click.echo(result)
+    if not result['success']:
+        raise SystemExit(1)
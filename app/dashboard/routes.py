@@ -1,27 +1,19 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, jsonify, current_app
+from flask_login import login_required, current_user
 from app import db
-from app.user.models import User
-from app.community.models import Post, Comment, Story, Task, UserTask
-from datetime import datetime, timedelta
+from app.dashboard.rollup import stats_rollup
 
 bp = Blueprint('dashboard', __name__)
 
 @bp.route('/dashboard/')
 def index():
-    # 获取总用户数
-    total_users = User.query.count()
-    
-    # 获取30天内活跃用户数
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    active_users = User.query.filter(User.created_at >= thirty_days_ago).count()
-    
-    # 获取社区故事数量
-    total_stories = Story.query.count()
-    
-    # 获取任务相关统计
-    total_tasks = Task.query.count()
-    total_user_tasks = UserTask.query.count()
-    completed_tasks = UserTask.query.filter_by(is_completed=True).count()
+    # 从预先汇总的统计行读取，不再逐表 COUNT
+    stats = stats_rollup.snapshot()
+    total_users = stats['total_users']
+    active_users = stats['active_users']
+    total_stories = stats['total_stories']
+    total_user_tasks = stats['total_user_tasks']
+    completed_tasks = stats['completed_tasks']
     
     # 计算任务完成率
     task_completion_rate = round((completed_tasks / total_user_tasks * 100) if total_user_tasks > 0 else 0, 1)
@@ -63,3 +55,78 @@ def index():
                           keywords=keywords,
                           active_users_percent=active_users_percent,
                           total_stories_percent=total_stories_percent)
+
+
+@bp.route('/api/dashboard/stats', methods=['GET'])
+def get_dashboard_stats():
+    """
+    获取看板统计汇总
+    """
+    try:
+        return jsonify({
+            'success': True,
+            'data': stats_rollup.snapshot()
+        })
+    except Exception as e:
+        print(f'获取看板统计失败: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': f'获取看板统计失败: {str(e)}'
+        }), 500
+
+@bp.route('/api/dashboard/stats/series', methods=['GET'])
+def get_dashboard_stats_series():
+    """
+    获取统计指标的时间序列
+    参数：metric（users/stories/tasks/user_tasks/completed_tasks）、granularity（hour/day）、periods
+    """
+    try:
+        metric = request.args.get('metric', 'users')
+        granularity = request.args.get('granularity', 'hour')
+        periods = request.args.get('periods', type=int, default=24 if granularity == 'hour' else 30)
+        
+        try:
+            series = stats_rollup.series(metric, granularity, periods)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'metric': metric,
+                'granularity': granularity,
+                'series': series
+            }
+        })
+    except Exception as e:
+        print(f'获取统计时间序列失败: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': f'获取统计时间序列失败: {str(e)}'
+        }), 500
+
+@bp.route('/api/dashboard/stats/rebuild', methods=['POST'])
+@login_required
+def rebuild_dashboard_stats():
+    """
+    全量重建看板统计和时间序列，仅限 DASHBOARD_ADMINS 中的用户；已有重建在执行时返回409
+    """
+    if current_user.username not in current_app.config.get('DASHBOARD_ADMINS', []):
+        return jsonify({
+            'success': False,
+            'message': '没有权限重建看板统计'
+        }), 403
+    try:
+        result = stats_rollup.rebuild(backfill=request.args.get('backfill', '1') != '0')
+        if result.get('busy'):
+            return jsonify(result), 409
+        return jsonify(result), (200 if result['success'] else 500)
+    except Exception as e:
+        print(f'重建看板统计失败: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': f'重建看板统计失败: {str(e)}'
+        }), 500
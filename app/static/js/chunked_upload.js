@@ -0,0 +1,120 @@
+// 分片上传（tus 协议）：文件按块上传，网络中断后从服务器记录的偏移量继续，刷新页面后也可续传
+class ChunkedUpload {
+    constructor(file, options) {
+        this.file = file;
+        this.purpose = options.purpose;
+        this.targetId = options.targetId;
+        this.endpoint = options.endpoint || '/api/uploads';
+        this.chunkSize = options.chunkSize || 5 * 1024 * 1024;
+        this.retryDelays = options.retryDelays || [1000, 3000, 5000, 10000, 20000];
+        this.onProgress = options.onProgress || function() {};
+        this.pollInterval = options.pollInterval || 1000;
+        this.storageKey = ['tus', this.purpose, this.targetId, file.name, file.size, file.lastModified].join(':');
+    }
+
+    // 上传整个文件，返回服务器上的上传信息
+    async start() {
+        let url = localStorage.getItem(this.storageKey);
+        let offset = url ? await this.queryOffset(url) : null;
+        if (offset === null) {
+            url = await this.create();
+            offset = 0;
+        }
+        localStorage.setItem(this.storageKey, url);
+
+        let failures = 0;
+        while (offset < this.file.size) {
+            this.onProgress(offset, this.file.size);
+            try {
+                offset = await this.sendChunk(url, offset);
+                failures = 0;
+            } catch (error) {
+                if (error.fatal || failures >= this.retryDelays.length) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, this.retryDelays[failures++]));
+                // 重试前以服务器记录的偏移量为准
+                const serverOffset = await this.queryOffset(url).catch(() => null);
+                if (serverOffset !== null) {
+                    offset = serverOffset;
+                }
+            }
+        }
+        this.onProgress(this.file.size, this.file.size);
+        localStorage.removeItem(this.storageKey);
+        return this.waitUntilProcessed(url);
+    }
+
+    // 等待服务器完成后处理（如视频格式校验），只有处理完成的上传可以提交
+    async waitUntilProcessed(url) {
+        for (;;) {
+            const response = await fetch(url, {credentials: 'same-origin'});
+            const data = await response.json();
+            if (data.upload.status === 'processed') {
+                return data.upload;
+            }
+            if (data.upload.status === 'failed') {
+                const error = new Error(data.upload.error || '文件处理失败');
+                error.fatal = true;
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, this.pollInterval));
+        }
+    }
+
+    static encode(value) {
+        return btoa(unescape(encodeURIComponent(String(value))));
+    }
+
+    async create() {
+        const metadata = [
+            'filename ' + ChunkedUpload.encode(this.file.name),
+            'purpose ' + ChunkedUpload.encode(this.purpose),
+            'target_id ' + ChunkedUpload.encode(this.targetId)
+        ].join(',');
+        const response = await fetch(this.endpoint, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Tus-Resumable': '1.0.0', 'Upload-Length': this.file.size, 'Upload-Metadata': metadata}
+        });
+        if (response.status !== 201) {
+            const data = await response.json().catch(() => ({}));
+            const error = new Error(data.message || '创建上传失败');
+            error.fatal = true;
+            throw error;
+        }
+        return response.headers.get('Location');
+    }
+
+    // 查询服务器已接收的字节数，上传不存在时返回null
+    async queryOffset(url) {
+        const response = await fetch(url, {method: 'HEAD', credentials: 'same-origin', headers: {'Tus-Resumable': '1.0.0'}});
+        if (!response.ok) {
+            return null;
+        }
+        return parseInt(response.headers.get('Upload-Offset'), 10);
+    }
+
+    async sendChunk(url, offset) {
+        const chunk = this.file.slice(offset, Math.min(offset + this.chunkSize, this.file.size));
+        const headers = {
+            'Tus-Resumable': '1.0.0',
+            'Upload-Offset': offset,
+            'Content-Type': 'application/offset+octet-stream'
+        };
+        // 安全上下文中附带分片摘要，服务器校验失败时整块重传
+        if (window.crypto && window.crypto.subtle) {
+            const digest = await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+            headers['Upload-Checksum'] = 'sha256 ' + btoa(String.fromCharCode(...new Uint8Array(digest)));
+        }
+        const response = await fetch(url, {method: 'PATCH', credentials: 'same-origin', headers: headers, body: chunk});
+        if (response.status === 204) {
+            return parseInt(response.headers.get('Upload-Offset'), 10);
+        }
+        const data = await response.json().catch(() => ({}));
+        const error = new Error(data.message || '上传失败');
+        // 大小、类型等错误重试无效
+        error.fatal = [403, 404, 410, 413, 415].includes(response.status);
+        throw error;
+    }
+}
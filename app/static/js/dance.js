@@ -896,10 +896,32 @@ function stopScoreUpdate() {
   }
 }
 
+// 当前评分任务ID（评分在后台队列中执行）
+let scoreJobId = null;
+
 // 更新评分
 async function updateScores() {
   try {
-    // 调用后端API获取评分
+    // 已有评分任务时查询任务状态
+    if (scoreJobId) {
+      const statusResponse = await fetch(`/api/dance/score/${scoreJobId}`);
+      if (!statusResponse.ok) {
+        scoreJobId = null;
+        displayMockScores();
+        return;
+      }
+      const statusData = await statusResponse.json();
+      if (statusData.job.status === 'scored') {
+        scoreJobId = null;
+        displayScores(statusData.job.result.score_result);
+      } else if (statusData.job.status === 'failed') {
+        scoreJobId = null;
+        displayMockScores();
+      }
+      return;
+    }
+    
+    // 调用后端API提交评分任务
     const response = await fetch(`/api/dance/score`, {
       method: 'POST',
       headers: {
@@ -913,7 +935,7 @@ async function updateScores() {
     
     if (response.ok) {
       const data = await response.json();
-      displayScores(data.score_result);
+      scoreJobId = data.job_id;
     } else {
       // 使用模拟评分
       displayMockScores();
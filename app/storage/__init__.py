@@ -0,0 +1 @@
+from .blobstore import blob_store
@@ -0,0 +1,411 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+import click
+from flask.cli import AppGroup
+from sqlalchemy import update, delete, func, exists, and_
+from app import db
+from app.storage.models import Blob, BlobRef
+from app.dashboard.rollup import increment_rows
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('BlobStore')
+
+# 流式读写的块大小
+CHUNK_SIZE = 64 * 1024
+
+# 迁移工具扫描的上传目录：位置 -> 相对目录
+MIGRATE_SOURCES = (
+    ('static', 'uploads/culture'),
+    ('static', 'uploads/tasks'),
+    ('videos', ''),
+)
+
+def blob_name(sha256: str, filename: str) -> str:
+    """内容寻址的对外文件名：同名不同内容不会互相覆盖，同名同内容得到同一路径"""
+    return f'{sha256[:12]}_{filename}'
+
+def static_key(relative: str) -> str:
+    """static 目录下文件的引用路径，relative 可以带 /static/ 前缀（如 file_url）"""
+    relative = relative.lstrip('/')
+    if relative.startswith('static/'):
+        relative = relative[len('static/'):]
+    return f'static:{relative}'
+
+def video_key(name: str) -> str:
+    """舞蹈视频目录下文件的引用路径"""
+    return f'videos:{name}'
+
+class BlobStore:
+    """
+    内容寻址的上传存储：文件按 SHA-256 保存在分片目录 objects/ab/cd/<sha256> 中只存一份，
+    对外路径（static、视频目录）是指向对象的硬链接；blob 和 blob_ref 记录引用数，
+    引用数归零的路径和对象由垃圾回收在宽限期后删除
+    """
+
+    def __init__(self):
+        """初始化存储，根目录在 init_app 中配置"""
+        self.logger = logger
+        self.app = None
+        self.root = None
+        self.gc_grace_seconds = 3600
+        self.locations: Dict[str, str] = {}
+
+    def init_app(self, app):
+        """读取配置并注册 flask blobs 命令"""
+        self.app = app
+        self.root = app.config.get('BLOB_STORE_FOLDER') or os.path.join(app.root_path, '..', 'blobs')
+        self.gc_grace_seconds = app.config.get('BLOB_GC_GRACE_SECONDS', self.gc_grace_seconds)
+        self.locations = {
+            'static': app.static_folder,
+            'videos': app.config['DANCE_VIDEOS_FOLDER']
+        }
+        app.cli.add_command(blob_cli)
+
+    # 路径
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.root, 'objects', sha256[:2], sha256[2:4], sha256)
+
+    def resolve(self, key: str) -> str:
+        """
+        引用路径转换为绝对路径
+
+        Raises:
+            ValueError: 未知的位置或路径越出该位置
+        """
+        location, _, relative = key.partition(':')
+        base = self.locations.get(location)
+        if base is None:
+            raise ValueError(f"未知的存储位置: {location}")
+        path = os.path.normpath(os.path.join(base, relative))
+        if not path.startswith(os.path.normpath(base) + os.sep):
+            raise ValueError(f"无效的存储路径: {key}")
+        return path
+
+    def _temp_path(self) -> str:
+        folder = os.path.join(self.root, 'tmp')
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, uuid.uuid4().hex)
+
+    # 写入对象
+
+    def _store(self, path: str, sha256: str):
+        """把已计算摘要的文件移入对象目录，对象已存在时删除该文件"""
+        target = self.object_path(sha256)
+        if os.path.exists(target):
+            os.remove(path)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 对象与所有硬链接共享同一个inode，设为只读防止通过对外路径被改写
+        os.chmod(path, 0o444)
+        os.replace(path, target)
+
+    def ingest(self, source) -> Tuple[str, int]:
+        """
+        按块读取文件流，边写临时文件边计算摘要
+
+        Args:
+            source: 可读取的文件对象（如上传的 FileStorage）
+
+        Returns:
+            (sha256, 字节数)
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        temp = self._temp_path()
+        try:
+            with open(temp, 'wb') as f:
+                while True:
+                    block = source.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    size += len(block)
+            sha256 = hasher.hexdigest()
+            self._store(temp, sha256)
+            return sha256, size
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    def adopt(self, path: str, sha256: str) -> int:
+        """
+        把磁盘上已计算摘要的文件（如分片上传完成的临时文件）移入对象目录
+
+        Returns:
+            字节数
+        """
+        size = os.path.getsize(path)
+        self._store(path, sha256)
+        return size
+
+    def link(self, sha256: str, key: str) -> str:
+        """
+        在对外路径创建指向对象的硬链接，文件系统不支持硬链接时复制
+
+        Returns:
+            对外路径的绝对路径
+        """
+        target = self.object_path(sha256)
+        path = self.resolve(key)
+        if os.path.exists(path) and os.path.samefile(path, target):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        try:
+            os.link(target, temp)
+        except OSError:
+            shutil.copyfile(target, temp)
+        os.replace(temp, path)
+        return path
+
+    # 引用计数
+
+    def add_ref(self, sha256: str, size: int, key: str, count: int = 1):
+        """在当前会话的事务中增加引用，由调用方提交"""
+        conn = db.session.connection()
+        increment_rows(conn, Blob.__table__, [{'sha256': sha256, 'size': size, 'refcount': count}],
+                       ['sha256'], 'refcount')
+        increment_rows(conn, BlobRef.__table__, [{'path': key, 'sha256': sha256, 'refcount': count}],
+                       ['path'], 'refcount')
+
+    def release(self, key: Optional[str], count: int = 1):
+        """
+        在当前会话的事务中减少引用，引用归零的文件由垃圾回收删除；
+        不在存储中的路径（如外部URL或未迁移的旧文件）忽略
+        """
+        if not key:
+            return
+        ref = BlobRef.query.filter_by(path=key).first()
+        if ref is None:
+            return
+        db.session.execute(update(BlobRef.__table__).where(BlobRef.path == key)
+                           .values(refcount=BlobRef.refcount - count, updated_at=datetime.now()))
+        db.session.execute(update(Blob.__table__).where(Blob.sha256 == ref.sha256)
+                           .values(refcount=Blob.refcount - count, updated_at=datetime.now()))
+
+    def save(self, source, key_dir: str, filename: str, count: int = 1) -> Tuple[str, str]:
+        """
+        保存上传的文件：写入对象、增加引用并在 key_dir 下创建内容寻址命名的硬链接
+
+        Args:
+            source: 可读取的文件对象
+            key_dir: 对外目录，如 static:uploads/culture、videos:
+            filename: 安全处理后的文件名，实际文件名加上摘要前缀
+            count: 引用该文件的记录数
+
+        Returns:
+            (sha256, 引用路径)
+        """
+        sha256, size = self.ingest(source)
+        name = blob_name(sha256, filename)
+        key = key_dir + name if key_dir.endswith(':') else f'{key_dir}/{name}'
+        # 先登记引用再建链接，垃圾回收删除零引用路径时以引用行为准
+        self.add_ref(sha256, size, key, count)
+        self.link(sha256, key)
+        return sha256, key
+
+    # 垃圾回收
+
+    def gc(self, grace_seconds: Optional[int] = None) -> Dict[str, int]:
+        """
+        删除引用归零超过宽限期的对外路径和对象、不在数据库中的孤立对象及残留的临时文件；
+        对象仍有其他硬链接时保留
+
+        Returns:
+            删除的路径数、对象数和释放的字节数
+        """
+        grace = self.gc_grace_seconds if grace_seconds is None else grace_seconds
+        deadline = datetime.now() - timedelta(seconds=grace)
+        stats = {'paths': 0, 'objects': 0, 'bytes': 0, 'temp_files': 0}
+
+        for ref_id, key, sha256 in db.session.query(BlobRef.id, BlobRef.path, BlobRef.sha256).filter(
+                BlobRef.refcount <= 0, BlobRef.updated_at < deadline).all():
+            # 条件删除：其间被重新引用的路径不会删除
+            result = db.session.execute(delete(BlobRef.__table__).where(
+                and_(BlobRef.id == ref_id, BlobRef.refcount <= 0)))
+            db.session.commit()
+            if result.rowcount != 1:
+                continue
+            try:
+                path = self.resolve(key)
+                if os.path.exists(path) and os.path.samefile(path, self.object_path(sha256)):
+                    os.remove(path)
+                    stats['paths'] += 1
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"删除路径 {key} 失败: {str(e)}")
+
+        referenced = exists().where(BlobRef.sha256 == Blob.sha256)
+        for sha256, size in db.session.query(Blob.sha256, Blob.size).filter(
+                Blob.refcount <= 0, Blob.updated_at < deadline, ~referenced).all():
+            result = db.session.execute(delete(Blob.__table__).where(
+                and_(Blob.sha256 == sha256, Blob.refcount <= 0)))
+            db.session.commit()
+            if result.rowcount == 1 and self._remove_object(self.object_path(sha256)):
+                stats['objects'] += 1
+                stats['bytes'] += size
+
+        # 孤立对象：写入后未登记引用（如请求中途失败）
+        known = {sha256 for (sha256,) in db.session.query(Blob.sha256)}
+        cutoff = time.time() - grace
+        objects_dir = os.path.join(self.root, 'objects')
+        for folder, _, files in os.walk(objects_dir):
+            for name in files:
+                path = os.path.join(folder, name)
+                if name not in known and os.path.getmtime(path) < cutoff:
+                    size = os.path.getsize(path)
+                    if self._remove_object(path):
+                        stats['objects'] += 1
+                        stats['bytes'] += size
+        temp_dir = os.path.join(self.root, 'tmp')
+        if os.path.isdir(temp_dir):
+            for name in os.listdir(temp_dir):
+                path = os.path.join(temp_dir, name)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    stats['temp_files'] += 1
+        self.logger.info(f"垃圾回收完成: {stats}")
+        return stats
+
+    @staticmethod
+    def _remove_object(path: str) -> bool:
+        """只删除没有其他硬链接的对象"""
+        try:
+            if os.stat(path).st_nlink > 1:
+                return False
+            os.chmod(path, 0o644)
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    # 迁移
+
+    def reference_counts(self) -> Counter:
+        """统计数据库记录对上传文件的引用次数，用于迁移已有文件"""
+        from app.culture.models import EthnicImpression, PatternRecognitionResult
+        from app.community.models import TaskSubmission, DanceSubmission, UploadSession
+        counts = Counter()
+        for (path,) in db.session.query(EthnicImpression.original_image):
+            counts[static_key(path)] += 1
+        for (path,) in db.session.query(PatternRecognitionResult.input_image):
+            counts[static_key(path)] += 1
+        for (url,) in db.session.query(TaskSubmission.file_url).filter(TaskSubmission.file_url.isnot(None)):
+            counts[static_key(url)] += 1
+        for (name,) in db.session.query(DanceSubmission.video_url):
+            counts[video_key(name)] += 1
+        # 已被提交使用（consumed）的上传，引用已转交给上面统计的提交记录
+        for purpose, stored_name, file_url in db.session.query(
+                UploadSession.purpose, UploadSession.stored_name, UploadSession.file_url).filter(
+                UploadSession.status.notin_(['uploading', 'consumed'])):
+            counts[video_key(stored_name) if purpose == 'dance' else static_key(file_url)] += 1
+        return counts
+
+    def migrate(self, dry_run: bool = False, batch_size: int = 200) -> Dict[str, int]:
+        """
+        把已有的上传文件纳入存储：内容相同的文件替换为指向同一对象的硬链接，路径保持不变；
+        引用数取数据库中的引用次数，没有记录引用的文件计1次，不会被回收
+
+        Args:
+            dry_run: 只统计，不修改文件和数据库
+            batch_size: 每处理多少个文件提交一次
+
+        Returns:
+            扫描、迁移、去重的文件数和节省的字节数
+        """
+        counts = self.reference_counts()
+        migrated = {path for (path,) in db.session.query(BlobRef.path)}
+        seen = set()
+        stats = {'scanned': 0, 'migrated': 0, 'deduplicated': 0, 'bytes_saved': 0, 'skipped': 0}
+        partial_folder = self.app.config.get('UPLOAD_PARTIAL_FOLDER')
+        partial_folder = os.path.normpath(partial_folder) if partial_folder else None
+
+        for location, relative_dir in MIGRATE_SOURCES:
+            base = self.locations[location]
+            top = os.path.join(base, relative_dir)
+            for folder, _, files in os.walk(top):
+                if partial_folder and os.path.normpath(folder).startswith(partial_folder):
+                    continue
+                for name in files:
+                    path = os.path.join(folder, name)
+                    if os.path.islink(path) or name.endswith('.tmp'):
+                        continue
+                    stats['scanned'] += 1
+                    key = f"{location}:{os.path.relpath(path, base).replace(os.sep, '/')}"
+                    if key in migrated:
+                        stats['skipped'] += 1
+                        continue
+
+                    hasher = hashlib.sha256()
+                    with open(path, 'rb') as f:
+                        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                            hasher.update(block)
+                    sha256 = hasher.hexdigest()
+                    size = os.path.getsize(path)
+                    target = self.object_path(sha256)
+                    duplicate = sha256 in seen or os.path.exists(target)
+                    seen.add(sha256)
+                    stats['migrated'] += 1
+                    if duplicate and not (os.path.exists(target) and os.path.samefile(path, target)):
+                        stats['deduplicated'] += 1
+                        stats['bytes_saved'] += size
+                    if dry_run:
+                        continue
+
+                    if not os.path.exists(target):
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        try:
+                            os.link(path, target)
+                        except OSError:
+                            shutil.copyfile(path, target)
+                        os.chmod(target, 0o444)
+                    else:
+                        self.link(sha256, key)
+                    self.add_ref(sha256, size, key, max(counts.get(key, 0), 1))
+                    if stats['migrated'] % batch_size == 0:
+                        db.session.commit()
+        db.session.commit()
+        self.logger.info(f"迁移完成: {stats}")
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        """对象数、引用数和实际占用的字节数"""
+        objects, total_size = db.session.query(func.count(Blob.sha256), func.coalesce(func.sum(Blob.size), 0)).one()
+        paths, references = db.session.query(func.count(BlobRef.id), func.coalesce(func.sum(BlobRef.refcount), 0)).one()
+        return {'objects': objects, 'bytes': int(total_size), 'paths': paths, 'references': int(references)}
+
+# 命令行：flask blobs migrate / gc / stats
+blob_cli = AppGroup('blobs', help='内容寻址上传存储')
+
+@blob_cli.command('migrate')
+@click.option('--dry-run', is_flag=True, help='只统计，不修改')
+def migrate_command(dry_run):
+    """把已有的上传文件迁移到内容寻址存储"""
+    click.echo(blob_store.migrate(dry_run=dry_run))
+
+@blob_cli.command('gc')
+@click.option('--grace', type=int, default=None, help='宽限期（秒），默认 BLOB_GC_GRACE_SECONDS')
+def gc_command(grace):
+    """删除未被引用的文件和对象"""
+    click.echo(blob_store.gc(grace))
+
+@blob_cli.command('stats')
+def stats_command():
+    """查看存储统计"""
+    click.echo(blob_store.stats())
+
+# 进程内共享的上传存储
+blob_store = BlobStore()
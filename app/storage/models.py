@@ -0,0 +1,24 @@
+from app import db
+
+class Blob(db.Model):
+    """内容寻址存储的对象：按 SHA-256 保存一份，refcount 为所有路径引用数之和"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0, index=True)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    
+    def __repr__(self):
+        return '<Blob {} size={} refs={}>'.format(self.sha256[:12], self.size, self.refcount)
+
+class BlobRef(db.Model):
+    """对外路径（指向对象的硬链接）及引用它的记录数，路径格式为“位置:相对路径”，如 static:uploads/culture/x.png"""
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(300), unique=True, nullable=False)
+    sha256 = db.Column(db.String(64), db.ForeignKey('blob.sha256'), nullable=False, index=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    
+    def __repr__(self):
+        return '<BlobRef {} -> {} refs={}>'.format(self.path, self.sha256[:12], self.refcount)
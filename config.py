@@ -16,7 +16,100 @@ class Config:
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'uploads')
     TASK_FILES_FOLDER = os.path.join(basedir, 'app', 'static', 'task_files')
     DANCE_VIDEOS_FOLDER = os.path.join(basedir, 'app', 'static', 'videos')
-    MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB，用于视频上传
+    MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB，单个请求上限；大文件使用分片上传
+    
+    # 分片上传（tus 协议）：未完成的上传保存在 UPLOAD_PARTIAL_FOLDER（默认 instance/uploads/partial，不在静态目录中），过期后清理
+    UPLOAD_PARTIAL_FOLDER = os.environ.get('UPLOAD_PARTIAL_FOLDER')
+    UPLOAD_EXPIRE_HOURS = 24
+    UPLOAD_LEASE_SECONDS = 600  # 单个分片请求的写入租约
+    UPLOAD_PROCESSING_WORKERS = 1
+    UPLOAD_PROCESSING_TIMEOUT = 600  # 后处理超过该时间视为中断，重新入队
+    DANCE_VIDEO_MAX_SIZE = 500 * 1024 * 1024  # 舞蹈视频大小上限
+    
+    # 内容寻址上传存储：对象按 SHA-256 分片保存，上传目录中是指向对象的硬链接（需与上传目录在同一文件系统）
+    BLOB_STORE_FOLDER = os.environ.get('BLOB_STORE_FOLDER') or os.path.join(basedir, 'blobs')
+    BLOB_GC_GRACE_SECONDS = 3600  # 引用归零后保留的时间
+    
+    # 舞蹈视频媒体处理：ffmpeg 生成缩略图、封面帧和低码率预览，未安装时生成占位图
+    MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', 2))  # 同时运行的 ffmpeg 进程数
+    MEDIA_FFMPEG_PATH = os.environ.get('MEDIA_FFMPEG_PATH')  # 默认在 PATH 中查找
+    MEDIA_FFPROBE_PATH = os.environ.get('MEDIA_FFPROBE_PATH')
+    MEDIA_THUMBNAIL_WIDTH = 320
+    MEDIA_POSTER_WIDTH = 1280
+    MEDIA_PREVIEW_HEIGHT = 480
+    MEDIA_PREVIEW_BITRATE = '600k'
+    MEDIA_TIMEOUT = 600  # 单个 ffmpeg 命令的超时
+    MEDIA_STALL_TIMEOUT = 1800  # 处理中的对象超过该时间未更新视为中断（每步之间更新），应大于 MEDIA_TIMEOUT
+    MEDIA_FALLBACK_THUMBNAIL = '/static/images/1e025e36bd5827162b1868f84017bc19.png'  # 处理完成前的默认缩略图
+    
+    # 缓存后端：SimpleCache（进程内）、FileSystemCache（CACHE_DIR）、RedisCache（CACHE_REDIS_URL），
+    # 或本机多进程共享的 app.caching.SQLiteCache（CACHE_SQLITE_PATH）
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'SimpleCache')
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_THRESHOLD = int(os.environ.get('CACHE_THRESHOLD', 5000))
+    CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(basedir, 'cache')
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH') or os.path.join(basedir, 'cache', 'cache.sqlite')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    
+    # 端点缓存策略：端点 -> {ttl, vary_args, vary_user, max_size, tags}，见 app.caching.CachePolicy；
+    # tags 为响应依赖的表（或行，如 post:{id}），相关数据提交后缓存立即失效，因此TTL可以较长
+    RESPONSE_CACHE_POLICIES = {
+        'culture.get_culture_graph': {
+            'ttl': 3600, 'tags': ['culture_element', 'ethnic_group', 'culture_ethnic_relation', 'cultural_practice']},
+        'culture.get_patterns': {'ttl': 3600, 'vary_args': ['category', 'region'], 'tags': ['culture_pattern']},
+        'culture.get_culture_elements': {'ttl': 3600, 'vary_args': False, 'tags': ['culture_element']},
+        'culture.get_ethnic_groups': {'ttl': 3600, 'vary_args': False, 'tags': ['ethnic_group']},
+        'culture.get_culture_stats': {
+            'ttl': 3600, 'vary_args': False,
+            'tags': ['culture_element', 'ethnic_group', 'culture_ethnic_relation', 'culture_pattern',
+                     'pattern_recognition_result']},
+        'community.leaderboard': {'ttl': 3600, 'tags': ['leaderboard_entry', 'user']},
+        'dashboard.index': {'ttl': 300, 'vary_args': False, 'vary_user': True,
+                            'tags': ['user', 'story', 'task', 'user_task']},
+    }
+    
+    # 看板统计汇总的全量校准间隔（秒）
+    DASHBOARD_STATS_RECONCILE_SECONDS = int(os.environ.get('DASHBOARD_STATS_RECONCILE_SECONDS', 3600))
+    DASHBOARD_STATS_REBUILD_LEASE_SECONDS = 1800  # 全量构建租约，构建进程异常退出后超时可重新构建
+    # 可通过接口触发全量重建的用户名，逗号分隔；为空时只能使用 flask stats rebuild 命令
+    DASHBOARD_ADMINS = [name.strip() for name in os.environ.get('DASHBOARD_ADMINS', '').split(',') if name.strip()]
+    
+    # 互动事件（分享、点赞、浏览）批量写入与保留
+    ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 5))  # 批量写入间隔（秒）
+    ANALYTICS_BATCH_SIZE = 1000  # 缓冲区达到该数量时立即写入
+    ANALYTICS_MAX_BUFFER = 100000  # 缓冲区上限
+    ANALYTICS_EVENT_RETENTION_DAYS = 90  # 事件明细保留天数
+    ANALYTICS_MINUTE_RETENTION_DAYS = 7  # 分钟汇总保留天数
+    
+    # 点赞数、浏览数、分享数的增量合并写入间隔（秒）
+    COUNTER_FLUSH_INTERVAL = float(os.environ.get('COUNTER_FLUSH_INTERVAL', 2))
+    
+    # 社区列表游标分页
+    COMMUNITY_PAGE_SIZE = int(os.environ.get('COMMUNITY_PAGE_SIZE', 20))
+    COMMUNITY_MAX_PAGE_SIZE = 100
+    
+    # 舞蹈评分任务队列
+    SCORING_WORKERS = int(os.environ.get('SCORING_WORKERS', 2))
+    SCORING_MAX_RETRIES = 3
+    SCORING_RETRY_DELAY = 1.0  # 首次重试等待秒数，之后指数退避
+    SCORING_RESULT_TTL = 600  # 已完成任务结果保留秒数
+    SCORING_STALL_TIMEOUT = 300  # 作品排队或评分超过该秒数未更新时，视为中断，可被其他进程接管
+    
+    # 动作序列缓存，开启后同时写入Flask-Caching后端，多进程间共享
+    ACTION_SEQUENCE_SHARED_CACHE = os.environ.get('ACTION_SEQUENCE_SHARED_CACHE', 'false').lower() == 'true'
+    
+    # 文化数据同步任务
+    CULTURE_SYNC_CHUNK_SIZE = int(os.environ.get('CULTURE_SYNC_CHUNK_SIZE', 1000))
+    CULTURE_SYNC_LEASE_SECONDS = 300  # 跨节点锁租约，超时未续约则可被其他节点接管
+    
+    # 图案近似最近邻索引
+    PATTERN_ANN_DIR = os.environ.get('PATTERN_ANN_DIR')  # 默认为实例目录下的 pattern_ann
+    PATTERN_ANN_NPROBE = int(os.environ.get('PATTERN_ANN_NPROBE', 8))  # 每次查询扫描的簇数量，越大召回率越高、延迟越高
+    PATTERN_ANN_MIN_SIZE = 20000  # 图案数量达到该值才构建近似索引
+    
+    # 批量纹样识别
+    PATTERN_BATCH_WORKERS = int(os.environ.get('PATTERN_BATCH_WORKERS', 4))  # 特征提取线程数
+    PATTERN_BATCH_MAX_ITEMS = 1000  # 单次请求最多识别的条目数
     
     # 用于会话管理
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
@@ -47,6 +140,8 @@ class DevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or 'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app', 'data-dev.sqlite')
 
 class ProductionConfig(Config):
+    # 多个Waitress进程共享缓存
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'FileSystemCache')
     # 处理Render平台的PostgreSQL数据库URL
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     if SQLALCHEMY_DATABASE_URI and SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
@@ -56,8 +151,15 @@ class ProductionConfig(Config):
     if not SQLALCHEMY_DATABASE_URI:
         SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'app', 'data.sqlite')
 
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
+    CACHE_TYPE = 'NullCache'
+
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
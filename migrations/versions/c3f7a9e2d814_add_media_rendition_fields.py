@@ -0,0 +1,39 @@
+"""Add media rendition fields to dance and dance_submission
+
+Revision ID: c3f7a9e2d814
+Revises: b8e4d2c6a913
+Create Date: 2026-10-18 20:24:08.671942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f7a9e2d814'
+down_revision = 'b8e4d2c6a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有的舞蹈和作品标记为待处理，由媒体处理队列补生成缩略图
+    for table in ('dance', 'dance_submission'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('thumbnail_url', sa.String(length=300), nullable=True))
+            batch_op.add_column(sa.Column('poster_url', sa.String(length=300), nullable=True))
+            batch_op.add_column(sa.Column('preview_url', sa.String(length=300), nullable=True))
+            batch_op.add_column(sa.Column('media_status', sa.String(length=20), nullable=True, server_default='pending'))
+            batch_op.add_column(sa.Column('media_updated_at', sa.DateTime(), nullable=True))
+            batch_op.create_index(batch_op.f(f'ix_{table}_media_status'), ['media_status'], unique=False)
+
+
+def downgrade():
+    for table in ('dance_submission', 'dance'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_media_status'))
+            batch_op.drop_column('media_updated_at')
+            batch_op.drop_column('media_status')
+            batch_op.drop_column('preview_url')
+            batch_op.drop_column('poster_url')
+            batch_op.drop_column('thumbnail_url')
@@ -0,0 +1,165 @@
+"""Store recognition features and similarity matrices as float32 binary
+
+Revision ID: c4d8e2a7f315
+Revises: 7b2e4f9a1c63
+Create Date: 2026-10-18 16:12:48.205117
+
+"""
+import json
+import math
+import re
+import struct
+import zlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e2a7f315'
+down_revision = '7b2e4f9a1c63'
+branch_labels = None
+depends_on = None
+
+# 分批转换的行数
+BATCH_SIZE = 1000
+
+# 以下编码规则固定为本次迁移时的格式（与 app/culture/vector_codec.py 的版本1一致），不随应用代码变化
+# 二进制格式：版本号(1字节) + 维数(1字节) + 各维长度(uint32) + float32小端数据
+CODEC_VERSION = 1
+_HEADER = struct.Struct('<BB')
+_DIM = struct.Struct('<I')
+VECTOR_DIM = 256
+FEATURE_SEPARATOR = re.compile(r'[,，、;；\s]+')
+
+
+def _flatten(value):
+    """将规则的嵌套列表展平，返回 (形状, 数值列表)，不规则或含非数值时返回None"""
+    if isinstance(value, list):
+        parts = [_flatten(item) for item in value]
+        if any(part is None for part in parts) or len({part[0] for part in parts}) > 1:
+            return None
+        inner = parts[0][0] if parts else ()
+        return (len(value),) + inner, [number for part in parts for number in part[1]]
+    try:
+        return (), [float(value)]
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_numbers(text):
+    """解析JSON或分隔符分隔的数字文本，无法解析时返回None"""
+    text = (text or '').strip()
+    if not text:
+        return None
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = [token for token in FEATURE_SEPARATOR.split(text) if token]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = [value]
+    if not isinstance(value, list):
+        return None
+    return _flatten(value)
+
+
+def _encode(shape, values):
+    try:
+        data = struct.pack('<%df' % len(values), *values)
+    except OverflowError:
+        return None
+    return _HEADER.pack(CODEC_VERSION, len(shape)) + b''.join(_DIM.pack(dim) for dim in shape) + data
+
+
+def _decode(blob):
+    """解码为嵌套列表"""
+    _, ndim = _HEADER.unpack_from(blob)
+    shape = [_DIM.unpack_from(blob, _HEADER.size + i * _DIM.size)[0] for i in range(ndim)]
+    count = math.prod(shape)
+    values = list(struct.unpack_from('<%df' % count, blob, _HEADER.size + ndim * _DIM.size))
+    for dim in reversed(shape[1:]):
+        values = [values[i:i + dim] for i in range(0, len(values), dim)]
+    return values
+
+
+def _hash_tags(text):
+    """特征标签文本按CRC32特征哈希转换为单位向量"""
+    vector = [0.0] * VECTOR_DIM
+    for tag in {tag for tag in FEATURE_SEPARATOR.split(text.strip().lower()) if tag}:
+        digest = zlib.crc32(f'tag:{tag}'.encode('utf-8'))
+        vector[digest % VECTOR_DIM] += 1.0 if digest & 0x80000000 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+def encode_features(text):
+    if not text or not text.strip():
+        return None
+    parsed = _parse_numbers(text)
+    if parsed is None:
+        return _encode((VECTOR_DIM,), _hash_tags(text))
+    _, values = parsed
+    return _encode((len(values),), values)
+
+
+def encode_matrix(text):
+    # 无法解析的旧相似度矩阵编码为空
+    parsed = _parse_numbers(text)
+    return None if parsed is None else _encode(*parsed)
+
+
+def _convert(source_columns, target_columns, convert):
+    """按主键分批读取旧列，转换后写入新列"""
+    bind = op.get_bind()
+    table = sa.table('pattern_recognition_result', sa.column('id', sa.Integer),
+                     *[sa.column(name) for name in source_columns + target_columns])
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(table.c.id, *[table.c[name] for name in source_columns])
+            .where(table.c.id > last_id).order_by(table.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            values = {target: function(row._mapping[source]) for source, target, function in
+                      zip(source_columns, target_columns, convert)}
+            bind.execute(table.update().where(table.c.id == row.id).values(**values))
+        last_id = rows[-1].id
+
+
+def upgrade():
+    with op.batch_alter_table('pattern_recognition_result', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('features_blob', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('similarity_matrix_blob', sa.LargeBinary(), nullable=True))
+
+    _convert(['features', 'similarity_matrix'], ['features_blob', 'similarity_matrix_blob'],
+             [encode_features, encode_matrix])
+
+    # 转换后删除原文本列，避免表中同时保存两份数据；特征标签哈希为向量、无法解析的矩阵置空，均不可逆
+    with op.batch_alter_table('pattern_recognition_result', schema=None) as batch_op:
+        batch_op.drop_column('features')
+        batch_op.drop_column('similarity_matrix')
+
+    with op.batch_alter_table('pattern_recognition_result', schema=None) as batch_op:
+        batch_op.alter_column('features_blob', new_column_name='features')
+        batch_op.alter_column('similarity_matrix_blob', new_column_name='similarity_matrix')
+
+
+def downgrade():
+    def to_text(value):
+        return None if value is None else json.dumps(_decode(value))
+
+    # 二进制转换为JSON数值文本（原特征标签文本已在升级时丢弃，降级后为对应的特征向量）
+    with op.batch_alter_table('pattern_recognition_result', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('features_text', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('similarity_matrix_text', sa.Text(), nullable=True))
+
+    _convert(['features', 'similarity_matrix'], ['features_text', 'similarity_matrix_text'], [to_text, to_text])
+
+    with op.batch_alter_table('pattern_recognition_result', schema=None) as batch_op:
+        batch_op.drop_column('features')
+        batch_op.drop_column('similarity_matrix')
+
+    with op.batch_alter_table('pattern_recognition_result', schema=None) as batch_op:
+        batch_op.alter_column('features_text', new_column_name='features')
+        batch_op.alter_column('similarity_matrix_text', new_column_name='similarity_matrix')
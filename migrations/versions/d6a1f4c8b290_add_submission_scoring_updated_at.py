@@ -0,0 +1,27 @@
+"""Add scoring_updated_at to dance_submission
+
+Revision ID: d6a1f4c8b290
+Revises: c3f7a9e2d814
+Create Date: 2026-10-18 21:05:37.214583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6a1f4c8b290'
+down_revision = 'c3f7a9e2d814'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有的未完成任务时间为空，视为已中断，由任意进程的评分队列接管
+    with op.batch_alter_table('dance_submission', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('scoring_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('dance_submission', schema=None) as batch_op:
+        batch_op.drop_column('scoring_updated_at')
@@ -0,0 +1,26 @@
+"""Add rebuild_lease_until to dashboard_stats
+
+Revision ID: f2b7c9d4e168
+Revises: d6a1f4c8b290
+Create Date: 2026-10-18 21:40:12.693051
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b7c9d4e168'
+down_revision = 'd6a1f4c8b290'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('dashboard_stats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rebuild_lease_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('dashboard_stats', schema=None) as batch_op:
+        batch_op.drop_column('rebuild_lease_until')
@@ -31,11 +31,13 @@ if __name__ == '__main__':
     print(f"配置环境: {config_name}")
     print(f"启动服务器: Waitress")
     print(f"监听地址: {host}:{port}")
+    print(f"请求线程数: {os.environ.get('WAITRESS_THREADS', 8)}")
     print(f"本地访问: http://127.0.0.1:{port}")
     print(f"局域网访问: http://{local_ip}:{port}")
     print(f"=============================")
     print(f"按 Ctrl+C 停止服务器")
     print(f"=============================\n")
     
-    # 使用Waitress启动应用
-    serve(app, host=host, port=port, threads=4)
+    # 使用Waitress启动应用，评分在后台队列中执行，请求线程只处理页面和接口
+    threads = int(os.environ.get('WAITRESS_THREADS', 8))
+    serve(app, host=host, port=port, threads=threads)
@@ -0,0 +1,45 @@
+import pytest
+from app import create_app, db
+from app.community.analytics import analytics_recorder
+from app.community.counters import counter_buffer
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        # 写入计数器和互动事件缓冲区中的剩余数据，避免进程退出时写入已删除的表
+        counter_buffer.flush()
+        analytics_recorder.flush()
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """创建用户，返回创建函数"""
+    from app.user.models import User
+
+    def make(username):
+        user = User(username=username, email=f'{username}@example.com')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def login(client):
+    """以 Flask-Login 的会话键登录，不依赖登录表单"""
+    def log_in(user):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+    return log_in
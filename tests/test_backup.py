@@ -0,0 +1,19 @@
+"""增量备份的高水位过滤条件"""
+from app import db
+from app.culture.models import CultureElement
+from app.culture.backup import IncrementalBackupManager
+
+
+def test_delta_includes_rows_at_high_water_mark(app):
+    # 数据库 now() 写入的时间不带小数秒
+    db.session.add_all([
+        CultureElement(name='茶', description='茶文化', updated_at=db.text("'2026-01-01 10:00:00'")),
+        CultureElement(name='丝绸', description='丝绸文化', updated_at=db.text("'2026-01-01 09:59:59'")),
+    ])
+    db.session.commit()
+    marks = IncrementalBackupManager._high_water_marks()
+    assert marks['culture_elements']['updated_at'] == '2026-01-01T10:00:00'
+
+    criteria = IncrementalBackupManager._delta_criteria(marks)
+    names = [element.name for element in CultureElement.query.filter(criteria['culture_elements'])]
+    assert names == ['茶']
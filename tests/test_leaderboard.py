@@ -0,0 +1,32 @@
+"""排行榜分页参数和榜单页缓存"""
+from datetime import datetime, timedelta
+from app import db
+from app.community.models import DanceCompetition, Dance, DanceSubmission
+from app.community.leaderboard import DanceLeaderboard, dance_leaderboard
+
+
+def test_leaderboard_per_page_lower_bound(client, make_user):
+    now = datetime.now()
+    competition = DanceCompetition(title='比赛', description='描述', start_time=now - timedelta(days=1),
+                                   end_time=now + timedelta(days=1))
+    dance = Dance(title='舞蹈', description='描述', video_url='dance.mp4', ethnicity='藏族', competition=competition)
+    db.session.add_all([competition, dance])
+    for i in range(3):
+        db.session.add(DanceSubmission(user=make_user(f'dancer{i}'), dance=dance, video_url='submission.mp4',
+                                       status='scored', score=80 + i))
+    db.session.commit()
+    dance_leaderboard.rebuild_all()
+
+    data = client.get(f'/api/dance/leaderboard/dance/{dance.id}?per_page=-1').get_json()
+    assert data['per_page'] == 1
+    assert [entry['rank'] for entry in data['entries']] == [1]
+    assert data['entries'][0]['score'] == 82
+
+
+def test_page_cache_is_bounded():
+    leaderboard = DanceLeaderboard(cache_ttl=60, cache_size=3)
+    for page in range(10):
+        leaderboard._cache_set(('top', 'dance', 1, page, 20), {'page': page})
+    assert len(leaderboard._cache) == 3
+    assert leaderboard._cache_get(('top', 'dance', 1, 9, 20)) == {'page': 9}
+    assert leaderboard._cache_get(('top', 'dance', 1, 0, 20)) is None
@@ -0,0 +1,46 @@
+"""游标分页：同一秒内创建的记录逐页取出，不重复、不遗漏"""
+from datetime import datetime
+from app import db
+from app.community.models import Post
+
+
+def fetch_all_pages(client, url, per_page=2, max_pages=50):
+    ids, cursor = [], None
+    for _ in range(max_pages):
+        query = f'{url}?per_page={per_page}' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(query).get_json()
+        ids.extend(item['id'] for item in data['items'])
+        cursor = data['next_cursor']
+        if not data['has_next']:
+            return ids
+    raise AssertionError(f'分页超过 {max_pages} 页仍未结束: {ids}')
+
+
+def test_posts_created_in_same_second(client, make_user):
+    author = make_user('author')
+    # 数据库 now() 写入的时间（SQLite 中不带小数秒）与应用写入的带微秒时间混合
+    same_second = [Post(title=f'帖子{i}', content='内容', author=author,
+                        created_at=db.text("'2026-01-01 10:00:00'")) for i in range(5)]
+    later = Post(title='稍后', content='内容', author=author, created_at=datetime(2026, 1, 1, 10, 0, 0, 500000))
+    earlier = Post(title='更早', content='内容', author=author, created_at=datetime(2026, 1, 1, 9, 59, 59))
+    db.session.add_all(same_second + [later, earlier])
+    db.session.commit()
+
+    ids = fetch_all_pages(client, '/api/community/posts')
+    expected = [later.id] + sorted((post.id for post in same_second), reverse=True) + [earlier.id]
+    assert ids == expected
+
+
+def test_posts_without_created_at_come_last(client, make_user):
+    author = make_user('author')
+    dated = [Post(title=f'帖子{i}', content='内容', author=author) for i in range(3)]
+    undated = [Post(title=f'无时间{i}', content='内容', author=author) for i in range(3)]
+    db.session.add_all(dated + undated)
+    db.session.commit()
+    for post in undated:
+        post.created_at = None
+    db.session.commit()
+
+    ids = fetch_all_pages(client, '/api/community/posts')
+    assert ids[:3] == sorted((post.id for post in dated), reverse=True)
+    assert ids[3:] == sorted((post.id for post in undated), reverse=True)
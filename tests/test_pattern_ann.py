@@ -0,0 +1,44 @@
+"""批量导入后图案近似索引的过期标记"""
+import time
+import pytest
+from app import db
+from app.culture.models import CulturePattern
+from app.culture.data_import import CultureDataImporter, iter_data_records
+from app.culture.pattern_ann import pattern_ann_index
+
+
+@pytest.fixture
+def ann_index(app, tmp_path, monkeypatch):
+    """在临时目录中构建索引，后台重建改为记录调用"""
+    builds = []
+    monkeypatch.setattr(pattern_ann_index, 'index_dir', str(tmp_path))
+    monkeypatch.setattr(pattern_ann_index, 'start_build', lambda: builds.append(True))
+    for i in range(30):
+        db.session.add(CulturePattern(name=f'图案{i}', category='几何纹', pattern_features=f'回纹,{i}'))
+    db.session.commit()
+    pattern_ann_index.build()
+    pattern_ann_index.builds = builds
+    yield pattern_ann_index
+    del pattern_ann_index.builds
+    pattern_ann_index._reset()
+    pattern_ann_index._version = None
+    pattern_ann_index._checked_at = float('-inf')
+    pattern_ann_index._stale = False
+
+
+def test_import_marks_index_stale_until_rebuilt(ann_index):
+    assert ann_index.ensure_ready()
+
+    result = CultureDataImporter().run(iter_data_records(
+        {'culture_patterns': [{'name': '新图案', 'category': '植物纹', 'pattern_features': '莲花'}]}))
+    assert result['success']
+    assert ann_index.builds
+    assert not ann_index.ensure_ready()
+
+    # 导入之后开始的重建包含新图案，完成后清除过期标记（构建以读取数据库前1秒为界）
+    time.sleep(1.1)
+    ann_index._checked_at = float('-inf')
+    ann_index.build()
+    assert ann_index.ensure_ready()
+    new_id = CulturePattern.query.filter_by(name='新图案').one().id
+    assert new_id in ann_index.ids
@@ -0,0 +1,49 @@
+"""批量纹样识别的上传图像引用"""
+import io
+import pytest
+from werkzeug.datastructures import FileStorage
+from app import db
+from app.culture.models import CulturePattern, PatternRecognitionResult
+from app.culture.pattern_recognition import PatternRecognitionManager
+from app.storage.blobstore import blob_store
+from app.storage.models import Blob, BlobRef
+
+
+@pytest.fixture
+def manager(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, 'root', str(tmp_path / 'blobs'))
+    monkeypatch.setattr(blob_store, 'locations', {'static': str(tmp_path / 'static')})
+    db.session.add(CulturePattern(name='回纹', category='几何纹', pattern_features='回纹,几何'))
+    db.session.commit()
+    return PatternRecognitionManager()
+
+
+def _upload(content=b'image-bytes', filename='pattern.png'):
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+def test_client_supplied_blob_is_ignored(manager):
+    result = manager.recognize_patterns_batch([{
+        'input_image': 'uploads/culture/forged.png', 'features': '回纹',
+        'blob': [['0' * 64], 1, 'static:forged.png']
+    }])
+    assert result['summary']['committed'] and result['summary']['recognized'] == 1
+    assert Blob.query.count() == 0 and BlobRef.query.count() == 0
+
+
+def test_uploaded_image_is_referenced(manager):
+    result = manager.recognize_patterns_batch([{'file': _upload(), 'features': '回纹'}])
+    assert result['summary']['committed']
+    assert BlobRef.query.one().refcount == 1
+    assert 'warning' not in result['results'][0]
+
+
+def test_link_failure_keeps_committed_results(manager, monkeypatch):
+    def fail(sha256, key):
+        raise OSError('磁盘已满')
+    monkeypatch.setattr(blob_store, 'link', fail)
+
+    result = manager.recognize_patterns_batch([{'file': _upload(), 'features': '回纹'}])
+    assert result['summary']['committed'] and result['summary']['link_errors'] == 1
+    assert result['results'][0]['success'] and '磁盘已满' in result['results'][0]['warning']
+    assert PatternRecognitionResult.query.count() == 1
@@ -0,0 +1,80 @@
+"""各页面的SQL查询数不随数据行数增长（无N+1查询）"""
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.community.models import (Post, Comment, Story, Tag, Task, UserTask, DanceCompetition, Dance,
+                                  DanceSubmission)
+from app.community.leaderboard import dance_leaderboard
+from app.community.queries import assert_max_queries
+
+
+@pytest.fixture
+def community(app, make_user):
+    """多个作者的帖子（带评论和标签）、故事和任务"""
+    users = [make_user(f'user{i}') for i in range(8)]
+    tags = [Tag(name=f'tag{i}') for i in range(3)]
+    for i, user in enumerate(users):
+        post = Post(title=f'帖子{i}', content='内容', author=user, category='交流', tags=tags[:i % 3 + 1])
+        db.session.add(post)
+        db.session.add_all([Comment(content='评论', user_id=users[j].id, post=post) for j in range(3)])
+        story = Story(title=f'故事{i}', content='内容', author=user, ethnicity='汉族', school='学校')
+        db.session.add(story)
+        db.session.add_all([Comment(content='评论', user_id=users[j].id, story=story) for j in range(3)])
+        task = Task(title=f'任务{i}', description='描述', icon='mdi:music', color='#F39C12', creator=user)
+        db.session.add(task)
+        db.session.add_all([UserTask(user=participant, task=task, is_completed=j % 2 == 0)
+                            for j, participant in enumerate(users[:4])])
+    db.session.commit()
+    return users
+
+
+@pytest.fixture
+def competition(app, make_user):
+    """一个比赛，多支舞蹈，每支舞蹈有不同用户的已评分作品"""
+    users = [make_user(f'dancer{i}') for i in range(6)]
+    now = datetime.now()
+    competition = DanceCompetition(title='比赛', description='描述', start_time=now - timedelta(days=1),
+                                   end_time=now + timedelta(days=1))
+    db.session.add(competition)
+    for i in range(4):
+        dance = Dance(title=f'舞蹈{i}', description='描述', video_url='dance.mp4', ethnicity='藏族',
+                      competition=competition)
+        db.session.add(dance)
+        for j, user in enumerate(users):
+            db.session.add(DanceSubmission(user=user, dance=dance, video_url='submission.mp4', status='scored',
+                                           score=60 + i + j))
+    db.session.commit()
+    dance_leaderboard.rebuild_all()
+    return competition
+
+
+def test_community_index(client, community):
+    with assert_max_queries(5):
+        assert client.get('/community/').status_code == 200
+
+
+def test_tasks_page(client, community):
+    with assert_max_queries(2):
+        assert client.get('/community/tasks').status_code == 200
+
+
+def test_post_detail(client, community):
+    post = Post.query.first()
+    with assert_max_queries(4):
+        assert client.get(f'/community/post/{post.id}').status_code == 200
+
+
+def test_stories_page(client, community):
+    with assert_max_queries(1):
+        assert client.get('/community/stories').status_code == 200
+
+
+def test_story_detail(client, community):
+    story = Story.query.first()
+    with assert_max_queries(2):
+        assert client.get(f'/community/story/{story.id}').status_code == 200
+
+
+def test_dance_ranking(client, competition):
+    with assert_max_queries(4):
+        assert client.get(f'/community/dance-competition/{competition.id}/ranking').status_code == 200
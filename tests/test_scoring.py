@@ -0,0 +1,55 @@
+"""多进程共享数据库时评分任务的认领"""
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.community.models import DanceCompetition, Dance, DanceSubmission
+from app.community.scoring import ScoringQueue, QUEUED, SCORING
+
+
+@pytest.fixture
+def submission(app, make_user):
+    now = datetime.now()
+    competition = DanceCompetition(title='比赛', description='描述', start_time=now - timedelta(days=1),
+                                   end_time=now + timedelta(days=1))
+    dance = Dance(title='舞蹈', description='描述', video_url='dance.mp4', ethnicity='藏族', competition=competition)
+    submission = DanceSubmission(user=make_user('dancer'), dance=dance, video_url='submission.mp4', status='pending')
+    db.session.add_all([competition, dance, submission])
+    db.session.commit()
+    return submission
+
+
+def _set_state(submission, status, updated_at):
+    submission.status = status
+    submission.scoring_updated_at = updated_at
+    db.session.commit()
+
+
+def test_only_one_process_claims_a_submission(submission):
+    first, second = ScoringQueue(), ScoringQueue()
+    _set_state(submission, QUEUED, datetime.now())
+    assert first._claim(submission.id)
+    assert not second._claim(submission.id)
+
+
+def test_recover_skips_submissions_in_progress(submission):
+    _set_state(submission, SCORING, datetime.now())
+    assert ScoringQueue()._claim_stalled() == []
+
+
+def test_recover_claims_stalled_submission_once(submission):
+    first, second = ScoringQueue(), ScoringQueue()
+    _set_state(submission, SCORING, datetime.now() - timedelta(seconds=first.stall_timeout + 1))
+    assert first._claim_stalled() == [submission.id]
+    assert second._claim_stalled() == []
+    db.session.refresh(submission)
+    assert submission.status == QUEUED
+    # 恢复后由接管的进程评分，其他进程不会重复认领
+    assert first._claim(submission.id)
+    assert not second._claim(submission.id)
+
+
+def test_mark_submission_keeps_submission_scored_elsewhere(submission):
+    _set_state(submission, SCORING, datetime.now())
+    ScoringQueue()._mark_submission(submission.id, QUEUED)
+    db.session.refresh(submission)
+    assert submission.status == SCORING